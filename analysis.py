@@ -0,0 +1,215 @@
+import numpy as np
+
+from cache import analysis_cache
+from models import db, Toxin, Study, LongFormatRow
+from units import PARSE_EXACT, PARSE_PERCENT, PARSE_RATIO
+
+# Default number of log-spaced dose bins (plus one for zero-dose controls)
+DOSE_BINS = 10
+
+# Continuity correction applied before the logit transform, in animals
+LOGIT_CORRECTION = 0.5
+
+# Outcome types whose whole-number values and percentages count affected
+# animals; elsewhere (organ weights, custom measurements) they are
+# measurements in their own unit and only explicit ratios are incidences
+INCIDENCE_OUTCOME_TYPES = {'cancer', 'mortality'}
+
+
+def dose_response(toxin_id, species=None, sex=None, route=None, outcome_type=None, bins=DOSE_BINS):
+    """
+    Cross-study dose-response summary for one toxin, cached until any study
+    of the toxin is written to.
+
+    Every matching outcome is pulled from the long-format fact table with
+    one columnar query and analysed with NumPy: pooled incidence and
+    group-size-weighted mean responses (per outcome type and parse status,
+    so unlike measurements are never averaged together) per dose_ppm bin,
+    and a logistic fit
+    of incidence on log10(dose) for each study and for all studies pooled.
+    """
+    filters = (species and species.lower(), sex, route, outcome_type, bins)
+    key = f'dose_response:{toxin_id}:{filters}:{_toxin_fingerprint(toxin_id)}'
+    return analysis_cache().get_or_compute(key, lambda: _dose_response(toxin_id, *filters))
+
+
+def _toxin_fingerprint(toxin_id):
+    # Study.version is bumped by every write to a study's tree and new studies
+    # add to the count, so this changes whenever the toxin's data does
+    count, versions = (
+        db.session.query(db.func.count(Study.id), db.func.coalesce(db.func.sum(Study.version), 0))
+        .filter(Study.toxin_id == toxin_id)
+        .one()
+    )
+    return f'{count}-{versions}'
+
+
+def _dose_response(toxin_id, species, sex, route, outcome_type, bins):
+    toxin = db.session.get(Toxin, toxin_id)
+    if toxin is None:
+        return None
+
+    query = (
+        db.session.query(LongFormatRow.study_id, LongFormatRow.dose_ppm, LongFormatRow.group_size,
+                         LongFormatRow.value_numeric, LongFormatRow.value_parse_status,
+                         LongFormatRow.outcome_type)
+        .filter(LongFormatRow.toxin_id == toxin_id)
+    )
+    if species:
+        query = query.filter(LongFormatRow.species_key == species)
+    if sex:
+        query = query.filter(LongFormatRow.sex == sex)
+    if route:
+        query = query.filter(LongFormatRow.route_of_exposure == route)
+    if outcome_type:
+        query = query.filter(LongFormatRow.outcome_type == outcome_type)
+
+    rows = query.all()
+    columns = list(zip(*rows)) or [()] * 6
+    study_ids = np.array(columns[0], dtype=np.int64)
+    dose = np.array(columns[1], dtype=float)
+    group_size = np.array(columns[2], dtype=float)
+    value = np.array(columns[3], dtype=float)
+    status = np.array(columns[4], dtype=object)
+    kind = np.array(columns[5], dtype=object)
+
+    usable = ~np.isnan(dose) & (group_size > 0)
+    incidence = _incidence(value, status, kind, group_size)
+    # (outcome type, parse status) pairs; the weighted means are kept apart per pair
+    measures = {}
+    measure = np.array([measures.setdefault(pair, len(measures)) for pair in zip(columns[5], columns[4])],
+                       dtype=np.int64)
+
+    result = {
+        'toxin': {'id': toxin.id, 'name': toxin.name},
+        'filters': {'species': species, 'sex': sex, 'route': route, 'outcome_type': outcome_type},
+        'outcomes': len(rows),
+        'outcomes_without_ppm': int(np.count_nonzero(np.isnan(dose))),
+        'studies': int(np.unique(study_ids).size),
+        'bins': _binned(dose[usable], group_size[usable], value[usable], incidence[usable],
+                        measure[usable], list(measures), bins),
+    }
+    result['fits'], result['pooled_fit'] = _logistic_fits(
+        study_ids[usable], dose[usable], group_size[usable], incidence[usable]
+    )
+    return result
+
+
+def _incidence(value, status, kind, group_size):
+    """
+    Fraction of animals affected, or NaN where the value is not an incidence:
+    ratios ("12/50") and, for INCIDENCE_OUTCOME_TYPES only, percentages
+    (both already fractions) and whole-number exact values no larger than
+    the group size read as affected counts.
+    """
+    incidence = np.full(value.shape, np.nan)
+    counted = np.isin(kind, list(INCIDENCE_OUTCOME_TYPES))
+    ratio = status == PARSE_RATIO
+    percent = counted & (status == PARSE_PERCENT)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        count = (counted & (status == PARSE_EXACT) & (value >= 0) & (value <= group_size)
+                 & (value == np.round(value)))
+        incidence[ratio | percent] = value[ratio | percent]
+        incidence[count] = value[count] / group_size[count]
+    incidence[(incidence < 0) | (incidence > 1)] = np.nan
+    return incidence
+
+
+def _binned(dose, group_size, value, incidence, measure, measures, bins):
+    """
+    Bin 0 holds zero-dose controls; the rest are log10-spaced over the
+    positive doses. `measure` indexes `measures`, the (outcome type, parse
+    status) pairs; values are averaged per bin and pair.
+    """
+    positive = dose > 0
+    if positive.any():
+        edges = np.logspace(np.log10(dose[positive].min()), np.log10(dose[positive].max()), bins + 1)
+        index = np.where(positive, np.clip(np.searchsorted(edges, dose, side='right'), 1, bins), 0)
+    else:
+        edges = np.array([])
+        index = np.zeros(dose.shape, dtype=np.int64)
+
+    size = bins + 1
+    has_incidence = ~np.isnan(incidence)
+    has_value = ~np.isnan(value)
+
+    outcomes = np.bincount(index, minlength=size)
+    animals = np.bincount(index, weights=group_size, minlength=size)
+    incidence_animals = np.bincount(index[has_incidence], weights=group_size[has_incidence], minlength=size)
+    affected = np.bincount(index[has_incidence],
+                           weights=(incidence * group_size)[has_incidence], minlength=size)
+    # One cell per (bin, measure) pair, reshaped to bins × measures
+    width = len(measures) or 1  # reshape needs a non-zero width
+    cell = (index * width + measure)[has_value]
+    cells = size * width
+    value_animals = np.bincount(cell, weights=group_size[has_value], minlength=cells).reshape(size, -1)
+    value_sum = np.bincount(cell, weights=(value * group_size)[has_value], minlength=cells).reshape(size, -1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pooled = affected / incidence_animals
+        weighted_mean = value_sum / value_animals
+
+    result = []
+    for i in np.flatnonzero(outcomes):
+        result.append({
+            'dose_min': 0.0 if i == 0 else float(edges[i - 1]),
+            'dose_max': 0.0 if i == 0 else float(edges[i]),
+            'outcomes': int(outcomes[i]),
+            'animals': int(animals[i]),
+            'pooled_incidence': _number(pooled[i]),
+            'weighted_means': [
+                {'outcome_type': outcome_type, 'parse_status': parse_status,
+                 'animals': int(value_animals[i, j]), 'mean': _number(weighted_mean[i, j])}
+                for j, (outcome_type, parse_status) in enumerate(measures) if value_animals[i, j]
+            ],
+        })
+    return result
+
+
+def _logistic_fits(study_ids, dose, group_size, incidence):
+    """
+    Weighted least-squares fit of logit(incidence) = a + b·log10(dose) for
+    every study at once (grouped sums via bincount) and for the pooled data.
+    ED50 is the dose where the fitted incidence crosses 50 %.
+    """
+    keep = (dose > 0) & ~np.isnan(incidence)
+    study_ids, dose, weight, incidence = study_ids[keep], dose[keep], group_size[keep], incidence[keep]
+    if not study_ids.size:
+        return [], None
+
+    # Continuity-corrected logit, so 0 % and 100 % groups stay finite
+    p = (incidence * weight + LOGIT_CORRECTION) / (weight + 2 * LOGIT_CORRECTION)
+    x = np.log10(dose)
+    y = np.log(p / (1 - p))
+
+    studies, group = np.unique(study_ids, return_inverse=True)
+    sums = [np.bincount(group, weights=w, minlength=studies.size)
+            for w in (weight, weight * x, weight * y, weight * x * x, weight * x * y)]
+    points = np.bincount(group, minlength=studies.size)
+    slope, intercept = _solve(*sums)
+
+    fits = [
+        dict(study_id=int(studies[i]), points=int(points[i]), **_fit(slope[i], intercept[i]))
+        for i in range(studies.size)
+    ]
+    pooled_slope, pooled_intercept = _solve(*(np.array([s.sum()]) for s in sums))
+    pooled = dict(points=int(study_ids.size), **_fit(pooled_slope[0], pooled_intercept[0]))
+    return fits, pooled
+
+
+def _solve(s, sx, sy, sxx, sxy):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        denominator = s * sxx - sx * sx
+        slope = np.where(np.abs(denominator) > 1e-12, (s * sxy - sx * sy) / denominator, np.nan)
+        intercept = (sy - slope * sx) / s
+    return slope, intercept
+
+
+def _fit(slope, intercept):
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        ed50 = 10 ** (-intercept / slope) if slope else np.nan
+    return {'slope': _number(slope), 'intercept': _number(intercept), 'ed50_ppm': _number(ed50)}
+
+
+def _number(x):
+    return None if x is None or not np.isfinite(x) else float(x)
@@ -0,0 +1,170 @@
+from datetime import date, datetime
+
+from models import db, Toxin, Study, AnimalModel, DoseGroup, Outcome, AdditionalMetadata
+from exports import toxin_condition
+from queries import metadata_filter
+
+# Columns serialized for each level; contributor_email is never exposed.
+STUDY_COLUMNS = [
+    ('id', Study.id),
+    ('name', Study.name),
+    ('toxin_id', Toxin.id),
+    ('toxin_name', Toxin.name),
+    ('description', Study.description),
+    ('date_conducted', Study.date_conducted),
+    ('author', Study.author),
+    ('contributor_name', Study.contributor_name),
+    ('publication_reference', Study.publication_reference),
+    ('created_at', Study.created_at),
+    ('updated_at', Study.updated_at),
+    ('version', Study.version),
+]
+ANIMAL_MODEL_COLUMNS = [
+    ('id', AnimalModel.id),
+    ('study_id', AnimalModel.study_id),
+    ('species', AnimalModel.species),
+    ('strain', AnimalModel.strain),
+    ('sex', AnimalModel.sex),
+    ('age', AnimalModel.age),
+    ('weight', AnimalModel.weight),
+    ('description', AnimalModel.description),
+]
+DOSE_GROUP_COLUMNS = [
+    ('id', DoseGroup.id),
+    ('animal_model_id', DoseGroup.animal_model_id),
+    ('dose_value', DoseGroup.dose_value),
+    ('dose_unit', DoseGroup.dose_unit),
+    ('custom_dose_unit', DoseGroup.custom_dose_unit),
+    ('dose_ppm', DoseGroup.dose_ppm),
+    ('group_size', DoseGroup.group_size),
+    ('exposure_duration', DoseGroup.exposure_duration),
+    ('route_of_exposure', DoseGroup.route_of_exposure),
+]
+OUTCOME_COLUMNS = [
+    ('id', Outcome.id),
+    ('dose_group_id', Outcome.dose_group_id),
+    ('outcome_type', Outcome.outcome_type),
+    ('custom_outcome_type', Outcome.custom_outcome_type),
+    ('value', Outcome.value),
+    ('value_numeric', Outcome.value_numeric),
+    ('value_parse_status', Outcome.value_parse_status),
+    ('observation_time', Outcome.observation_time),
+    ('notes', Outcome.notes),
+]
+
+
+def study_ids_page(limit, after_id=0, toxin=None, species=None):
+    """
+    Ids of one page of studies in id order (keyset on id), optionally
+    restricted to a toxin name (matched as in the exports) and/or an
+    animal species.
+    Returns (ids, next_after_id or None).
+    """
+    query = db.session.query(Study.id).filter(Study.id > after_id)
+    if toxin:
+        query = query.filter(toxin_condition(toxin, Study.toxin_id))
+    if species:
+        query = query.filter(Study.id.in_(
+            db.session.query(AnimalModel.study_id)
+            .filter(db.func.lower(AnimalModel.species) == species.lower())
+        ))
+
+    ids = [row[0] for row in query.order_by(Study.id).limit(limit + 1)]
+    if len(ids) > limit:
+        return ids[:limit], ids[limit - 1]
+    return ids, None
+
+
+def study_trees(study_ids):
+    """
+    Nested Study → AnimalModel → DoseGroup → Outcome dicts (with metadata)
+    for any number of studies, in the order of `study_ids`.
+
+    Exactly five queries regardless of how many studies or rows are
+    involved. Rows are fetched as plain tuples and turned into dicts
+    directly, so no ORM objects or attribute instrumentation are involved.
+    """
+    study_ids = list(study_ids)
+    if not study_ids:
+        return []
+
+    studies = _fetch(
+        STUDY_COLUMNS,
+        db.session.query(*_columns(STUDY_COLUMNS))
+        .join(Toxin, Study.toxin_id == Toxin.id)
+        .filter(Study.id.in_(study_ids))
+    )
+    animal_models = _fetch(
+        ANIMAL_MODEL_COLUMNS,
+        db.session.query(*_columns(ANIMAL_MODEL_COLUMNS))
+        .filter(AnimalModel.study_id.in_(study_ids))
+        .order_by(AnimalModel.id)
+    )
+    dose_groups = _fetch(
+        DOSE_GROUP_COLUMNS,
+        db.session.query(*_columns(DOSE_GROUP_COLUMNS))
+        .join(AnimalModel, DoseGroup.animal_model_id == AnimalModel.id)
+        .filter(AnimalModel.study_id.in_(study_ids))
+        .order_by(DoseGroup.id)
+    )
+    outcomes = _fetch(
+        OUTCOME_COLUMNS,
+        db.session.query(*_columns(OUTCOME_COLUMNS))
+        .join(DoseGroup, Outcome.dose_group_id == DoseGroup.id)
+        .join(AnimalModel, DoseGroup.animal_model_id == AnimalModel.id)
+        .filter(AnimalModel.study_id.in_(study_ids))
+        .order_by(Outcome.id)
+    )
+    metadata = (
+        db.session.query(AdditionalMetadata.entity_type, AdditionalMetadata.entity_id,
+                         AdditionalMetadata.field_name, AdditionalMetadata.field_value)
+        .filter(metadata_filter(study_ids))
+        .order_by(AdditionalMetadata.id)
+    )
+
+    # Index every node by (entity_type, id), then attach metadata and children
+    nodes = {}
+    for entity_type, rows, children in (('study', studies, 'animal_models'),
+                                        ('animal_model', animal_models, 'dose_groups'),
+                                        ('dose_group', dose_groups, 'outcomes'),
+                                        ('outcome', outcomes, None)):
+        for row in rows:
+            row['metadata'] = {}
+            if children:
+                row[children] = []
+            nodes[(entity_type, row['id'])] = row
+
+    for entity_type, entity_id, field_name, field_value in metadata:
+        node = nodes.get((entity_type, entity_id))
+        if node is not None:
+            node['metadata'][field_name] = field_value
+
+    for row in animal_models:
+        nodes[('study', row.pop('study_id'))]['animal_models'].append(row)
+    for row in dose_groups:
+        nodes[('animal_model', row.pop('animal_model_id'))]['dose_groups'].append(row)
+    for row in outcomes:
+        nodes[('dose_group', row.pop('dose_group_id'))]['outcomes'].append(row)
+
+    for row in studies:
+        row['toxin'] = {'id': row.pop('toxin_id'), 'name': row.pop('toxin_name')}
+
+    return [nodes[('study', i)] for i in study_ids if ('study', i) in nodes]
+
+
+def _columns(spec):
+    return [column for _, column in spec]
+
+
+def _fetch(spec, query):
+    names = [name for name, _ in spec]
+    dated = [i for i, (_, column) in enumerate(spec)
+             if column.type.python_type in (date, datetime)]
+    rows = []
+    for row in query:
+        row = list(row)
+        for i in dated:
+            if row[i] is not None:
+                row[i] = row[i].isoformat()
+        rows.append(dict(zip(names, row)))
+    return rows
@@ -1,26 +1,36 @@
 import os
-import csv
-from io import StringIO
-from flask import Flask, render_template, request, redirect, url_for, flash, Response
-from models import db, Toxin, Study, AnimalModel, DoseGroup, Outcome, AdditionalMetadata
-from datetime import datetime
-
-# Constants for controlled vocabularies
-SEX_CHOICES = [('male', 'Male'), ('female', 'Female'), ('mixed', 'Mixed')]
-DOSE_UNIT_CHOICES = [('mg/m3', 'mg/m3'), ('ppm', 'ppm'), ('ppb', 'ppb'), ('other', 'Other')]
-OUTCOME_TYPE_CHOICES = [
-    ('cancer', 'Cancer Incidence'),
-    ('organ_weight', 'Organ Weight Change'),
-    ('mortality', 'Mortality'),
-    ('other', 'Other')
-]
-ROUTE_CHOICES = [
-    ('oral',        'Oral'),
-    ('inhalation',  'Inhalation'),
-    ('dermal',      'Dermal'),
-    ('intraperitoneal', 'Intraperitoneal'),
-    ('other',       'Other / Mixed')
-]
+import io
+import json
+import click
+from flask import (Flask, render_template, request, redirect, url_for, flash, Response,
+                   abort, stream_with_context, make_response, jsonify, session, send_file)
+from markupsafe import Markup
+from models import db, Toxin, Study, AnimalModel, DoseGroup, Outcome, AdditionalMetadata, LongFormatRow, Job
+from queries import load_study_tree, load_metadata, recent_studies, study_id_for, study_fingerprint
+from exports import (EXPORT_HEADER, STUDY_ORDER, long_format_query, parse_export_filters, stream_csv,
+                     study_rows, wide_format)
+from search import rebuild_search_index, search_studies
+from changes import study_changed
+from facts import rebuild_long_format
+from cache import RenderCache, init_analysis_cache, init_render_cache, render_cache
+from api import study_ids_page, study_trees
+from toxins import find_toxin, init_toxin_index, toxin_index
+from database import configure_database, init_database
+from facets import FACETS, facet_counts, outcome_count, outcome_query, parse_outcome_filters
+from jobs import JOB_KINDS, JobError, expire_stale_job, init_jobs, job_result_path, job_runner, prune_jobs
+from instrumentation import init_instrumentation, request_metrics
+from startup import init_template_cache, preload_app, preload_templates
+from units import dose_to_ppm, parse_outcome_value, backfill_normalized_values, set_molecular_weight
+from submission import submit_study_tree, SubmissionError
+from changelog import changes_since, compact_changes
+from duplicates import DuplicateStudyError, duplicate_clusters, find_duplicate, rehash_studies
+from vocabulary import (SEX_CHOICES, DOSE_UNIT_CHOICES, OUTCOME_TYPE_CHOICES, ROUTE_CHOICES,
+                        WORK_EMAIL_RE)
+from datetime import date, datetime, timedelta, timezone
+
+# Modules only some requests or CLI commands need (NumPy analysis and
+# snapshots, the CSV importer, synthetic data, Alembic) are imported where
+# they are used, so web workers start without loading them.
 
 
 def create_app():
@@ -28,15 +38,62 @@ def create_app():
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev_key')
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///toxdb.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
+    app.config['STUDIES_PER_PAGE'] = int(os.environ.get('STUDIES_PER_PAGE', 25))
+    app.config['SEARCH_RESULTS_PER_PAGE'] = int(os.environ.get('SEARCH_RESULTS_PER_PAGE', 20))
+    app.config['OUTCOMES_PER_PAGE'] = int(os.environ.get('OUTCOMES_PER_PAGE', 50))
+    app.config['RENDER_CACHE_BACKEND'] = os.environ.get('RENDER_CACHE_BACKEND', 'lru')  # lru | filesystem | none | module:backend
+    app.config['RENDER_CACHE_SIZE'] = int(os.environ.get('RENDER_CACHE_SIZE', 256))
+    app.config['RENDER_CACHE_DIR'] = os.environ.get('RENDER_CACHE_DIR')
+    app.config['API_PAGE_SIZE'] = int(os.environ.get('API_PAGE_SIZE', 50))
+    app.config['API_MAX_PAGE_SIZE'] = int(os.environ.get('API_MAX_PAGE_SIZE', 200))
+    app.config['CHANGES_PAGE_SIZE'] = int(os.environ.get('CHANGES_PAGE_SIZE', 1000))
+    app.config['CHANGES_MAX_PAGE_SIZE'] = int(os.environ.get('CHANGES_MAX_PAGE_SIZE', 10000))
+    app.config['ANALYSIS_CACHE_SIZE'] = int(os.environ.get('ANALYSIS_CACHE_SIZE', 64))
+    app.config['INSTRUMENTATION'] = os.environ.get('INSTRUMENTATION', '0') == '1'
+    app.config['SLOW_REQUEST_MS'] = float(os.environ.get('SLOW_REQUEST_MS', 500))
+    app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 100))
+    app.config['DB_PROFILE'] = os.environ.get('DB_PROFILE', 'tuned')  # tuned | default
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    app.config['SQLITE_CACHE_SIZE_MB'] = int(os.environ.get('SQLITE_CACHE_SIZE_MB', 64))
+    app.config['SQLITE_MMAP_SIZE_MB'] = int(os.environ.get('SQLITE_MMAP_SIZE_MB', 256))
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 5))
+    app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    app.config['DB_POOL_TIMEOUT'] = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    app.config['DB_STATEMENT_TIMEOUT_MS'] = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+    app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+    app.config['JOB_RESULTS_DIR'] = os.environ.get('JOB_RESULTS_DIR')
+    app.config['JOB_STALE_SECONDS'] = int(os.environ.get('JOB_STALE_SECONDS', 3600))
+    app.config['AUTO_MIGRATE'] = os.environ.get('AUTO_MIGRATE', '1') == '1'
+    app.config['TEMPLATE_CACHE_DIR'] = os.environ.get('TEMPLATE_CACHE_DIR')
+    app.config['PRELOAD_APP'] = os.environ.get('PRELOAD_APP', '0') == '1'
+
+    configure_database(app)
     db.init_app(app)
-
-    with app.app_context():
-        db.create_all()
+    # Flask-Migrate loads Alembic; needed to migrate at start-up and by the
+    # flask CLI (`flask db ...`), not by a worker that only serves requests
+    if app.config['AUTO_MIGRATE'] or click.get_current_context(silent=True) is not None:
+        from schema import migrate
+        migrate.init_app(app, db)
+    init_render_cache(app)
+    init_analysis_cache(app)
+    init_toxin_index(app)
+    init_jobs(app)
+    init_database(app)
+    init_template_cache(app)
+
+    # Production workers skip this: migrations run once per deploy with
+    # `flask db upgrade`, not in every worker on every boot
+    if app.config['AUTO_MIGRATE']:
+        from schema import upgrade_database
+        with app.app_context():
+            upgrade_database()
+
+    init_instrumentation(app)
 
     @app.route('/')
     def home():
-        studies = Study.query.order_by(Study.created_at.desc()).limit(5).all()
+        studies, _ = recent_studies(5)
         return render_template('home.html', studies=studies)
 
     @app.route('/about')
@@ -54,7 +111,7 @@ def create_app():
         if request.method == 'POST':
             # ── 1. Read form fields ───────────────────────────────────────────
             name = request.form['name']
-            toxin_name = request.form['toxin_name']
+            toxin_name = request.form['toxin_name'].strip()
             description = request.form.get('description', '')
             date_conducted_str = request.form.get('date_conducted', '')
             author = request.form.get('author', '')
@@ -62,14 +119,9 @@ def create_app():
             contributor_email = request.form.get('contributor_email', '')
 
             # ── 2. Validate e-mail (disallow gmail, yahoo, etc.) ──────────────
-            import re
-            WORK_EMAIL_RE = re.compile(
-                r'^[\w\.\-]+@(?!(gmail|yahoo|outlook|hotmail|protonmail)\.)[\w\.\-]+\.[a-z]{2,}$',
-                re.I
-            )
             if not WORK_EMAIL_RE.match(contributor_email):
                 flash('Please use your university or work e-mail address.', 'danger')
-                return render_template('new_study.html', toxins=Toxin.query.all())
+                return render_template('new_study.html')
 
             # ── 3. Parse optional date field ─────────────────────────────────
             date_conducted = None
@@ -78,14 +130,26 @@ def create_app():
                     date_conducted = datetime.strptime(date_conducted_str, '%Y-%m-%d').date()
                 except ValueError:
                     flash('Invalid date format. Please use YYYY-MM-DD.', 'danger')
-                    return render_template('new_study.html', toxins=Toxin.query.all())
+                    return render_template('new_study.html')
+
+            molecular_weight = None
+            if request.form.get('molecular_weight', ''):
+                try:
+                    molecular_weight = float(request.form['molecular_weight'])
+                    if molecular_weight <= 0:
+                        raise ValueError
+                except ValueError:
+                    flash('Molecular weight must be a positive number (g/mol).', 'danger')
+                    return render_template('new_study.html')
 
             # ── 4. Ensure the toxin exists (or create it) ────────────────────
-            toxin = Toxin.query.filter_by(name=toxin_name).first()
+            toxin = find_toxin(toxin_name)
             if not toxin:
-                toxin = Toxin(name=toxin_name, description='')
+                toxin = Toxin(name=toxin_name, description='', molecular_weight=molecular_weight)
                 db.session.add(toxin)
-                db.session.commit()
+                db.session.flush()
+            elif molecular_weight and not toxin.molecular_weight:
+                set_molecular_weight(toxin, molecular_weight)
 
             # ── 5. Create the Study record ───────────────────────────────────
             study = Study(
@@ -99,7 +163,7 @@ def create_app():
                 publication_reference=request.form.get('publication_reference', '')
             )
             db.session.add(study)
-            db.session.commit()
+            db.session.flush()  # id for the metadata rows; committed below
 
             # ── 6. Optional extra metadata pairs ─────────────────────────────
             field_names = request.form.getlist('additional_field_name[]')
@@ -114,14 +178,26 @@ def create_app():
                             field_value=field_values[i].strip()
                         )
                     )
+            study_changed(study.id)
             db.session.commit()
 
             flash('Study created successfully!', 'success')
             return redirect(url_for('new_animal_model', study_id=study.id))
 
         # ── GET request – just show the blank form ───────────────────────────
-        toxins = Toxin.query.all()
-        return render_template('new_study.html', toxins=toxins)
+        return render_template('new_study.html')
+
+    @app.route('/study/new/batch')
+    def new_study_batch():
+        """
+        Single-page entry of a whole study. The tree is staged in the browser
+        (and kept in localStorage) and sent to POST /api/studies in one go.
+        """
+        return render_template('new_study_batch.html',
+                               sex_choices=SEX_CHOICES,
+                               dose_unit_choices=DOSE_UNIT_CHOICES,
+                               route_choices=ROUTE_CHOICES,
+                               outcome_type_choices=OUTCOME_TYPE_CHOICES)
 
     @app.route('/study/<int:study_id>/animal/new', methods=['GET', 'POST'])
     def new_animal_model(study_id):
@@ -145,7 +221,7 @@ def create_app():
                 description=description
             )
             db.session.add(animal_model)
-            db.session.commit()
+            db.session.flush()  # id for the metadata rows; committed below
 
             # Process additional fields
             field_names = request.form.getlist('additional_field_name[]')
@@ -161,6 +237,7 @@ def create_app():
                     )
                     db.session.add(metadata)
 
+            study_changed(study.id)
             db.session.commit()
 
             flash('Animal model created successfully!', 'success')
@@ -213,10 +290,12 @@ def create_app():
                 custom_dose_unit=custom_dose_unit,
                 group_size=group_size,
                 exposure_duration=exposure_duration,
-                route_of_exposure=route_of_exposure  # <── add this line
+                route_of_exposure=route_of_exposure,  # <── add this line
+                dose_ppm=dose_to_ppm(dose_value, dose_unit, custom_dose_unit,
+                                     animal_model.study.toxin.molecular_weight)
             )
             db.session.add(dose_group)
-            db.session.commit()
+            db.session.flush()  # id for the metadata rows; committed below
 
             # Process additional fields
             field_names = request.form.getlist('additional_field_name[]')
@@ -232,6 +311,7 @@ def create_app():
                     )
                     db.session.add(metadata)
 
+            study_changed(animal_model.study_id)
             db.session.commit()
 
             flash('Dose group created successfully!', 'success')
@@ -294,6 +374,7 @@ def create_app():
 
             observation_time = request.form.get('observation_time', '')
             notes = request.form.get('notes', '')
+            value_numeric, value_parse_status = parse_outcome_value(value)
 
             outcome = Outcome(
                 dose_group_id=dose_group.id,
@@ -301,10 +382,12 @@ def create_app():
                 custom_outcome_type=custom_outcome_type,
                 value=value,
                 observation_time=observation_time,
-                notes=notes
+                notes=notes,
+                value_numeric=value_numeric,
+                value_parse_status=value_parse_status
             )
             db.session.add(outcome)
-            db.session.commit()
+            db.session.flush()  # id for the metadata rows; committed below
 
             # Process additional fields
             field_names = request.form.getlist('additional_field_name[]')
@@ -320,9 +403,17 @@ def create_app():
                     )
                     db.session.add(metadata)
 
+            study_id = dose_group.animal_model.study_id
+            study_changed(study_id)
             db.session.commit()
 
             flash('Outcome added successfully!', 'success')
+            duplicate_of = find_duplicate(db.session.query(Study.content_hash).filter(Study.id == study_id).scalar(),
+                                          exclude_id=study_id)
+            if duplicate_of is not None:
+                flash(Markup('This study now has the same content as '
+                             f'<a href="{url_for("view_study", study_id=duplicate_of)}">study {duplicate_of}</a>. '
+                             'Please check that it was not entered twice.'), 'warning')
 
             # Option to add another outcome
             if 'add_another' in request.form:
@@ -341,39 +432,83 @@ def create_app():
 
     @app.route('/study/<int:study_id>')
     def view_study(study_id):
-        study = Study.query.get_or_404(study_id)
+        def render():
+            study = load_study_tree(study_id)
 
-        # Get additional metadata for the study
-        study_metadata = AdditionalMetadata.query.filter_by(entity_type='study', entity_id=study_id).all()
-
-        # Get metadata for all related entities
-        metadata = {}
-        for animal_model in study.animal_models:
-            animal_meta = AdditionalMetadata.query.filter_by(entity_type='animal_model',
-                                                             entity_id=animal_model.id).all()
-            if animal_meta:
-                metadata[f'animal_{animal_model.id}'] = animal_meta
-
-            for dose_group in animal_model.dose_groups:
-                dose_meta = AdditionalMetadata.query.filter_by(entity_type='dose_group', entity_id=dose_group.id).all()
-                if dose_meta:
-                    metadata[f'dose_{dose_group.id}'] = dose_meta
-
-                for outcome in dose_group.outcomes:
-                    outcome_meta = AdditionalMetadata.query.filter_by(entity_type='outcome', entity_id=outcome.id).all()
-                    if outcome_meta:
-                        metadata[f'outcome_{outcome.id}'] = outcome_meta
-
-        return render_template('view_study.html',
-                               study=study,
-                               study_metadata=study_metadata,
-                               metadata=metadata,
-                               outcome_type_choices=OUTCOME_TYPE_CHOICES)
+            # All metadata for the study and its descendants in one query
+            grouped = load_metadata([study_id])
+            study_metadata = grouped.get(('study', study_id), [])
+
+            metadata = {}
+            for animal_model in study.animal_models:
+                animal_meta = grouped.get(('animal_model', animal_model.id))
+                if animal_meta:
+                    metadata[f'animal_{animal_model.id}'] = animal_meta
+
+                for dose_group in animal_model.dose_groups:
+                    dose_meta = grouped.get(('dose_group', dose_group.id))
+                    if dose_meta:
+                        metadata[f'dose_{dose_group.id}'] = dose_meta
+
+                    for outcome in dose_group.outcomes:
+                        outcome_meta = grouped.get(('outcome', outcome.id))
+                        if outcome_meta:
+                            metadata[f'outcome_{outcome.id}'] = outcome_meta
+
+            return render_template('_view_study_content.html',
+                                   study=study,
+                                   study_metadata=study_metadata,
+                                   metadata=metadata,
+                                   outcome_type_choices=OUTCOME_TYPE_CHOICES)
+
+        return render_cached_page('view_study', study_id, render, 'view_study.html')
 
     @app.route('/studies')
     def list_studies():
-        studies = Study.query.order_by(Study.created_at.desc()).all()
-        return render_template('list_studies.html', studies=studies)
+        cursor = request.args.get('after')
+        studies, next_cursor = recent_studies(app.config['STUDIES_PER_PAGE'], cursor)
+        return render_template('list_studies.html',
+                               studies=studies,
+                               next_cursor=next_cursor,
+                               is_first_page=not cursor)
+
+    @app.route('/search')
+    def search():
+        query = request.args.get('q', '').strip()
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = app.config['SEARCH_RESULTS_PER_PAGE']
+
+        studies, has_more = search_studies(query, per_page, (page - 1) * per_page)
+        return render_template('search.html',
+                               query=query,
+                               studies=studies,
+                               page=page,
+                               has_more=has_more)
+
+    @app.route('/outcomes')
+    def browse_outcomes():
+        """Faceted outcome browser: filter sidebar with counts, paged outcome table."""
+        try:
+            filters = parse_outcome_filters(request.args)
+        except ValueError as e:
+            abort(400, description=str(e))
+        after = request.args.get('after', type=int)
+        per_page = app.config['OUTCOMES_PER_PAGE']
+
+        outcomes = outcome_query(filters, after).limit(per_page + 1).all()
+        has_more = len(outcomes) > per_page
+        outcomes = outcomes[:per_page]
+        # Current filters as given, for building the sidebar links
+        active = {name: request.args[name] for name in (*FACETS, 'date_from', 'date_to')
+                  if request.args.get(name)}
+        cleared = {name: {other: value for other, value in active.items() if other != name} for name in active}
+        return render_template('outcomes.html',
+                               outcomes=outcomes,
+                               facets=facet_counts(filters),
+                               total=outcome_count(filters),
+                               active=active,
+                               cleared=cleared,
+                               next_after=outcomes[-1].outcome_id if has_more else None)
 
     @app.route('/entity/<entity_type>/<int:entity_id>/metadata/add', methods=['POST'])
     def add_metadata(entity_type, entity_id):
@@ -417,103 +552,509 @@ def create_app():
             )
             db.session.add(metadata)
 
+        study_id = get_study_id(entity_type, entity)
+        study_changed(study_id)
         db.session.commit()
         flash('Additional information saved', 'success')
-        return redirect(url_for('view_study', study_id=get_study_id(entity_type, entity)))
+        return redirect(url_for('view_study', study_id=study_id))
 
     @app.route('/study/<int:study_id>/export')
     def export_study(study_id):
-        study = Study.query.get_or_404(study_id)
+        """One study as long-format CSV; ?format=wide adds a column per custom metadata field."""
+        wide = request.args.get('format') == 'wide'
+
+        def build(version):
+            header, rows = wide_format(study_rows(study_id)) if wide else (EXPORT_HEADER, study_rows(study_id))
+            suffix = '_wide' if wide else ''
+            return Response(
+                stream_with_context(stream_csv(rows, header)),
+                mimetype="text/csv",
+                headers={"Content-Disposition": f"attachment;filename=study_{study_id}_data{suffix}.csv"}
+            )
 
-        # Create a CSV in memory
-        output = StringIO()
-        writer = csv.writer(output)
-
-        # Write headers
-        writer.writerow([
-            'Study ID', 'Study Name', 'Toxin', 'Date Conducted', 'Author', 'Contributor',
-            'Animal Species', 'Strain', 'Sex', 'Age', 'Weight',
-            'Dose Value', 'Dose Unit', 'Route of Exposure',  # new column
-            'Group Size', 'Exposure Duration',
-            'Outcome Type', 'Outcome Value', 'Observation Time', 'Notes'
-        ])
-
-        # Write data in long format
-        for animal_model in study.animal_models:
-            for dose_group in animal_model.dose_groups:
-                dose_unit = dose_group.custom_dose_unit if dose_group.dose_unit == 'other' else dose_group.dose_unit
-
-                for outcome in dose_group.outcomes:
-                    outcome_type = outcome.custom_outcome_type if outcome.outcome_type == 'other' else outcome.outcome_type
-
-                    writer.writerow([
-                        study.id, study.name, study.toxin.name, study.date_conducted, study.author,
-                        study.contributor_name,
-                        animal_model.species, animal_model.strain, animal_model.sex, animal_model.age,
-                        animal_model.weight,
-                        dose_group.dose_value, dose_unit, dose_group.route_of_exposure,  # new
-                        dose_group.group_size, dose_group.exposure_duration,
-                        outcome_type, outcome.value, outcome.observation_time, outcome.notes
-                    ])
-
-        # Prepare response
-        output.seek(0)
+        return conditional_study_response('export_study_wide' if wide else 'export_study', study_id, build)
+
+    @app.route('/export')
+    def export_all():
+        """
+        Database-wide long-format CSV, streamed row batch by row batch.
+        Optional filters: toxin, species, route, date_from / date_to
+        (YYYY-MM-DD, matched against the date the study was conducted),
+        dose_min / dose_max (ppm-equivalent) and value_min / value_max
+        (parsed numeric outcome value). format=wide adds a column per custom
+        metadata field.
+        """
+        try:
+            filters = parse_export_filters(request.args)
+        except ValueError as e:
+            abort(400, description=str(e))
+
+        rows = long_format_query(**filters)
+        if request.args.get('format') == 'wide':
+            header, rows = wide_format(rows)
+            filename = 'toxbase_export_wide.csv'
+        else:
+            header, filename = EXPORT_HEADER, 'toxbase_export.csv'
         return Response(
-            output,
+            stream_with_context(stream_csv(rows, header)),
             mimetype="text/csv",
-            headers={"Content-Disposition": f"attachment;filename=study_{study_id}_data.csv"}
+            headers={"Content-Disposition": f"attachment;filename={filename}"}
         )
 
+    @app.route('/import', methods=['GET', 'POST'])
+    def import_csv():
+        """Bulk upload of a long-format CSV (same layout as the export)."""
+        if request.method == 'POST':
+            from importer import import_long_format, CSVImportError
+
+            upload = request.files.get('file')
+            if not upload or not upload.filename:
+                flash('Please choose a CSV file to upload.', 'danger')
+                return render_template('import_csv.html')
+
+            try:
+                report = import_long_format(
+                    io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline=''),
+                    contributor_email=request.form.get('contributor_email', ''),
+                    contributor_name=request.form.get('contributor_name', '')
+                )
+            except (CSVImportError, UnicodeDecodeError) as e:
+                flash(f'Import failed: {str(e)}', 'danger')
+                return render_template('import_csv.html')
+
+            flash(f'Imported {report.outcomes_created} outcomes in {report.studies_created} new studies.',
+                  'success' if not report.errors else 'warning')
+            return render_template('import_csv.html', report=report)
+
+        return render_template('import_csv.html')
+
     @app.route('/study/<int:study_id>/long-format')
     def view_study_long_format(study_id):
-        study = Study.query.get_or_404(study_id)
+        def render():
+            study = Study.query.get_or_404(study_id)
+            rows = (
+                LongFormatRow.query
+                .filter_by(study_id=study_id)
+                .order_by(*STUDY_ORDER)
+                .all()
+            )
+            return render_template('_view_study_long_content.html', study=study, rows=rows)
 
-        # Prepare data in long format
-        rows = []
-        for animal_model in study.animal_models:
-            for dose_group in animal_model.dose_groups:
-                dose_unit = dose_group.custom_dose_unit if dose_group.dose_unit == 'other' else dose_group.dose_unit
-
-                for outcome in dose_group.outcomes:
-                    outcome_type = outcome.custom_outcome_type if outcome.outcome_type == 'other' else outcome.outcome_type
-
-                    rows.append({
-                        'animal_species': animal_model.species,
-                        'animal_strain': animal_model.strain,
-                        'animal_sex': animal_model.sex,
-                        'dose_value': dose_group.dose_value,
-                        'dose_unit': dose_unit,
-                        'group_size': dose_group.group_size,
-                        'outcome_type': outcome_type,
-                        'outcome_value': outcome.value,
-                        'observation_time': outcome.observation_time
-                    })
-
-        return render_template('view_study_long.html', study=study, rows=rows)
+        return render_cached_page('view_study_long_format', study_id, render, 'view_study_long.html')
 
-    def get_study_id(entity_type, entity):
-        """Helper to get the study ID from any entity type"""
-        if entity_type == 'study':
-            return entity.id
-        elif entity_type == 'animal_model':
-            return entity.study_id
-        elif entity_type == 'dose_group':
-            return entity.animal_model.study_id
-        elif entity_type == 'outcome':
-            return entity.dose_group.animal_model.study_id
+    @app.route('/cache/stats')
+    def cache_stats():
+        return jsonify(render_cache().stats())
 
-    return app
+    @app.route('/metrics')
+    def metrics():
+        """Per-endpoint request timings of this worker (INSTRUMENTATION=1 only)."""
+        if request_metrics() is None:
+            abort(404)
+        return jsonify(request_metrics().stats())
+
+    @app.route('/api/studies')
+    def api_studies():
+        """
+        Nested study trees as JSON. Either ?ids=1,2,3 (at most API_MAX_PAGE_SIZE
+        ids) or a page of studies in id order, optionally filtered by toxin
+        and species; pass the returned next_after as ?after= for the next page.
+        """
+        max_limit = app.config['API_MAX_PAGE_SIZE']
+        ids = request.args.get('ids', '')
+        if ids:
+            try:
+                study_ids = [int(i) for i in ids.split(',') if i.strip()]
+            except ValueError:
+                return jsonify(error='ids must be a comma-separated list of integers.'), 400
+            if len(study_ids) > max_limit:
+                return jsonify(error=f'At most {max_limit} ids per request.'), 400
+            return jsonify(studies=study_trees(study_ids), next_after=None)
+
+        try:
+            limit = int(request.args.get('limit', app.config['API_PAGE_SIZE']))
+            after = int(request.args.get('after', 0))
+        except ValueError:
+            return jsonify(error='limit and after must be integers.'), 400
+        if not 1 <= limit <= max_limit:
+            return jsonify(error=f'limit must be between 1 and {max_limit}.'), 400
+
+        study_ids, next_after = study_ids_page(
+            limit, after,
+            toxin=request.args.get('toxin') or None,
+            species=request.args.get('species') or None
+        )
+        return jsonify(studies=study_trees(study_ids), next_after=next_after)
+
+    @app.route('/api/outcomes')
+    def api_outcomes():
+        """
+        Outcomes across all studies, filtered by toxin, species, sex, route,
+        dose_unit, outcome_type and date_from / date_to, in outcome id order
+        (pass next_after as ?after=), with the facet counts for the sidebar.
+        """
+        max_limit = app.config['API_MAX_PAGE_SIZE']
+        try:
+            filters = parse_outcome_filters(request.args)
+            limit = int(request.args.get('limit', app.config['API_PAGE_SIZE']))
+            after = int(request.args.get('after', 0))
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+        if not 1 <= limit <= max_limit:
+            return jsonify(error=f'limit must be between 1 and {max_limit}.'), 400
+
+        rows = outcome_query(filters, after).limit(limit + 1).all()
+        outcomes = [
+            {name: value.isoformat() if isinstance(value, date) else value
+             for name, value in row._asdict().items()}
+            for row in rows[:limit]
+        ]
+        return jsonify(
+            outcomes=outcomes,
+            next_after=rows[limit - 1].outcome_id if len(rows) > limit else None,
+            total=outcome_count(filters),
+            facets={facet: [{'value': value, 'outcomes': count} for value, count in counts]
+                    for facet, counts in facet_counts(filters).items()}
+        )
+
+    @app.route('/api/changes')
+    def api_changes():
+        """
+        Change feed for mirrors: entities inserted or updated after cursor
+        ?since= (0 for everything), oldest first. Pass next_since back as
+        ?since= until has_more is false; study_ids lists the studies to
+        refetch from /api/studies?ids=.
+        """
+        max_limit = app.config['CHANGES_MAX_PAGE_SIZE']
+        try:
+            since = int(request.args.get('since', 0))
+            limit = int(request.args.get('limit', app.config['CHANGES_PAGE_SIZE']))
+        except ValueError:
+            return jsonify(error='since and limit must be integers.'), 400
+        if not 1 <= limit <= max_limit:
+            return jsonify(error=f'limit must be between 1 and {max_limit}.'), 400
+
+        changes, has_more = changes_since(since, limit)
+        return jsonify(
+            changes=[{'cursor': change.id, 'study_id': change.study_id, 'entity_type': change.entity_type,
+                      'entity_id': change.entity_id, 'changed_at': change.changed_at.isoformat()}
+                     for change in changes],
+            study_ids=sorted({change.study_id for change in changes}),
+            next_since=changes[-1].id if changes else since,
+            has_more=has_more
+        )
+
+    @app.route('/api/studies', methods=['POST'])
+    def api_submit_study():
+        """
+        Create a whole study tree from one JSON document, in one transaction.
+        Answers 201 with the new study, 400 with every validation error, or
+        409 if an identical study exists (resubmit with allow_duplicate).
+        """
+        payload = request.get_json(silent=True)
+        if payload is None:
+            return jsonify(error='Expected a JSON body.'), 400
+        try:
+            study = submit_study_tree(payload)
+        except SubmissionError as e:
+            return jsonify(error='Validation failed.',
+                           errors=[{'path': path, 'message': message} for path, message in e.errors]), 400
+        except DuplicateStudyError as e:
+            return jsonify(error=str(e), duplicate_of=e.study_id,
+                           duplicate_url=url_for('view_study', study_id=e.study_id)), 409
+
+        response = jsonify(id=study.id, url=url_for('view_study', study_id=study.id))
+        response.status_code = 201
+        response.headers['Location'] = url_for('api_study', study_id=study.id)
+        return response
+
+    @app.route('/api/studies/<int:study_id>')
+    def api_study(study_id):
+        def build(version):
+            return jsonify(study_trees([study_id])[0])
+
+        return conditional_study_response('api_study', study_id, build)
+
+    @app.route('/api/toxins/suggest')
+    def api_toxin_suggest():
+        """Toxin names starting with ?q= (case-insensitive), for autocompletion."""
+        try:
+            limit = min(int(request.args.get('limit', 10)), 50)
+        except ValueError:
+            return jsonify(error='limit must be an integer.'), 400
+        return jsonify(toxin_index().suggest(request.args.get('q', ''), limit))
+
+    @app.route('/api/toxins/<int:toxin_id>/dose-response')
+    def api_dose_response(toxin_id):
+        """
+        Pooled dose-response summary across every study of a toxin.
+        Optional filters: species, sex, route, outcome_type; bins sets the
+        number of log-spaced dose bins.
+        """
+        from analysis import DOSE_BINS, dose_response
+
+        try:
+            bins = int(request.args.get('bins', DOSE_BINS))
+        except ValueError:
+            return jsonify(error='bins must be an integer.'), 400
+        if not 1 <= bins <= 100:
+            return jsonify(error='bins must be between 1 and 100.'), 400
+
+        result = dose_response(
+            toxin_id,
+            species=request.args.get('species') or None,
+            sex=request.args.get('sex') or None,
+            route=request.args.get('route') or None,
+            outcome_type=request.args.get('outcome_type') or None,
+            bins=bins
+        )
+        if result is None:
+            abort(404)
+        return jsonify(result)
+
+    @app.route('/api/jobs', methods=['POST'])
+    def api_submit_job():
+        """
+        Queue a background job from {"kind": ..., "params": {...}}; answers
+        202 with the job, whose status URL is also in Location.
+        """
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict):
+            return jsonify(error='Expected a JSON object.'), 400
+        try:
+            job = job_runner().submit(payload.get('kind'), payload.get('params') or {})
+        except JobError as e:
+            return jsonify(error=str(e)), 400
+
+        response = jsonify(job_json(job))
+        response.status_code = 202
+        response.headers['Location'] = url_for('api_job', job_id=job.id)
+        return response
+
+    @app.route('/api/jobs/<job_id>')
+    def api_job(job_id):
+        """Status and progress of a job; download_url is set once it is done."""
+        job = expire_stale_job(Job.query.get_or_404(job_id))
+        return jsonify(job_json(job))
+
+    @app.route('/api/jobs/<job_id>/download')
+    def download_job(job_id):
+        """Stream a finished job's gzip-compressed result file."""
+        job = Job.query.get_or_404(job_id)
+        if job.status != 'done':
+            return jsonify(error=f'Job is {job.status}, not done.'), 409
+        kind = JOB_KINDS[job.kind]
+        path = job_result_path(job)
+        if not os.path.exists(path):
+            return jsonify(error='The result file is no longer available; please submit the job again.'), 410
+        return send_file(path, mimetype='application/gzip', as_attachment=True,
+                         download_name=f'toxbase_{job.kind}_{job.id}.{kind.extension}.gz')
+
+    def job_json(job):
+        return {
+            'id': job.id,
+            'kind': job.kind,
+            'params': json.loads(job.params),
+            'status': job.status,
+            'progress': job.progress,
+            'message': job.message,
+            'created_at': job.created_at.isoformat(),
+            'started_at': job.started_at and job.started_at.isoformat(),
+            'finished_at': job.finished_at and job.finished_at.isoformat(),
+            'result_bytes': job.result_bytes,
+            'download_url': url_for('download_job', job_id=job.id) if job.status == 'done' else None,
+        }
+
+    def render_cached_page(page, study_id, render, template):
+        """
+        Serve a study page from the render cache. Only the study fragment
+        is cached; the surrounding layout (flash messages, navigation) is
+        rendered per request.
+        """
+        def build(version):
+            key = RenderCache.key(page, study_id, version)
+            content, hit = render_cache().get_or_render(key, render)
+            response = make_response(render_template(template, content=Markup(content)))
+            response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+            return response
 
-# Context processor
-@app.context_processor
-def inject_label_maps():
-    return dict(
+        return conditional_study_response(page, study_id, build)
+
+    def conditional_study_response(page, study_id, build):
+        """
+        Answer If-None-Match / If-Modified-Since from the study fingerprint
+        alone: an unchanged study gets a 304 before its tree is loaded.
+        Otherwise build(version) produces the full response.
+        """
+        version, updated_at = study_fingerprint(study_id)
+        etag = f'{page}-{study_id}-{version}'
+        last_modified = updated_at.replace(microsecond=0, tzinfo=timezone.utc) if updated_at else None
+
+        if request.if_none_match:
+            unchanged = request.if_none_match.contains(etag)
+        else:
+            unchanged = bool(last_modified and request.if_modified_since
+                             and last_modified <= request.if_modified_since)
+
+        # A pending flash message must be rendered, so never answer 304 then
+        if unchanged and '_flashes' not in session:
+            response = Response(status=304)
+        else:
+            response = build(version)
+
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.no_cache = True
+        return response
+
+    def get_study_id(entity_type, entity):
+        """Helper to get the study ID from any entity type"""
+        return study_id_for(entity_type, entity.id)
+
+    @app.cli.command('export-snapshot')
+    @click.argument('path', type=click.Path())
+    @click.option('--toxin', default=None)
+    @click.option('--species', default=None)
+    @click.option('--route', default=None)
+    @click.option('--date-from', default=None, help='YYYY-MM-DD')
+    @click.option('--date-to', default=None, help='YYYY-MM-DD')
+    def export_snapshot_command(path, **options):
+        """Write a columnar NumPy snapshot to PATH (a directory, or a .tar file)."""
+        from snapshot import export_snapshot
+
+        try:
+            filters = parse_export_filters(options)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        manifest = export_snapshot(path, filters)
+        click.echo(f"Wrote {manifest['rows']} rows in {len(manifest['columns'])} columns to {path}.")
+
+    @app.cli.command('import-csv')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--contributor-email', required=True, help='University or work e-mail recorded on new studies.')
+    @click.option('--contributor-name', default='', help='Fallback contributor name.')
+    @click.option('--chunk-size', type=int, default=None, help='Rows per transaction [default: 5000]')
+    def import_csv_command(path, contributor_email, contributor_name, chunk_size):
+        """Bulk-import a long-format CSV in the export_study layout."""
+        from importer import import_long_format, CSVImportError, IMPORT_CHUNK_SIZE
+
+        def progress(report):
+            click.echo(f'{report.rows_read} rows read, {report.outcomes_created} outcomes imported, '
+                       f'{len(report.errors)} rejected')
+
+        try:
+            with open(path, encoding='utf-8-sig', newline='') as f:
+                report = import_long_format(f, contributor_email, contributor_name,
+                                            chunk_size=chunk_size or IMPORT_CHUNK_SIZE, progress=progress)
+        except CSVImportError as e:
+            raise click.ClickException(str(e))
+
+        for line, message in report.errors:
+            click.echo(f'line {line}: {message}', err=True)
+        click.echo(f'Done: {report.toxins_created} toxins, {report.studies_created} studies, '
+                   f'{report.animal_models_created} animal models, {report.dose_groups_created} dose groups, '
+                   f'{report.outcomes_created} outcomes created.')
+
+    @app.cli.command('check-query-plans')
+    def check_query_plans_command():
+        """Show the query plans of relationship lookups and flag full table scans."""
+        from schema import explain_relationship_queries
+
+        for label, plan, full_scan in explain_relationship_queries():
+            click.echo(f"{'FULL SCAN' if full_scan else 'ok':>9}  {label}")
+            for line in plan:
+                click.echo(f'           {line}')
+
+    @app.cli.command('normalize-values')
+    def normalize_values_command():
+        """Recompute canonical ppm doses and parsed numeric outcome values."""
+        count = backfill_normalized_values(
+            progress=lambda table, n: click.echo(f'{table}: {n} rows normalized'))
+        click.echo(f'Done: {count} rows normalized.')
+        rebuild_long_format()
+        click.echo('Long-format table rebuilt.')
+
+    @app.cli.command('rebuild-long-format')
+    def rebuild_long_format_command():
+        """Rebuild the long-format fact table from the normalized tables."""
+        count = rebuild_long_format(progress=lambda n: click.echo(f'{n} studies materialized'))
+        click.echo(f'Done: {count} studies materialized.')
+
+    @app.cli.command('reindex-search')
+    def reindex_search_command():
+        """Rebuild the full-text search index for every study."""
+        count = rebuild_search_index(progress=lambda n: click.echo(f'{n} studies indexed'))
+        click.echo(f'Done: {count} studies indexed.')
+
+    @app.cli.command('generate-synthetic')
+    @click.option('--toxins', default=5, show_default=True)
+    @click.option('--studies-per-toxin', default=20, show_default=True)
+    @click.option('--animal-models', default=2, show_default=True, help='Per study.')
+    @click.option('--dose-groups', default=4, show_default=True, help='Per animal model.')
+    @click.option('--outcomes', default=3, show_default=True, help='Per dose group.')
+    @click.option('--seed', default=0, show_default=True)
+    def generate_synthetic_command(toxins, studies_per_toxin, animal_models, dose_groups, outcomes, seed):
+        """Fill the database with a deterministic synthetic dataset."""
+        from synthetic import generate_synthetic
+
+        created = generate_synthetic(toxins, studies_per_toxin, animal_models, dose_groups, outcomes, seed)
+        click.echo('Done: ' + ', '.join(f'{count} {table}' for table, count in created.items()) + '.')
+
+    @app.cli.command('prune-jobs')
+    @click.option('--days', default=7, show_default=True, help='Keep jobs created within this many days.')
+    def prune_jobs_command(days):
+        """Delete finished background jobs and their result files."""
+        deleted = prune_jobs(datetime.utcnow() - timedelta(days=days))
+        click.echo(f'Deleted {deleted} jobs.')
+
+    @app.cli.command('find-duplicates')
+    @click.option('--rehash', is_flag=True, help='Recompute every content hash first (e.g. after upgrading).')
+    def find_duplicates_command(rehash):
+        """Report studies whose content is identical to another study's."""
+        if rehash:
+            count = rehash_studies(progress=lambda n: click.echo(f'{n} studies hashed'))
+            click.echo(f'Hashed {count} studies.')
+        clusters = duplicate_clusters()
+        for cluster in clusters:
+            click.echo(f'{len(cluster)} studies of {cluster[0][2]}:')
+            for study_id, name, _ in cluster:
+                click.echo(f'  {study_id:>8}  {name}')
+        click.echo(f'{len(clusters)} duplicate clusters, '
+                   f'{sum(len(cluster) - 1 for cluster in clusters)} studies duplicating an earlier one.')
+
+    @app.cli.command('compact-changes')
+    @click.option('--days', default=30, show_default=True,
+                  help='Keep every change-log entry written within this many days.')
+    def compact_changes_command(days):
+        """Drop older change-log entries superseded by a later entry for the same entity."""
+        deleted = compact_changes(datetime.utcnow() - timedelta(days=days))
+        click.echo(f'Deleted {deleted} superseded change-log entries.')
+
+    @app.cli.command('compile-templates')
+    def compile_templates_command():
+        """Compile every template into TEMPLATE_CACHE_DIR (run at build time)."""
+        if not app.config['TEMPLATE_CACHE_DIR']:
+            raise click.ClickException('Set TEMPLATE_CACHE_DIR to the directory the workers will read.')
+        names = preload_templates(app)
+        click.echo(f"Compiled {len(names)} templates into {app.config['TEMPLATE_CACHE_DIR']}.")
+
+    # Context processor; the maps are built once, not on every render
+    label_maps = dict(
         OUTCOME_LABELS=dict(OUTCOME_TYPE_CHOICES),
         DOSE_UNIT_LABELS=dict(DOSE_UNIT_CHOICES),
         ROUTE_LABELS=dict(ROUTE_CHOICES),
         SEX_LABELS=dict(SEX_CHOICES)
     )
 
+    @app.context_processor
+    def inject_label_maps():
+        return label_maps
+
+    if app.config['PRELOAD_APP']:
+        preload_app(app)
+
+    return app
+
 if __name__ == '__main__':
     app = create_app()
     app.run(debug=True)
\ No newline at end of file
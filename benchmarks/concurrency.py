@@ -0,0 +1,198 @@
+"""
+Concurrency load test: several worker processes read study pages while
+others add outcomes through the wizard's new_outcome step, all against one
+SQLite file, the way gunicorn workers share it. Each database profile
+(DB_PROFILE) gets a fresh copy of the same synthetic dataset, and the JSON
+report gives reader and writer latency percentiles, throughput and errors
+("database is locked" surfaces as 500s) per profile.
+
+    python benchmarks/concurrency.py --readers 4 --writers 2 --seconds 10
+    python benchmarks/concurrency.py --profile tuned --output tuned.json
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from routes import git_commit, percentile  # noqa: E402  (benchmarks/routes.py)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profile', choices=['tuned', 'default', 'both'], default='both')
+    parser.add_argument('--readers', type=int, default=4, help='reading worker processes')
+    parser.add_argument('--writers', type=int, default=2, help='writing worker processes')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--toxins', type=int, default=2)
+    parser.add_argument('--studies-per-toxin', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    return parser.parse_args()
+
+
+def read_urls(study_ids):
+    return [
+        lambda rng: f'/study/{rng.choice(study_ids)}',
+        lambda rng: f'/study/{rng.choice(study_ids)}/long-format',
+        lambda rng: f'/api/studies/{rng.choice(study_ids)}',
+    ]
+
+
+def worker(role, index, database, profile, seconds, targets, barrier, results):
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+    os.environ['DB_PROFILE'] = profile
+    os.environ['RENDER_CACHE_BACKEND'] = 'none'
+
+    from app import create_app
+
+    app = create_app()
+    app.logger.setLevel(logging.CRITICAL)  # failed requests are counted, not logged
+    client = app.test_client()
+    rng = random.Random(f'{role}-{index}')
+    urls = read_urls(targets['study_ids'])
+
+    barrier.wait()
+    latencies, errors = [], {}
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if role == 'writer':
+                response = client.post(f"/dose/{rng.choice(targets['dose_ids'])}/outcome/new", data={
+                    'outcome_type': 'mortality', 'value': str(rng.randint(0, 50)), 'notes': 'load test',
+                    'additional_field_name[]': ['source'], 'additional_field_value[]': ['concurrency'],
+                })
+            else:
+                response = client.get(rng.choice(urls)(rng))
+            response.get_data()
+            status = response.status_code
+        except Exception as exc:
+            status = type(exc).__name__
+        latencies.append((time.perf_counter() - start) * 1000)
+        if status not in (200, 302):
+            errors[str(status)] = errors.get(str(status), 0) + 1
+    results.put((role, latencies, errors))
+
+
+def summarize(runs, seconds):
+    latencies = sorted(ms for run_latencies, _ in runs for ms in run_latencies)
+    errors = {}
+    for _, run_errors in runs:
+        for status, count in run_errors.items():
+            errors[status] = errors.get(status, 0) + count
+    if not latencies:
+        return {'requests': 0, 'errors': errors}
+    return {
+        'requests': len(latencies),
+        'requests_per_second': round(len(latencies) / seconds, 1),
+        'errors': errors,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 3),
+            'p90': round(percentile(latencies, 90), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'max': round(latencies[-1], 3),
+        },
+    }
+
+
+def run_profile(profile, base_database, targets, args):
+    database = base_database.replace('base.db', f'{profile}.db')
+    shutil.copyfile(base_database, database)
+
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(args.readers + args.writers)
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(role, i, database, profile, args.seconds, targets, barrier, results))
+        for role, count in (('reader', args.readers), ('writer', args.writers))
+        for i in range(count)
+    ]
+    for process in processes:
+        process.start()
+    runs = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    with sqlite3.connect(database) as connection:
+        journal_mode = connection.execute('PRAGMA journal_mode').fetchone()[0]
+    return {
+        'journal_mode': journal_mode,
+        'readers': summarize([(lat, err) for role, lat, err in runs if role == 'reader'], args.seconds),
+        'writers': summarize([(lat, err) for role, lat, err in runs if role == 'writer'], args.seconds),
+    }
+
+
+def build_dataset(database, args):
+    """Generate the shared dataset once, in rollback-journal mode."""
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+    os.environ['DB_PROFILE'] = 'default'
+
+    from app import create_app
+    from models import db, DoseGroup, Study
+    from synthetic import generate_synthetic
+
+    app = create_app()
+    with app.app_context():
+        generate_synthetic(args.toxins, args.studies_per_toxin, 2, 4, 3, seed=args.seed)
+        targets = {
+            'study_ids': [row[0] for row in db.session.query(Study.id)],
+            'dose_ids': [row[0] for row in db.session.query(DoseGroup.id)],
+        }
+        db.session.remove()
+        db.engine.dispose()
+    return targets
+
+
+def main():
+    args = parse_args()
+    base_database = os.path.join(tempfile.mkdtemp(prefix='toxdb-load-'), 'base.db')
+    targets = build_dataset(base_database, args)
+
+    profiles = ['default', 'tuned'] if args.profile == 'both' else [args.profile]
+    results = {}
+    for profile in profiles:
+        results[profile] = run_profile(profile, base_database, targets, args)
+        for role in ('readers', 'writers'):
+            stats = results[profile][role]
+            latency = stats.get('latency_ms', {})
+            print(f"{profile:<8} {role:<8} {stats['requests']:>6} requests  "
+                  f"p50 {latency.get('p50', 0):>8.2f} ms  p99 {latency.get('p99', 0):>8.2f} ms  "
+                  f"max {latency.get('max', 0):>8.2f} ms  errors {sum(stats['errors'].values())}",
+                  file=sys.stderr)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'created_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'parameters': {
+                'readers': args.readers, 'writers': args.writers, 'seconds': args.seconds,
+                'toxins': args.toxins, 'studies_per_toxin': args.studies_per_toxin, 'seed': args.seed,
+            },
+        },
+        'profiles': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""
+Route benchmark: builds a synthetic SQLite database, drives the main routes
+through the Flask test client and writes a JSON report with latency
+percentiles, SQL query counts and peak Python memory per route.
+
+    python benchmarks/routes.py --studies-per-toxin 50 --output before.json
+    python benchmarks/routes.py --studies-per-toxin 50 --compare before.json
+
+The dataset is deterministic for a given set of size arguments and --seed,
+so reports from different commits are directly comparable.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--toxins', type=int, default=5)
+    parser.add_argument('--studies-per-toxin', type=int, default=20)
+    parser.add_argument('--animal-models', type=int, default=2)
+    parser.add_argument('--dose-groups', type=int, default=4)
+    parser.add_argument('--outcomes', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--requests', type=int, default=30, help='timed requests per route')
+    parser.add_argument('--render-cache', default='none',
+                        help="RENDER_CACHE_BACKEND during the run (default 'none': measure full renders)")
+    parser.add_argument('--database', help='SQLite file to use (default: a temporary file)')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--compare', help='earlier report to compare median latencies against')
+    return parser.parse_args()
+
+
+def routes(study_ids, toxin_ids, toxin_names):
+    """(name, url factory) pairs; each factory takes a random.Random."""
+    return [
+        ('home', lambda rng: '/'),
+        ('list_studies', lambda rng: '/studies'),
+        ('view_study', lambda rng: f'/study/{rng.choice(study_ids)}'),
+        ('view_study_long_format', lambda rng: f'/study/{rng.choice(study_ids)}/long-format'),
+        ('export_study', lambda rng: f'/study/{rng.choice(study_ids)}/export'),
+        ('export_all_toxin', lambda rng: f'/export?toxin={rng.choice(toxin_names)}'),
+        ('search', lambda rng: f'/search?q={rng.choice(toxin_names).split()[0]}'),
+        ('api_studies_page', lambda rng: '/api/studies?limit=50'),
+        ('api_study', lambda rng: f'/api/studies/{rng.choice(study_ids)}'),
+        ('dose_response', lambda rng: f'/api/toxins/{rng.choice(toxin_ids)}/dose-response'),
+    ]
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def measure(client, counter, name, make_url, requests, seed):
+    rng = random.Random(f'{seed}-{name}')
+    urls = [make_url(rng) for _ in range(requests)]
+
+    client.get(urls[0]).get_data()  # warm-up (template compilation, first connection)
+
+    latencies, queries, sizes, statuses = [], [], [], {}
+    for url in urls:
+        counter['n'] = 0
+        start = time.perf_counter()
+        response = client.get(url)
+        body = response.get_data()  # drains streamed responses
+        latencies.append((time.perf_counter() - start) * 1000)
+        response.close()
+        queries.append(counter['n'])
+        sizes.append(len(body))
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    # Memory is measured in a separate pass so tracing does not skew latency
+    peaks = []
+    for url in urls[:min(5, len(urls))]:
+        tracemalloc.start()
+        client.get(url).get_data()
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'requests': len(urls),
+        'status_codes': {str(code): count for code, count in sorted(statuses.items())},
+        'latency_ms': {
+            'min': round(latencies[0], 3),
+            'p50': round(percentile(latencies, 50), 3),
+            'p90': round(percentile(latencies, 90), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'max': round(latencies[-1], 3),
+            'mean': round(statistics.mean(latencies), 3),
+        },
+        'queries': {'mean': round(statistics.mean(queries), 2), 'max': max(queries)},
+        'peak_memory_kb': round(max(peaks) / 1024, 1),
+        'response_bytes': {'mean': int(statistics.mean(sizes)), 'max': max(sizes)},
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline_path):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"{'route':<24}{'p50 before':>12}{'p50 now':>12}{'change':>9}{'queries':>12}", file=sys.stderr)
+    for name, now in report['routes'].items():
+        before = baseline.get('routes', {}).get(name)
+        if not before:
+            print(f'{name:<24}{"-":>12}{now["latency_ms"]["p50"]:>12.2f}', file=sys.stderr)
+            continue
+        old, new = before['latency_ms']['p50'], now['latency_ms']['p50']
+        change = f'{(new - old) / old * 100:+.0f}%' if old else '-'
+        queries = f"{before['queries']['mean']:g}→{now['queries']['mean']:g}"
+        print(f'{name:<24}{old:>12.2f}{new:>12.2f}{change:>9}{queries:>12}', file=sys.stderr)
+
+
+def main():
+    args = parse_args()
+    database = args.database or os.path.join(tempfile.mkdtemp(prefix='toxdb-bench-'), 'bench.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(database)}'
+    os.environ['RENDER_CACHE_BACKEND'] = args.render_cache
+
+    from sqlalchemy import event
+    from app import create_app
+    from models import db, Toxin, Study
+    from synthetic import generate_synthetic
+
+    app = create_app()
+    with app.app_context():
+        started = time.perf_counter()
+        dataset = generate_synthetic(args.toxins, args.studies_per_toxin, args.animal_models,
+                                     args.dose_groups, args.outcomes, seed=args.seed)
+        dataset['seconds'] = round(time.perf_counter() - started, 2)
+
+        study_ids = [row[0] for row in db.session.query(Study.id).order_by(Study.id)]
+        toxins = db.session.query(Toxin.id, Toxin.name).order_by(Toxin.id).all()
+
+        counter = {'n': 0}
+
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def count_query(*_):
+            counter['n'] += 1
+
+    client = app.test_client()
+    results = {}
+    for name, make_url in routes(study_ids, [t.id for t in toxins], [t.name for t in toxins]):
+        results[name] = measure(client, counter, name, make_url, args.requests, args.seed)
+        print(f"{name:<24} p50 {results[name]['latency_ms']['p50']:>9.2f} ms  "
+              f"queries {results[name]['queries']['mean']:>6g}", file=sys.stderr)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'created_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'render_cache': args.render_cache,
+            'requests_per_route': args.requests,
+            'parameters': {
+                'toxins': args.toxins, 'studies_per_toxin': args.studies_per_toxin,
+                'animal_models': args.animal_models, 'dose_groups': args.dose_groups,
+                'outcomes': args.outcomes, 'seed': args.seed,
+            },
+        },
+        'dataset': dataset,
+        'routes': results,
+    }
+
+    if args.compare:
+        compare(report, args.compare)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""
+Snapshot benchmark: loading the database into NumPy from the long-format
+CSV export versus from a columnar snapshot. Builds a synthetic SQLite
+database, writes both files, then times the typical first step of an
+analysis: get typed dose value, group size and numeric value arrays plus
+species and dose unit codes, and average the dose by species and unit.
+The CSV export has no ppm-normalized dose, so both formats are read in
+the units the doses were entered in (ppm, mg/m3, mg/kg/day, …). The CSV
+is parsed with pandas when it is installed, otherwise with the csv
+module.
+
+    python benchmarks/snapshot.py --studies-per-toxin 200 --output snapshot.json
+
+The report gives export time, file size (raw and gzip-compressed, as
+downloaded from a job) and load time for each format.
+"""
+import argparse
+import csv
+import gzip
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from routes import git_commit  # noqa: E402  (benchmarks/routes.py)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--toxins', type=int, default=5)
+    parser.add_argument('--studies-per-toxin', type=int, default=50)
+    parser.add_argument('--animal-models', type=int, default=2)
+    parser.add_argument('--dose-groups', type=int, default=4)
+    parser.add_argument('--outcomes', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5, help='timed loads per format')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    return parser.parse_args()
+
+
+def load_csv(path):
+    """Typed columns from the CSV export: what an analysis has to do before it starts."""
+    try:
+        import pandas as pd
+    except ImportError:
+        pd = None
+    if pd is not None:
+        frame = pd.read_csv(path)
+        species = frame['Animal Species'].astype('category')
+        units = frame['Dose Unit'].astype('category')
+        return (frame['Dose Value'].to_numpy(float), frame['Group Size'].to_numpy(int),
+                pd.to_numeric(frame['Outcome Value'], errors='coerce').to_numpy(float),
+                species.cat.codes.to_numpy(), list(species.cat.categories),
+                units.cat.codes.to_numpy(), list(units.cat.categories))
+
+    doses, sizes, values, species, categories, units, unit_categories = [], [], [], [], {}, [], {}
+    with open(path, encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        dose, size, value, animal, unit = (header.index(name) for name in
+                                           ('Dose Value', 'Group Size', 'Outcome Value', 'Animal Species',
+                                            'Dose Unit'))
+        for row in reader:
+            doses.append(float(row[dose]) if row[dose] else np.nan)
+            sizes.append(int(row[size]))
+            try:
+                values.append(float(row[value]))
+            except ValueError:
+                values.append(np.nan)
+            species.append(categories.setdefault(row[animal], len(categories)))
+            units.append(unit_categories.setdefault(row[unit], len(unit_categories)))
+    return (np.array(doses), np.array(sizes), np.array(values),
+            np.array(species, dtype=np.int32), list(categories),
+            np.array(units, dtype=np.int32), list(unit_categories))
+
+
+def load_snapshot(path):
+    from snapshot_reader import open_snapshot
+
+    snapshot = open_snapshot(path)
+    return (snapshot['dose_value'], snapshot['group_size'], snapshot['value_numeric'],
+            snapshot['species'], list(snapshot.dictionary('species')),
+            snapshot['dose_unit'], list(snapshot.dictionary('dose_unit')))
+
+
+def analyse(columns):
+    """Mean dose by (species, dose unit) label; doses in different units are never averaged together."""
+    doses, _, _, species, species_labels, units, unit_labels = columns
+    means = {}
+    for code, label in enumerate(species_labels):
+        for unit_code, unit in enumerate(unit_labels):
+            selected = (species == code) & (units == unit_code)
+            if selected.any():
+                means[(label, unit)] = float(np.nanmean(doses[selected]))
+    return means
+
+
+def time_load(load, path, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        analyse(load(path))
+        timings.append((time.perf_counter() - start) * 1000)
+    return {'median_ms': round(statistics.median(timings), 3), 'min_ms': round(min(timings), 3)}
+
+
+def gzip_size(path):
+    with open(path, 'rb') as source, tempfile.TemporaryFile() as target:
+        with gzip.GzipFile(fileobj=target, mode='wb') as compressed:
+            shutil.copyfileobj(source, compressed)
+        return target.tell()
+
+
+def main():
+    args = parse_args()
+    directory = tempfile.mkdtemp(prefix='toxdb-snapshot-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+    os.environ['RENDER_CACHE_BACKEND'] = 'none'
+
+    from app import create_app
+    from exports import long_format_query, stream_csv
+    from snapshot import export_snapshot
+    from synthetic import generate_synthetic
+
+    app = create_app()
+    csv_path = os.path.join(directory, 'export.csv')
+    snapshot_path = os.path.join(directory, 'snapshot.tar')
+    try:
+        with app.app_context():
+            generate_synthetic(args.toxins, args.studies_per_toxin, args.animal_models, args.dose_groups,
+                               args.outcomes, seed=args.seed)
+
+            start = time.perf_counter()
+            with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+                for text in stream_csv(long_format_query()):
+                    f.write(text)
+            csv_export_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            rows = export_snapshot(snapshot_path)['rows']
+            snapshot_export_ms = (time.perf_counter() - start) * 1000
+
+        # Same answer from both paths before timing them
+        assert analyse(load_csv(csv_path)) == analyse(load_snapshot(snapshot_path))
+
+        results = {}
+        for name, path, export_ms, load in (('csv', csv_path, csv_export_ms, load_csv),
+                                            ('snapshot', snapshot_path, snapshot_export_ms, load_snapshot)):
+            results[name] = {
+                'export_ms': round(export_ms, 3),
+                'bytes': os.path.getsize(path),
+                'gzip_bytes': gzip_size(path),
+                'load': time_load(load, path, args.repeat),
+            }
+            print(f"{name:<9} export {export_ms:>9.1f} ms  {results[name]['bytes']:>11} bytes  "
+                  f"({results[name]['gzip_bytes']} gzipped)  load {results[name]['load']['median_ms']:>8.2f} ms",
+                  file=sys.stderr)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    try:
+        import pandas
+        csv_parser = f'pandas {pandas.__version__}'
+    except ImportError:
+        csv_parser = 'csv module'
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'created_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'csv_parser': csv_parser,
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'parameters': {
+                'rows': rows, 'toxins': args.toxins, 'studies_per_toxin': args.studies_per_toxin,
+                'animal_models': args.animal_models, 'dose_groups': args.dose_groups,
+                'outcomes': args.outcomes, 'seed': args.seed, 'repeat': args.repeat,
+            },
+        },
+        'formats': results,
+        'load_speedup': round(results['csv']['load']['median_ms'] / results['snapshot']['load']['median_ms'], 1),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
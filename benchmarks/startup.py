@@ -0,0 +1,183 @@
+"""
+Startup benchmark: starts fresh Python processes the way gunicorn starts
+workers and measures how long each takes to import the app, run
+create_app and answer its first requests. Modes:
+
+    default     AUTO_MIGRATE=1, templates compiled on first use
+    production  AUTO_MIGRATE=0, templates read from a TEMPLATE_CACHE_DIR
+                filled beforehand with `flask compile-templates`
+    preload     production plus PRELOAD_APP=1 (with `gunicorn --preload`
+                create_app runs once in the master, so a forked worker's
+                start-up is just its first requests)
+
+time_to_first_response_ms runs from spawning the process to the first
+response, interpreter start-up included.
+
+    python benchmarks/startup.py --workers 10
+    python benchmarks/startup.py --mode production --output startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from routes import git_commit, percentile  # noqa: E402  (benchmarks/routes.py)
+
+MODES = ['default', 'production', 'preload']
+
+# Requested in order by every worker; each is the first render of its template
+FIRST_URLS = ['/', '/studies', '/study/{study_id}', '/outcomes']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=MODES + ['all'], default='all')
+    parser.add_argument('--workers', type=int, default=5, help='worker processes started per mode, one at a time')
+    parser.add_argument('--toxins', type=int, default=2)
+    parser.add_argument('--studies-per-toxin', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def worker():
+    """Runs in the started process; prints its timings as JSON."""
+    started = time.perf_counter()
+    from app import create_app
+    imported = time.perf_counter()
+    app = create_app()
+    created = time.perf_counter()
+
+    client = app.test_client()
+    study_id = os.environ['STARTUP_STUDY_ID']
+    timings = {
+        'import_ms': (imported - started) * 1000,
+        'create_app_ms': (created - imported) * 1000,
+        'requests_ms': {},
+    }
+    for url in FIRST_URLS:
+        start = time.perf_counter()
+        response = client.get(url.format(study_id=study_id))
+        response.get_data()
+        timings['requests_ms'][url] = (time.perf_counter() - start) * 1000
+        if url == FIRST_URLS[0]:
+            timings['time_to_first_response_ms'] = (time.time() - float(os.environ['STARTUP_SPAWNED_AT'])) * 1000
+        if response.status_code != 200:
+            raise SystemExit(f'{url} answered {response.status_code}')
+    print(json.dumps(timings))
+
+
+def mode_environment(mode, database, template_cache):
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{database}', RENDER_CACHE_BACKEND='none')
+    env['AUTO_MIGRATE'] = '1' if mode == 'default' else '0'
+    env['PRELOAD_APP'] = '1' if mode == 'preload' else '0'
+    if mode == 'default':
+        env.pop('TEMPLATE_CACHE_DIR', None)
+    else:
+        env['TEMPLATE_CACHE_DIR'] = template_cache
+    return env
+
+
+def run_mode(mode, database, template_cache, study_id, args):
+    env = mode_environment(mode, database, template_cache)
+    env['STARTUP_STUDY_ID'] = str(study_id)
+    runs = []
+    for _ in range(args.workers):
+        env['STARTUP_SPAWNED_AT'] = repr(time.time())
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker'], env=env, cwd=ROOT,
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise SystemExit(f'{mode} worker failed:\n{result.stderr}')
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    def stats(values):
+        values = sorted(values)
+        return {'p50': round(percentile(values, 50), 3), 'max': round(values[-1], 3)}
+
+    return {
+        'time_to_first_response_ms': stats([run['time_to_first_response_ms'] for run in runs]),
+        'import_ms': stats([run['import_ms'] for run in runs]),
+        'create_app_ms': stats([run['create_app_ms'] for run in runs]),
+        'first_requests_ms': {url: stats([run['requests_ms'][url] for run in runs]) for url in FIRST_URLS},
+    }
+
+
+def build_dataset(database, template_cache, args):
+    """Generate the dataset (applying migrations) and fill the template cache."""
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{database}', TEMPLATE_CACHE_DIR=template_cache)
+    os.environ.update(DATABASE_URL=env['DATABASE_URL'])
+
+    from app import create_app
+    from models import db, Study
+    from synthetic import generate_synthetic
+
+    app = create_app()
+    with app.app_context():
+        generate_synthetic(args.toxins, args.studies_per_toxin, 2, 4, 3, seed=args.seed)
+        study_id = db.session.query(Study.id).order_by(Study.id).first()[0]
+        db.session.remove()
+        db.engine.dispose()
+
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app.py', 'compile-templates'],
+                   env=env, cwd=ROOT, check=True, capture_output=True)
+    return study_id
+
+
+def main():
+    args = parse_args()
+    if args.worker:
+        worker()
+        return
+
+    directory = tempfile.mkdtemp(prefix='toxdb-startup-')
+    database = os.path.join(directory, 'startup.db')
+    template_cache = os.path.join(directory, 'jinja')
+    try:
+        study_id = build_dataset(database, template_cache, args)
+        modes = MODES if args.mode == 'all' else [args.mode]
+        results = {}
+        for mode in modes:
+            results[mode] = run_mode(mode, database, template_cache, study_id, args)
+            stats = results[mode]
+            print(f"{mode:<11} first response p50 {stats['time_to_first_response_ms']['p50']:>8.1f} ms  "
+                  f"import {stats['import_ms']['p50']:>7.1f} ms  create_app {stats['create_app_ms']['p50']:>6.1f} ms  "
+                  f"first / {stats['first_requests_ms']['/']['p50']:>6.1f} ms",
+                  file=sys.stderr)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'created_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'parameters': {
+                'workers': args.workers, 'toxins': args.toxins,
+                'studies_per_toxin': args.studies_per_toxin, 'seed': args.seed,
+            },
+        },
+        'modes': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+from werkzeug.utils import ImportStringError, import_string
+
+RENDER_CACHE_BACKENDS = ('lru', 'filesystem', 'none')
+
+
+class LRUCache:
+    """Bounded in-process cache; each gunicorn worker keeps its own copy."""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FileCache:
+    """
+    Cache shared by every worker on a host through a directory of files.
+    Writes are atomic (write to a temp file, then rename); once more than
+    max_entries files exist the least recently written ones are removed.
+    """
+
+    def __init__(self, directory, max_entries=10000):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, value):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(value)
+        os.replace(tmp, self._path(key))
+        self._prune()
+
+    def _prune(self):
+        entries = [e for e in os.scandir(self.directory) if not e.name.endswith('.tmp')]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def __len__(self):
+        return sum(1 for e in os.scandir(self.directory) if not e.name.endswith('.tmp'))
+
+
+class NullCache:
+    """Disables caching while keeping hit/miss accounting."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class RenderCache:
+    """
+    Rendered-fragment cache keyed by (page, study id, study version).
+
+    Study.version is bumped by every write to the study tree, so a new
+    version simply produces a new key and stale entries age out of the
+    backend; nothing has to be invalidated explicitly, and workers never
+    serve each other's stale copies.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(page, study_id, version):
+        return f'{page}:{study_id}:{version}'
+
+    def get_or_render(self, key, render):
+        """Return (html, hit)."""
+        html = self.backend.get(key)
+        with self._lock:
+            if html is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if html is not None:
+            return html, True
+
+        html = render()
+        self.backend.set(key, html)
+        return html, False
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': len(self.backend) if hasattr(self.backend, '__len__') else None,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else None,
+        }
+
+
+def init_render_cache(app):
+    """
+    Build the render cache from config. RENDER_CACHE_BACKEND is 'lru'
+    (default), 'filesystem', 'none', or a custom shared backend: any object
+    with get(key) and set(key, value), or the import path of one
+    ('package.module:name'). An imported class or other factory is called
+    with the app. Anything else raises ValueError at start-up.
+    """
+    backend = app.config['RENDER_CACHE_BACKEND']
+    if backend == 'lru':
+        backend = LRUCache(app.config['RENDER_CACHE_SIZE'])
+    elif backend == 'filesystem':
+        backend = FileCache(app.config['RENDER_CACHE_DIR'] or os.path.join(app.instance_path, 'render_cache'),
+                            app.config['RENDER_CACHE_SIZE'])
+    elif backend in ('none', None):
+        backend = NullCache()
+    elif isinstance(backend, str):
+        backend = _import_backend(app, backend)
+    if not (callable(getattr(backend, 'get', None)) and callable(getattr(backend, 'set', None))):
+        raise ValueError(f"RENDER_CACHE_BACKEND must be one of {', '.join(RENDER_CACHE_BACKENDS)}, the import "
+                         f"path of a backend, or an object with get() and set(), not {backend!r}")
+    app.extensions['render_cache'] = RenderCache(backend)
+
+
+def _import_backend(app, path):
+    if ':' not in path and '.' not in path:
+        raise ValueError(f"RENDER_CACHE_BACKEND must be one of {', '.join(RENDER_CACHE_BACKENDS)} "
+                         f"or an import path like 'package.module:name', not {path!r}")
+    try:
+        backend = import_string(path)
+    except ImportStringError as e:
+        raise ValueError(f'RENDER_CACHE_BACKEND {path!r} cannot be imported: {e.exception}') from e
+    if isinstance(backend, type) or (callable(backend) and not hasattr(backend, 'get')):
+        backend = backend(app)
+    return backend
+
+
+def render_cache():
+    return current_app.extensions['render_cache']
+
+
+class AnalysisCache:
+    """In-process cache of analysis results (analysis.py) keyed by a data fingerprint."""
+
+    def __init__(self, max_entries=64):
+        self.backend = LRUCache(max_entries)
+
+    def get_or_compute(self, key, compute):
+        result = self.backend.get(key)
+        if result is None:
+            result = compute()
+            if result is not None:
+                self.backend.set(key, result)
+        return result
+
+
+def init_analysis_cache(app):
+    app.extensions['analysis_cache'] = AnalysisCache(app.config['ANALYSIS_CACHE_SIZE'])
+
+
+def analysis_cache():
+    return current_app.extensions['analysis_cache']
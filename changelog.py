@@ -0,0 +1,119 @@
+from datetime import datetime
+
+from sqlalchemy import and_, delete, event, exists, insert, literal, select, text, union_all
+from sqlalchemy.orm import aliased
+
+from models import db, Study, AnimalModel, DoseGroup, Outcome, AdditionalMetadata, Change
+
+# Change feed for mirrors. changes.studies_changed appends one change_log
+# row per entity written in the current transaction: the study itself and
+# every animal model, dose group, outcome and metadata row of it whose
+# updated_at is at or after the transaction began. Bulk Core inserts set
+# updated_at through the column defaults, so the importer and whole-tree
+# submissions are covered like the wizard's ORM writes.
+#
+# Entry ids are the feed cursors. They must become visible in id order, or
+# a replica could skip an entry committed after a higher one: SQLite only
+# ever has one writer, and on Postgres writers take a transaction-level
+# advisory lock before appending, held the few statements until commit.
+
+# Arbitrary key for pg_advisory_xact_lock
+CHANGE_LOG_LOCK = 0x746f7863
+
+
+@event.listens_for(db.session, 'after_begin')
+def _mark_transaction_start(session, transaction, connection):
+    session.info['transaction_started_at'] = datetime.utcnow()
+
+
+def _entity_changes(study_ids, since):
+    """(study_id, entity_type, entity_id) of the entities of these studies written since `since`."""
+    study_ids = list(study_ids)
+    in_studies = AnimalModel.study_id.in_(study_ids)
+    selects = [
+        select(Study.id.label('study_id'), literal('study').label('entity_type'), Study.id.label('entity_id'))
+        .where(Study.id.in_(study_ids)),
+        select(AnimalModel.study_id, literal('animal_model'), AnimalModel.id)
+        .where(in_studies, AnimalModel.updated_at >= since),
+        select(AnimalModel.study_id, literal('dose_group'), DoseGroup.id)
+        .join(AnimalModel, AnimalModel.id == DoseGroup.animal_model_id)
+        .where(in_studies, DoseGroup.updated_at >= since),
+        select(AnimalModel.study_id, literal('outcome'), Outcome.id)
+        .join(DoseGroup, DoseGroup.id == Outcome.dose_group_id)
+        .join(AnimalModel, AnimalModel.id == DoseGroup.animal_model_id)
+        .where(in_studies, Outcome.updated_at >= since),
+    ]
+
+    # Metadata rows, resolved to their study through the entity they describe
+    metadata = [literal('additional_metadata'), AdditionalMetadata.id]
+    written = AdditionalMetadata.updated_at >= since
+    selects += [
+        select(AdditionalMetadata.entity_id, *metadata)
+        .where(AdditionalMetadata.entity_type == 'study', AdditionalMetadata.entity_id.in_(study_ids), written),
+        select(AnimalModel.study_id, *metadata)
+        .join(AnimalModel, AnimalModel.id == AdditionalMetadata.entity_id)
+        .where(AdditionalMetadata.entity_type == 'animal_model', in_studies, written),
+        select(AnimalModel.study_id, *metadata)
+        .join(DoseGroup, DoseGroup.id == AdditionalMetadata.entity_id)
+        .join(AnimalModel, AnimalModel.id == DoseGroup.animal_model_id)
+        .where(AdditionalMetadata.entity_type == 'dose_group', in_studies, written),
+        select(AnimalModel.study_id, *metadata)
+        .join(Outcome, Outcome.id == AdditionalMetadata.entity_id)
+        .join(DoseGroup, DoseGroup.id == Outcome.dose_group_id)
+        .join(AnimalModel, AnimalModel.id == DoseGroup.animal_model_id)
+        .where(AdditionalMetadata.entity_type == 'outcome', in_studies, written),
+    ]
+    return union_all(*selects)
+
+
+def log_changes(study_ids):
+    """
+    Append the entities of these studies written in this transaction to
+    the change log, with one INSERT … SELECT. Called last in
+    changes.studies_changed, right before the caller commits.
+    """
+    study_ids = list(study_ids)
+    if not study_ids:
+        return
+    since = db.session.info.get('transaction_started_at') or datetime.utcnow()
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': CHANGE_LOG_LOCK})
+    changes = _entity_changes(study_ids, since).subquery()
+    db.session.execute(
+        insert(Change).from_select(
+            ['study_id', 'entity_type', 'entity_id', 'changed_at'],
+            select(*changes.c, literal(datetime.utcnow(), db.DateTime))
+        )
+    )
+
+
+def changes_since(since, limit):
+    """Up to `limit` entries after cursor `since`, oldest first, and whether more follow."""
+    rows = (
+        db.session.query(Change.id, Change.study_id, Change.entity_type, Change.entity_id, Change.changed_at)
+        .filter(Change.id > since)
+        .order_by(Change.id)
+        .limit(limit + 1)
+        .all()
+    )
+    return rows[:limit], len(rows) > limit
+
+
+def compact_changes(older_than):
+    """
+    Delete entries written before `older_than` that a later entry for the
+    same entity supersedes. Every replica still sees the latest entry of
+    each entity whatever its cursor, so no replica has to resync; the log
+    shrinks to about one entry per entity plus recent history.
+    """
+    later = aliased(Change)
+    result = db.session.execute(
+        delete(Change)
+        .where(Change.changed_at < older_than,
+               exists().where(and_(later.entity_type == Change.entity_type,
+                                   later.entity_id == Change.entity_id,
+                                   later.id > Change.id)))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
@@ -0,0 +1,35 @@
+from datetime import datetime
+
+from models import db, Study
+from facts import refresh_long_format
+from search import index_studies
+from duplicates import refresh_content_hashes
+from changelog import log_changes
+
+
+def study_changed(study_id):
+    """
+    Record that something in a study's tree was written. Call it from every
+    write path before committing, so the follow-up work lands in the same
+    transaction as the write itself.
+    """
+    studies_changed([study_id])
+
+
+def studies_changed(study_ids):
+    study_ids = list(study_ids)
+    if not study_ids:
+        return
+
+    # Bumping the version invalidates every cached rendering of the study,
+    # and updated_at is kept at the latest write anywhere in the tree, so
+    # (version, updated_at) is a one-row fingerprint of the whole study
+    db.session.query(Study).filter(Study.id.in_(study_ids)).update(
+        {Study.version: Study.version + 1, Study.updated_at: datetime.utcnow()},
+        synchronize_session=False
+    )
+    refresh_long_format(study_ids)
+    index_studies(study_ids)
+    refresh_content_hashes(study_ids)
+    # Last, so the change log's write lock (Postgres) is held only until commit
+    log_changes(study_ids)
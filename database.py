@@ -0,0 +1,107 @@
+from flask import current_app, has_request_context
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+from models import db
+
+# Connection settings for running under several gunicorn workers, selected
+# with DB_PROFILE=tuned (the default; DB_PROFILE=default leaves SQLAlchemy's
+# own settings untouched). Each worker keeps a pool of DB_POOL_SIZE open
+# connections.
+#
+# SQLite: WAL lets readers keep reading while a wizard step commits, and a
+# busy timeout makes concurrent writers wait for the lock instead of failing
+# with "database is locked". synchronous=NORMAL is safe in WAL mode (a power
+# cut can lose the last commits, never corrupt the file).
+#
+# Postgres: pre-ping so connections dropped by the server or a proxy are
+# replaced transparently, and a statement timeout so a runaway query cannot
+# hold a web worker forever. The timeout is set per transaction and only
+# inside requests: migrations, CLI commands and background jobs legitimately
+# run long statements and are left unlimited.
+
+DB_PROFILES = ('tuned', 'default')
+
+
+def configure_database(app):
+    """
+    Set SQLALCHEMY_ENGINE_OPTIONS for the selected profile. Must run before
+    the engine is first used.
+    """
+    profile = app.config['DB_PROFILE']
+    if profile not in DB_PROFILES:
+        raise ValueError(f"DB_PROFILE must be one of {', '.join(DB_PROFILES)}, not {profile!r}")
+    if profile == 'default':
+        return
+
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    if url.get_backend_name() == 'postgresql':
+        options.update({
+            'pool_size': app.config['DB_POOL_SIZE'],
+            'max_overflow': app.config['DB_MAX_OVERFLOW'],
+            'pool_timeout': app.config['DB_POOL_TIMEOUT'],
+            'pool_recycle': app.config['DB_POOL_RECYCLE'],
+            'pool_pre_ping': True,
+        })
+    elif url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:'):
+        # SQLAlchemy 1.4 opens a new SQLite connection per checkout by
+        # default, which throws away the page cache and mmap every request.
+        # Connections are only ever used by one request at a time, so they
+        # can be handed between threads.
+        options.update({
+            'poolclass': QueuePool,
+            'pool_size': app.config['DB_POOL_SIZE'],
+            'max_overflow': app.config['DB_MAX_OVERFLOW'],
+            'pool_timeout': app.config['DB_POOL_TIMEOUT'],
+            'connect_args': {'check_same_thread': False},
+        })
+
+
+@event.listens_for(db.session, 'after_begin')
+def _limit_request_statements(session, transaction, connection):
+    """SET LOCAL statement_timeout for transactions begun inside a request (tuned profile, Postgres)."""
+    if (not has_request_context() or connection.dialect.name != 'postgresql'
+            or current_app.config['DB_PROFILE'] != 'tuned'):
+        return
+    # set_config(..., true) is SET LOCAL: it ends with the transaction
+    connection.execute(text("SELECT set_config('statement_timeout', :timeout, true)"),
+                       {'timeout': str(int(current_app.config['DB_STATEMENT_TIMEOUT_MS']))})
+
+
+def init_database(app):
+    """Install the per-connection SQLite pragmas of the tuned profile."""
+    if app.config['DB_PROFILE'] != 'tuned':
+        return
+
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+
+    pragmas = [
+        f"PRAGMA busy_timeout = {int(app.config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        'PRAGMA synchronous = NORMAL',
+        # Negative cache_size is in KiB
+        f"PRAGMA cache_size = {-int(app.config['SQLITE_CACHE_SIZE_MB']) * 1024}",
+        f"PRAGMA mmap_size = {int(app.config['SQLITE_MMAP_SIZE_MB']) * 1024 * 1024}",
+    ]
+    memory = engine.url.database in (None, '', ':memory:')
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # WAL is stored in the file, but setting it again is a no-op; an
+        # in-memory database has no journal to switch
+        if not memory:
+            cursor.execute('PRAGMA journal_mode = WAL')
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def sqlite_settings():
+    """Current values of the tuned pragmas on one pooled connection (SQLite only)."""
+    names = ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size')
+    return {name: db.session.execute(text(f'PRAGMA {name}')).scalar() for name in names}
@@ -0,0 +1,173 @@
+import hashlib
+import json
+
+from sqlalchemy import bindparam, func, select
+
+from models import db, Toxin, Study, AnimalModel, DoseGroup, Outcome
+
+# Duplicate detection. Every study with at least one outcome carries
+# Study.content_hash, a SHA-256 over its scientific content: the toxin,
+# the publication reference, and the sorted animal models (species, sex,
+# strain), dose groups (dose, unit, route, group size) and outcomes (type,
+# value, observation time) nested under them. Names, descriptions, notes,
+# contributors and custom metadata are left out, and text is compared
+# case- and whitespace-insensitively, so the same publication entered
+# twice gets the same hash however it was typed. The column is indexed,
+# so checking a new submission is one index lookup.
+
+
+class DuplicateStudyError(ValueError):
+    """A submitted study tree has the same content as an existing study."""
+
+    def __init__(self, study_id):
+        super().__init__(f'This study has the same content as study {study_id}.')
+        self.study_id = study_id
+
+
+def _text(value):
+    return ' '.join(str(value or '').split()).lower()
+
+
+def _dose(dose_value, dose_unit, custom_dose_unit, route_of_exposure, group_size, outcomes):
+    return [
+        '' if dose_value is None else f'{float(dose_value):.6g}',
+        _text(custom_dose_unit if dose_unit == 'other' else dose_unit),
+        _text(route_of_exposure),
+        '' if group_size is None else str(group_size),
+        sorted(outcomes),
+    ]
+
+
+def _outcome(outcome_type, custom_outcome_type, value, observation_time):
+    return [_text(custom_outcome_type if outcome_type == 'other' else outcome_type),
+            _text(value), _text(observation_time)]
+
+
+def _hash(toxin_key, publication_reference, animals):
+    """Hash of the nested canonical lists; None while the tree has no outcomes."""
+    if not any(dose[4] for animal in animals for dose in animal[3]):
+        return None
+    content = [_text(toxin_key), _text(publication_reference), sorted(animals)]
+    encoded = json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def tree_content_hash(tree):
+    """content_hash of a validated submission tree (submission._validate), before it is stored."""
+    animals = []
+    for animal in tree['animal_models']:
+        fields = animal['fields']
+        doses = [
+            _dose(dose['fields']['dose_value'], dose['fields']['dose_unit'], dose['fields']['custom_dose_unit'],
+                  dose['fields']['route_of_exposure'], dose['fields']['group_size'],
+                  [_outcome(outcome['fields']['outcome_type'], outcome['fields']['custom_outcome_type'],
+                            outcome['fields']['value'], outcome['fields']['observation_time'])
+                   for outcome in dose['outcomes']])
+            for dose in animal['dose_groups']
+        ]
+        animals.append([_text(fields['species']), _text(fields['sex']), _text(fields['strain']), sorted(doses)])
+    return _hash(tree['toxin_name'], tree['study']['publication_reference'], animals)
+
+
+def content_hashes(study_ids):
+    """{study_id: content_hash} computed from the stored trees, with one query per level."""
+    study_ids = list(study_ids)
+    if not study_ids:
+        return {}
+    outcomes = {}
+    for dose_group_id, *fields in db.session.execute(
+        select(Outcome.dose_group_id, Outcome.outcome_type, Outcome.custom_outcome_type,
+               Outcome.value, Outcome.observation_time)
+        .join(DoseGroup, DoseGroup.id == Outcome.dose_group_id)
+        .join(AnimalModel, AnimalModel.id == DoseGroup.animal_model_id)
+        .where(AnimalModel.study_id.in_(study_ids))
+    ):
+        outcomes.setdefault(dose_group_id, []).append(_outcome(*fields))
+
+    doses = {}
+    for dose_group_id, animal_model_id, *fields in db.session.execute(
+        select(DoseGroup.id, DoseGroup.animal_model_id, DoseGroup.dose_value, DoseGroup.dose_unit,
+               DoseGroup.custom_dose_unit, DoseGroup.route_of_exposure, DoseGroup.group_size)
+        .join(AnimalModel, AnimalModel.id == DoseGroup.animal_model_id)
+        .where(AnimalModel.study_id.in_(study_ids))
+    ):
+        doses.setdefault(animal_model_id, []).append(_dose(*fields, outcomes.get(dose_group_id, [])))
+
+    animals = {}
+    for animal_model_id, study_id, species, sex, strain in db.session.execute(
+        select(AnimalModel.id, AnimalModel.study_id, AnimalModel.species, AnimalModel.sex, AnimalModel.strain)
+        .where(AnimalModel.study_id.in_(study_ids))
+    ):
+        animals.setdefault(study_id, []).append(
+            [_text(species), _text(sex), _text(strain), sorted(doses.get(animal_model_id, []))])
+
+    return {
+        study_id: _hash(toxin_key, publication_reference, animals.get(study_id, []))
+        for study_id, toxin_key, publication_reference in db.session.execute(
+            select(Study.id, Toxin.name_key, Study.publication_reference)
+            .join(Toxin, Toxin.id == Study.toxin_id)
+            .where(Study.id.in_(study_ids))
+        )
+    }
+
+
+def refresh_content_hashes(study_ids):
+    """
+    Recompute content_hash for the given studies, in the caller's
+    transaction. Called from changes.studies_changed, so the wizard steps
+    keep it current as children are added.
+    """
+    hashes = content_hashes(study_ids)
+    if hashes:
+        study = Study.__table__
+        db.session.execute(
+            study.update().where(study.c.id == bindparam('study_id')).values(content_hash=bindparam('hash')),
+            [{'study_id': study_id, 'hash': value} for study_id, value in hashes.items()]
+        )
+
+
+def find_duplicate(content_hash, exclude_id=None):
+    """Id of the oldest other study with this content_hash, or None."""
+    if content_hash is None:
+        return None
+    query = db.session.query(Study.id).filter(Study.content_hash == content_hash)
+    if exclude_id is not None:
+        query = query.filter(Study.id != exclude_id)
+    row = query.order_by(Study.id).first()
+    return row[0] if row else None
+
+
+def rehash_studies(batch_size=500, progress=None):
+    """Recompute every study's content_hash, committing batch_size studies at a time."""
+    last_id, count = 0, 0
+    while True:
+        study_ids = [row[0] for row in db.session.query(Study.id).filter(Study.id > last_id)
+                     .order_by(Study.id).limit(batch_size)]
+        if not study_ids:
+            return count
+        refresh_content_hashes(study_ids)
+        db.session.commit()
+        last_id = study_ids[-1]
+        count += len(study_ids)
+        if progress:
+            progress(count)
+
+
+def duplicate_clusters():
+    """Lists of (id, name, toxin name) of studies sharing a content_hash, oldest first in each."""
+    shared = (
+        select(Study.content_hash)
+        .where(Study.content_hash.isnot(None))
+        .group_by(Study.content_hash)
+        .having(func.count() > 1)
+        .subquery()
+    )
+    clusters = {}
+    for content_hash, study_id, name, toxin_name in db.session.execute(
+        select(Study.content_hash, Study.id, Study.name, Toxin.name)
+        .join(Toxin, Toxin.id == Study.toxin_id)
+        .where(Study.content_hash.in_(select(shared.c.content_hash)))
+        .order_by(Study.content_hash, Study.id)
+    ):
+        clusters.setdefault(content_hash, []).append((study_id, name, toxin_name))
+    return sorted(clusters.values(), key=lambda cluster: cluster[0][0])
@@ -0,0 +1,256 @@
+import csv
+from datetime import datetime
+from io import StringIO
+
+from sqlalchemy import literal, select, union_all
+
+from models import (db, LongFormatRow, AdditionalMetadata, AnimalModel, DoseGroup, Outcome, Toxin,
+                    normalize_toxin_name)
+
+# Column layout shared by every long-format CSV export
+EXPORT_HEADER = [
+    'Study ID', 'Study Name', 'Toxin', 'Date Conducted', 'Author', 'Contributor',
+    'Animal Species', 'Strain', 'Sex', 'Age', 'Weight',
+    'Dose Value', 'Dose Unit', 'Route of Exposure',
+    'Group Size', 'Exposure Duration',
+    'Outcome Type', 'Outcome Value', 'Observation Time', 'Notes'
+]
+
+# Fact table columns in EXPORT_HEADER order
+EXPORT_COLUMNS = [
+    LongFormatRow.study_id, LongFormatRow.study_name, LongFormatRow.toxin_name,
+    LongFormatRow.date_conducted, LongFormatRow.author, LongFormatRow.contributor_name,
+    LongFormatRow.species, LongFormatRow.strain, LongFormatRow.sex, LongFormatRow.age,
+    LongFormatRow.weight,
+    LongFormatRow.dose_value, LongFormatRow.dose_unit, LongFormatRow.route_of_exposure,
+    LongFormatRow.group_size, LongFormatRow.exposure_duration,
+    LongFormatRow.outcome_type, LongFormatRow.value, LongFormatRow.observation_time, LongFormatRow.notes
+]
+
+# Display order; matches the ix_long_format_study_order index
+STUDY_ORDER = [
+    LongFormatRow.study_id, LongFormatRow.animal_model_id,
+    LongFormatRow.dose_group_id, LongFormatRow.outcome_id
+]
+
+# Rows fetched per round trip by the exports
+EXPORT_BATCH_SIZE = 1000
+
+
+def study_rows(study_id):
+    """Export rows of one study: a single range scan of the fact table."""
+    return (
+        db.session.query(*EXPORT_COLUMNS)
+        .filter(LongFormatRow.study_id == study_id)
+        .order_by(*STUDY_ORDER)
+        .execution_options(stream_results=True)
+        .yield_per(EXPORT_BATCH_SIZE)
+    )
+
+
+def parse_export_filters(args):
+    """
+    long_format_query keyword arguments from request-style string params
+    (toxin, species, route, date_from / date_to as YYYY-MM-DD, dose_min /
+    dose_max, value_min / value_max). Raises ValueError naming the bad one.
+    """
+    filters = {param: args.get(param) or None for param in ('toxin', 'species', 'route')}
+    for param in ('date_from', 'date_to'):
+        value = args.get(param, '')
+        if value:
+            try:
+                filters[param] = datetime.strptime(value, '%Y-%m-%d').date()
+            except (TypeError, ValueError):
+                raise ValueError(f'Invalid {param}. Please use YYYY-MM-DD.')
+    for param in ('dose_min', 'dose_max', 'value_min', 'value_max'):
+        value = args.get(param, '')
+        if value not in ('', None):
+            try:
+                filters[param] = float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f'Invalid {param}. Please use a number.')
+    return filters
+
+
+def toxin_condition(name, toxin_id=LongFormatRow.toxin_id):
+    """
+    Fact rows (or, given `toxin_id=Study.toxin_id`, studies) of the toxin
+    called `name`, ignoring case and surrounding whitespace as find_toxin
+    does. The name is resolved through the unique name_key index inside the
+    same statement, then matched with the toxin_id index; shared by the
+    exports, the outcome browser and the JSON API so all match alike.
+    """
+    toxin = select(Toxin.id).where(Toxin.name_key == normalize_toxin_name(name))
+    return toxin_id == toxin.scalar_subquery()
+
+
+def long_format_query(toxin=None, species=None, route=None, date_from=None, date_to=None,
+                      dose_min=None, dose_max=None, value_min=None, value_max=None):
+    """
+    Long-format rows across the whole database, read from the LongFormatRow
+    fact table in EXPORT_HEADER order, without any joins.
+
+    Dose bounds are in ppm-equivalent (dose_ppm) and value bounds apply to
+    the parsed value_numeric; both are indexed, so e.g. route='inhalation',
+    dose_min=10, dose_max=100 is one index range scan.
+
+    Rows are fetched in EXPORT_BATCH_SIZE batches over a streaming cursor,
+    so no ORM objects are built and memory use does not grow with the
+    size of the result.
+    """
+    query = db.session.query(*EXPORT_COLUMNS)
+
+    if toxin:
+        query = query.filter(toxin_condition(toxin))
+    if species:
+        query = query.filter(LongFormatRow.species_key == species.lower())
+    if route:
+        query = query.filter(LongFormatRow.route_of_exposure == route)
+    if date_from:
+        query = query.filter(LongFormatRow.date_conducted >= date_from)
+    if date_to:
+        query = query.filter(LongFormatRow.date_conducted <= date_to)
+    if dose_min is not None:
+        query = query.filter(LongFormatRow.dose_ppm >= dose_min)
+    if dose_max is not None:
+        query = query.filter(LongFormatRow.dose_ppm <= dose_max)
+    if value_min is not None:
+        query = query.filter(LongFormatRow.value_numeric >= value_min)
+    if value_max is not None:
+        query = query.filter(LongFormatRow.value_numeric <= value_max)
+
+    return (
+        query
+        .order_by(*STUDY_ORDER)
+        .execution_options(stream_results=True)
+        .yield_per(EXPORT_BATCH_SIZE)
+    )
+
+
+# Metadata entity types, outermost first; wide-format columns are prefixed
+# with them (study.<field>, animal_model.<field>, …)
+METADATA_LEVELS = ['study', 'animal_model', 'dose_group', 'outcome']
+
+
+def wide_format(rows, fields=None):
+    """
+    Turn a long-format query (study_rows or long_format_query) into
+    (header, rows) for the wide layout: EXPORT_HEADER followed by one
+    column per custom metadata field, e.g. 'dose_group.Vehicle'.
+
+    The field columns are discovered with one aggregate query, unless
+    `fields` (from metadata_fields) is given. The values come from one
+    metadata scan sorted in the same study → animal model → dose group →
+    outcome order as the fact rows, and the two streams are merged as they
+    go. No per-row queries are made, and only the metadata of the current
+    study, animal model, dose group and outcome is held in memory.
+    """
+    if fields is None:
+        fields = metadata_fields(rows)
+    columns = {field: i for i, field in enumerate(fields)}
+
+    positioned = _positioned_metadata(_study_ids(rows)).subquery()
+    metadata = iter(db.session.execute(
+        select(positioned)
+        .order_by(positioned.c.study_id, positioned.c.animal_model_id, positioned.c.dose_group_id,
+                  positioned.c.outcome_id, positioned.c.id)
+        .execution_options(stream_results=True)
+    ))
+    rows = rows.add_columns(LongFormatRow.animal_model_id, LongFormatRow.dose_group_id,
+                            LongFormatRow.outcome_id)
+    return wide_header(fields), _merge_metadata(rows, metadata, columns)
+
+
+def metadata_fields(rows):
+    """(entity_type, field_name) pairs used by the studies in a long-format query, in column order."""
+    positioned = _positioned_metadata(_study_ids(rows)).subquery()
+    fields = db.session.execute(
+        select(positioned.c.entity_type, positioned.c.field_name)
+        .group_by(positioned.c.entity_type, positioned.c.field_name)
+    ).all()
+    return sorted(((entity_type, name) for entity_type, name in fields),
+                  key=lambda field: (METADATA_LEVELS.index(field[0]), field[1]))
+
+
+def wide_header(fields):
+    return EXPORT_HEADER + [f'{entity_type}.{name}' for entity_type, name in fields]
+
+
+def _study_ids(rows):
+    return select(rows.with_entities(LongFormatRow.study_id).order_by(None).distinct().subquery())
+
+
+def _positioned_metadata(study_ids):
+    """
+    Metadata of the studies in `study_ids` (a select) and their
+    descendants, each with the (study, animal model, dose group, outcome)
+    position of its entity; levels above the entity are 0, which sorts
+    before every real id.
+    """
+    zero = literal(0)
+    meta = [AdditionalMetadata.id, AdditionalMetadata.entity_type,
+            AdditionalMetadata.field_name, AdditionalMetadata.field_value]
+    return union_all(
+        select(AdditionalMetadata.entity_id.label('study_id'), zero.label('animal_model_id'),
+               zero.label('dose_group_id'), zero.label('outcome_id'), *meta)
+        .where(AdditionalMetadata.entity_type == 'study', AdditionalMetadata.entity_id.in_(study_ids)),
+        select(AnimalModel.study_id, AnimalModel.id, zero, zero, *meta)
+        .join(AnimalModel, AnimalModel.id == AdditionalMetadata.entity_id)
+        .where(AdditionalMetadata.entity_type == 'animal_model', AnimalModel.study_id.in_(study_ids)),
+        select(AnimalModel.study_id, AnimalModel.id, DoseGroup.id, zero, *meta)
+        .join(DoseGroup, DoseGroup.id == AdditionalMetadata.entity_id)
+        .join(AnimalModel, AnimalModel.id == DoseGroup.animal_model_id)
+        .where(AdditionalMetadata.entity_type == 'dose_group', AnimalModel.study_id.in_(study_ids)),
+        select(AnimalModel.study_id, AnimalModel.id, DoseGroup.id, Outcome.id, *meta)
+        .join(Outcome, Outcome.id == AdditionalMetadata.entity_id)
+        .join(DoseGroup, DoseGroup.id == Outcome.dose_group_id)
+        .join(AnimalModel, AnimalModel.id == DoseGroup.animal_model_id)
+        .where(AdditionalMetadata.entity_type == 'outcome', AnimalModel.study_id.in_(study_ids)),
+    )
+
+
+def _merge_metadata(rows, metadata, columns):
+    width = len(EXPORT_COLUMNS)
+    # Per level: (position the values belong to, {column index: value})
+    current = {level: (None, {}) for level in METADATA_LEVELS}
+    pending = next(metadata, None)
+
+    for row in rows:
+        position = (row[0], *row[width:])  # study, animal model, dose group, outcome ids
+        # Take in every metadata row positioned at or before this fact row;
+        # entries of entities without fact rows are simply overwritten
+        while pending is not None and tuple(pending)[:4] <= position:
+            level = METADATA_LEVELS.index(pending.entity_type)
+            owner = tuple(pending)[:level + 1]
+            if current[pending.entity_type][0] != owner:
+                current[pending.entity_type] = (owner, {})
+            current[pending.entity_type][1][columns[(pending.entity_type, pending.field_name)]] = \
+                pending.field_value
+            pending = next(metadata, None)
+
+        extra = [''] * len(columns)
+        for level, entity_type in enumerate(METADATA_LEVELS):
+            owner, values = current[entity_type]
+            if owner == position[:level + 1]:
+                for column, value in values.items():
+                    extra[column] = value
+        yield list(row[:width]) + extra
+
+
+def stream_csv(rows, header=EXPORT_HEADER, chunk_size=EXPORT_BATCH_SIZE):
+    """Encode rows as CSV, yielding one text chunk per chunk_size rows."""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+
+    yield buffer.getvalue()
@@ -0,0 +1,182 @@
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import delete, func, insert, literal, select, union_all
+
+from models import db, FacetCount, LongFormatRow
+from exports import toxin_condition
+
+# Facet name → fact table column. Outcomes are counted per value, so the
+# sidebar shows how many outcomes each choice would leave.
+FACETS = {
+    'toxin': LongFormatRow.toxin_name,
+    'species': LongFormatRow.species_key,
+    'sex': LongFormatRow.sex,
+    'route': LongFormatRow.route_of_exposure,
+    'dose_unit': LongFormatRow.dose_unit,
+    'outcome_type': LongFormatRow.outcome_type,
+}
+
+# Most frequent values listed per facet
+FACET_VALUES_LIMIT = 50
+
+# Columns returned for each matching outcome
+OUTCOME_COLUMNS = [
+    LongFormatRow.outcome_id, LongFormatRow.study_id, LongFormatRow.study_name,
+    LongFormatRow.toxin_name, LongFormatRow.date_conducted,
+    LongFormatRow.species, LongFormatRow.strain, LongFormatRow.sex,
+    LongFormatRow.dose_value, LongFormatRow.dose_unit, LongFormatRow.dose_ppm,
+    LongFormatRow.route_of_exposure, LongFormatRow.group_size, LongFormatRow.exposure_duration,
+    LongFormatRow.outcome_type, LongFormatRow.value, LongFormatRow.value_numeric,
+    LongFormatRow.observation_time,
+]
+
+
+def parse_outcome_filters(args):
+    """
+    Filters for outcome_query from request args: the FACETS names plus
+    date_from / date_to (YYYY-MM-DD). Raises ValueError for a bad date.
+    """
+    filters = {facet: args.get(facet) or None for facet in FACETS}
+    for param in ('date_from', 'date_to'):
+        value = args.get(param, '')
+        if value:
+            try:
+                filters[param] = datetime.strptime(value, '%Y-%m-%d').date()
+            except ValueError:
+                raise ValueError(f'Invalid {param}. Please use YYYY-MM-DD.')
+    return filters
+
+
+def _conditions(filters, skip=None):
+    """WHERE clauses for `filters` (see outcome_query), leaving out facet `skip`."""
+    conditions = []
+    for facet, value in filters.items():
+        if facet == skip or value in (None, ''):
+            continue
+        if facet == 'toxin':
+            conditions.append(toxin_condition(value))
+        elif facet == 'species':
+            conditions.append(LongFormatRow.species_key == value.lower())
+        elif facet == 'date_from':
+            conditions.append(LongFormatRow.date_conducted >= value)
+        elif facet == 'date_to':
+            conditions.append(LongFormatRow.date_conducted <= value)
+        else:
+            conditions.append(FACETS[facet] == value)
+    return conditions
+
+
+def outcome_query(filters, after=None):
+    """
+    Matching outcomes in outcome id order, for keyset paging with `after`.
+    `filters` maps facet names (and date_from / date_to) to values; empty
+    values are ignored.
+    """
+    query = db.session.query(*OUTCOME_COLUMNS).filter(*_conditions(filters))
+    if after is not None:
+        query = query.filter(LongFormatRow.outcome_id > after)
+    return query.order_by(LongFormatRow.outcome_id)
+
+
+def outcome_count(filters):
+    conditions = _conditions(filters)
+    if not conditions:
+        # Every fact row has a species, so the species counts add up to all outcomes
+        return (db.session.query(func.coalesce(func.sum(FacetCount.outcomes), 0))
+                .filter(FacetCount.facet == 'species').scalar())
+    return db.session.query(func.count(LongFormatRow.outcome_id)).filter(*conditions).scalar()
+
+
+def facet_counts(filters):
+    """
+    {facet: [(value, outcomes), ...]}, most frequent first.
+
+    Each facet is counted under every filter except its own, so the values
+    it lists are the alternatives to the current choice. Facets that no
+    other filter narrows are read from the maintained facet_count table in
+    one query instead of grouping the fact table.
+    """
+    counts = {}
+    unfiltered = []
+    for facet, column in FACETS.items():
+        conditions = _conditions(filters, skip=facet)
+        if not conditions:
+            unfiltered.append(facet)
+            continue
+        counts[facet] = (
+            db.session.query(column, func.count())
+            .filter(column.isnot(None), *conditions)
+            .group_by(column)
+            .order_by(func.count().desc(), column)
+            .limit(FACET_VALUES_LIMIT)
+            .all()
+        )
+
+    if unfiltered:
+        maintained = {facet: [] for facet in unfiltered}
+        for facet, value, outcomes in (
+            db.session.query(FacetCount.facet, FacetCount.value, FacetCount.outcomes)
+            .filter(FacetCount.facet.in_(unfiltered))
+            .order_by(FacetCount.facet, FacetCount.outcomes.desc(), FacetCount.value)
+        ):
+            if len(maintained[facet]) < FACET_VALUES_LIMIT:
+                maintained[facet].append((value, outcomes))
+        counts.update(maintained)
+    return {facet: counts[facet] for facet in FACETS}
+
+
+# ── Maintenance (called by facts.py) ────────────────────────────────────────
+
+def _facet_totals(study_ids=None):
+    """(facet, value, outcomes) over the whole fact table or some studies, as one statement."""
+    selects = []
+    for facet, column in FACETS.items():
+        stmt = (
+            select(literal(facet).label('facet'), column.label('value'), func.count().label('outcomes'))
+            .where(column.isnot(None))
+            .group_by(column)
+        )
+        if study_ids is not None:
+            stmt = stmt.where(LongFormatRow.study_id.in_(study_ids))
+        selects.append(stmt)
+    return union_all(*selects)
+
+
+def facet_snapshot(study_ids):
+    """Facet counts contributed by these studies' current fact rows."""
+    return Counter({(facet, value): outcomes
+                    for facet, value, outcomes in db.session.execute(_facet_totals(study_ids))})
+
+
+def apply_facet_changes(before, after):
+    """
+    Add the difference between two facet_snapshot results to facet_count,
+    in the caller's transaction. Values whose count did not change are not
+    written; the rest are written in key order, so concurrent writers on
+    Postgres lock facet rows in the same order.
+    """
+    deltas = []
+    for facet, value in sorted(before.keys() | after.keys()):
+        change = after[(facet, value)] - before[(facet, value)]
+        if change:
+            deltas.append({'facet': facet, 'value': value, 'outcomes': change})
+    if not deltas:
+        return
+
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    table = FacetCount.__table__
+    stmt = upsert(table)
+    stmt = stmt.on_conflict_do_update(index_elements=[table.c.facet, table.c.value],
+                                      set_={'outcomes': table.c.outcomes + stmt.excluded.outcomes})
+    db.session.execute(stmt, deltas)
+    db.session.execute(delete(FacetCount).where(FacetCount.outcomes <= 0))
+
+
+def rebuild_facet_counts():
+    """Recount every facet from the fact table (after a full rebuild)."""
+    db.session.execute(delete(FacetCount))
+    db.session.execute(insert(FacetCount).from_select(['facet', 'value', 'outcomes'], _facet_totals()))
@@ -0,0 +1,95 @@
+from sqlalchemy import case, delete, insert, select
+
+from models import db, Toxin, Study, AnimalModel, DoseGroup, Outcome, LongFormatRow
+from facets import apply_facet_changes, facet_snapshot, rebuild_facet_counts
+
+# LongFormatRow column → expression over the normalized tables
+FACT_COLUMNS = [
+    ('outcome_id', Outcome.id),
+    ('study_id', Study.id),
+    ('toxin_id', Toxin.id),
+    ('animal_model_id', AnimalModel.id),
+    ('dose_group_id', DoseGroup.id),
+    ('study_name', Study.name),
+    ('toxin_name', Toxin.name),
+    ('date_conducted', Study.date_conducted),
+    ('author', Study.author),
+    ('contributor_name', Study.contributor_name),
+    ('species', AnimalModel.species),
+    ('species_key', db.func.lower(AnimalModel.species)),
+    ('strain', AnimalModel.strain),
+    ('sex', AnimalModel.sex),
+    ('age', AnimalModel.age),
+    ('weight', AnimalModel.weight),
+    ('dose_value', DoseGroup.dose_value),
+    ('dose_unit', case((DoseGroup.dose_unit == 'other', DoseGroup.custom_dose_unit),
+                       else_=DoseGroup.dose_unit)),
+    ('dose_ppm', DoseGroup.dose_ppm),
+    ('route_of_exposure', DoseGroup.route_of_exposure),
+    ('group_size', DoseGroup.group_size),
+    ('exposure_duration', DoseGroup.exposure_duration),
+    ('outcome_type', case((Outcome.outcome_type == 'other', Outcome.custom_outcome_type),
+                          else_=Outcome.outcome_type)),
+    ('value', Outcome.value),
+    ('value_numeric', Outcome.value_numeric),
+    ('value_parse_status', Outcome.value_parse_status),
+    ('observation_time', Outcome.observation_time),
+    ('notes', Outcome.notes),
+]
+
+
+def _fact_select():
+    return (
+        select(*[expression for _, expression in FACT_COLUMNS])
+        .select_from(Study)
+        .join(Toxin, Study.toxin_id == Toxin.id)
+        .join(AnimalModel, AnimalModel.study_id == Study.id)
+        .join(DoseGroup, DoseGroup.animal_model_id == AnimalModel.id)
+        .join(Outcome, Outcome.dose_group_id == DoseGroup.id)
+    )
+
+
+def _insert_facts(source):
+    return insert(LongFormatRow).from_select([name for name, _ in FACT_COLUMNS], source)
+
+
+def refresh_long_format(study_ids):
+    """
+    Re-materialize the fact rows of the given studies: one DELETE and one
+    INSERT … SELECT each, both driven by the study_id index, plus the
+    facet_count adjustment for the rows that changed. Called from
+    changes.studies_changed, so it runs in the write's own transaction.
+    """
+    study_ids = list(study_ids)
+    if not study_ids:
+        return
+    before = facet_snapshot(study_ids)
+    db.session.execute(delete(LongFormatRow).where(LongFormatRow.study_id.in_(study_ids)))
+    db.session.execute(_insert_facts(_fact_select().where(Study.id.in_(study_ids))))
+    apply_facet_changes(before, facet_snapshot(study_ids))
+
+
+def rebuild_long_format(batch_size=500, progress=None):
+    """
+    Rebuild the whole fact table, committing batch_size studies at a time,
+    then recount facet_count from it.
+    """
+    db.session.execute(delete(LongFormatRow))
+    db.session.commit()
+
+    last_id = 0
+    rebuilt = 0
+    while True:
+        study_ids = [row[0] for row in
+                     db.session.query(Study.id).filter(Study.id > last_id)
+                     .order_by(Study.id).limit(batch_size)]
+        if not study_ids:
+            rebuild_facet_counts()
+            db.session.commit()
+            return rebuilt
+        db.session.execute(_insert_facts(_fact_select().where(Study.id.in_(study_ids))))
+        db.session.commit()
+        rebuilt += len(study_ids)
+        last_id = study_ids[-1]
+        if progress:
+            progress(rebuilt)
@@ -0,0 +1,286 @@
+import csv
+from datetime import datetime
+
+from models import db, Toxin, Study, AnimalModel, DoseGroup, Outcome, normalize_toxin_name
+from exports import EXPORT_HEADER
+from changes import studies_changed
+from units import dose_to_ppm, parse_outcome_value
+from vocabulary import SEX_CHOICES, DOSE_UNIT_CHOICES, OUTCOME_TYPE_CHOICES, WORK_EMAIL_RE
+
+# Rows validated and committed per transaction
+IMPORT_CHUNK_SIZE = 5000
+
+SEXES = {value for value, _ in SEX_CHOICES}
+DOSE_UNITS = {value for value, _ in DOSE_UNIT_CHOICES if value != 'other'}
+OUTCOME_TYPES = {value for value, _ in OUTCOME_TYPE_CHOICES if value != 'other'}
+
+
+class CSVImportError(ValueError):
+    """The file as a whole cannot be imported (bad header, bad contributor)."""
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows_read = 0
+        self.toxins_created = 0
+        self.studies_created = 0
+        self.animal_models_created = 0
+        self.dose_groups_created = 0
+        self.outcomes_created = 0
+        self.errors = []  # (line number, message)
+
+    def __repr__(self):
+        return (f"<ImportReport rows={self.rows_read} outcomes={self.outcomes_created} "
+                f"errors={len(self.errors)}>")
+
+
+def import_long_format(fileobj, contributor_email, contributor_name=None,
+                       chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """
+    Import a long-format CSV in the exact layout produced by export_study.
+
+    Rows are validated a chunk at a time with the same rules as the wizard;
+    invalid rows are skipped and reported in ImportReport.errors. Toxins,
+    studies, animal models and dose groups are de-duplicated in memory
+    across the whole file, and each chunk is written in one transaction:
+    new parent rows are bulk-saved to obtain their ids, and outcomes go in
+    as a single executemany INSERT. `progress(report)` is called after each
+    committed chunk.
+    """
+    if not WORK_EMAIL_RE.match(contributor_email or ''):
+        raise CSVImportError('Please use your university or work e-mail address.')
+
+    reader = csv.reader(fileobj)
+    header = next(reader, None)
+    if header != EXPORT_HEADER:
+        raise CSVImportError('Unexpected columns; the file must use the export_study CSV layout.')
+
+    report = ImportReport()
+    state = {
+        'toxins': {},         # toxin name → id
+        'molecular_weights': {},  # toxin name → g/mol (None if unknown)
+        'studies': {},        # (source study id, name) → id
+        'animal_models': {},  # study key + animal columns → id
+        'dose_groups': {},    # animal key + dose columns → id
+    }
+
+    chunk = []
+    for row in reader:
+        chunk.append((reader.line_num, row))
+        if len(chunk) >= chunk_size:
+            _import_chunk(chunk, state, report, contributor_email, contributor_name)
+            chunk = []
+            if progress:
+                progress(report)
+
+    if chunk:
+        _import_chunk(chunk, state, report, contributor_email, contributor_name)
+        if progress:
+            progress(report)
+
+    return report
+
+
+def validate_rows(chunk):
+    """
+    Apply the wizard's checks to a whole chunk of (line number, row) pairs.
+
+    Returns (records, errors): one parsed dict per valid row and a list of
+    (line number, message) for the rest.
+    """
+    records, errors = [], []
+
+    for line, row in chunk:
+        if len(row) != len(EXPORT_HEADER):
+            errors.append((line, f'Expected {len(EXPORT_HEADER)} columns, found {len(row)}'))
+            continue
+
+        (study_id, study_name, toxin_name, date_conducted, author, contributor,
+         species, strain, sex, age, weight,
+         dose_value, dose_unit, route, group_size, exposure_duration,
+         outcome_type, value, observation_time, notes) = [cell.strip() for cell in row]
+
+        try:
+            if not study_name:
+                raise ValueError('Study name is required')
+            if not toxin_name:
+                raise ValueError('Toxin name is required')
+            if not species:
+                raise ValueError('Species is required')
+            if sex not in SEXES:
+                raise ValueError(f"Sex must be one of {', '.join(sorted(SEXES))}")
+
+            date_value = None
+            if date_conducted:
+                try:
+                    date_value = datetime.strptime(date_conducted, '%Y-%m-%d').date()
+                except ValueError:
+                    raise ValueError('Invalid date format. Please use YYYY-MM-DD.')
+
+            dose = float(dose_value)
+            if dose < 0:
+                raise ValueError('Dose value must be non-negative')
+
+            size = int(group_size)
+            if size <= 0:
+                raise ValueError('Group size must be a positive integer')
+
+            if not dose_unit:
+                raise ValueError('Dose unit is required')
+            if len(route) > 30:
+                raise ValueError('Route of exposure must be at most 30 characters')
+
+            if not outcome_type:
+                raise ValueError('Outcome type is required')
+            if not value:
+                raise ValueError('Outcome value is required')
+            if outcome_type == 'cancer':
+                tumor_count = int(value)
+                if tumor_count < 0:
+                    raise ValueError('Tumor count must be non-negative')
+
+        except ValueError as e:
+            errors.append((line, str(e)))
+            continue
+
+        value_numeric, value_parse_status = parse_outcome_value(value)
+        study_key = (study_id, study_name)
+        animal_key = study_key + (species, strain, sex, age, weight)
+        dose_key = animal_key + (dose, dose_unit, route, size, exposure_duration)
+
+        records.append({
+            'toxin_name': toxin_name,
+            'study_key': study_key,
+            'study': {
+                'name': study_name,
+                'date_conducted': date_value,
+                'author': author,
+                'contributor_name': contributor,
+            },
+            'animal_key': animal_key,
+            'animal_model': {
+                'species': species,
+                'strain': strain,
+                'sex': sex,
+                'age': age,
+                'weight': weight,
+            },
+            'dose_key': dose_key,
+            'dose_group': {
+                'dose_value': dose,
+                'dose_unit': dose_unit if dose_unit in DOSE_UNITS else 'other',
+                'custom_dose_unit': None if dose_unit in DOSE_UNITS else dose_unit,
+                'group_size': size,
+                'exposure_duration': exposure_duration,
+                'route_of_exposure': route or 'unknown',
+            },
+            'outcome': {
+                'outcome_type': outcome_type if outcome_type in OUTCOME_TYPES else 'other',
+                'custom_outcome_type': None if outcome_type in OUTCOME_TYPES else outcome_type,
+                'value': value,
+                'observation_time': observation_time,
+                'notes': notes,
+                'value_numeric': value_numeric,
+                'value_parse_status': value_parse_status,
+            },
+        })
+
+    return records, errors
+
+
+def _import_chunk(chunk, state, report, contributor_email, contributor_name):
+    report.rows_read += len(chunk)
+    records, errors = validate_rows(chunk)
+    report.errors.extend(errors)
+    if not records:
+        return
+
+    try:
+        # ── Toxins: look up every unseen name in one query, create the rest ──
+        toxin_ids = state['toxins']
+        unseen = {r['toxin_name'] for r in records} - toxin_ids.keys()
+        if unseen:
+            # Matched ignoring case, as find_toxin does, through the name_key index
+            by_key = {}
+            for name in sorted(unseen):
+                by_key.setdefault(normalize_toxin_name(name), []).append(name)
+            for toxin in Toxin.query.filter(Toxin.name_key.in_(by_key)):
+                for name in by_key.pop(toxin.name_key):
+                    toxin_ids[name] = toxin.id
+                    state['molecular_weights'][name] = toxin.molecular_weight
+            # One new toxin per key, named as first spelled in sorted order
+            new_toxins = [Toxin(name=names[0], description='') for names in by_key.values()]
+            _bulk_save(new_toxins, toxin_ids, lambda t: t.name)
+            for names in by_key.values():
+                for name in names[1:]:
+                    toxin_ids[name] = toxin_ids[names[0]]
+            report.toxins_created += len(new_toxins)
+
+        # ── Studies, animal models and dose groups, one level at a time ─────
+        new_studies = _new_parents(
+            records, state['studies'], 'study_key',
+            lambda r: Study(toxin_id=toxin_ids[r['toxin_name']],
+                            name=r['study']['name'],
+                            date_conducted=r['study']['date_conducted'],
+                            author=r['study']['author'],
+                            contributor_name=r['study']['contributor_name'] or contributor_name,
+                            contributor_email=contributor_email)
+        )
+        _bulk_save(new_studies.values(), state['studies'], _key_of(new_studies))
+        report.studies_created += len(new_studies)
+
+        new_animals = _new_parents(
+            records, state['animal_models'], 'animal_key',
+            lambda r: AnimalModel(study_id=state['studies'][r['study_key']], **r['animal_model'])
+        )
+        _bulk_save(new_animals.values(), state['animal_models'], _key_of(new_animals))
+        report.animal_models_created += len(new_animals)
+
+        new_doses = _new_parents(
+            records, state['dose_groups'], 'dose_key',
+            lambda r: DoseGroup(
+                animal_model_id=state['animal_models'][r['animal_key']],
+                dose_ppm=dose_to_ppm(r['dose_group']['dose_value'], r['dose_group']['dose_unit'],
+                                     r['dose_group']['custom_dose_unit'],
+                                     state['molecular_weights'].get(r['toxin_name'])),
+                **r['dose_group']
+            )
+        )
+        _bulk_save(new_doses.values(), state['dose_groups'], _key_of(new_doses))
+        report.dose_groups_created += len(new_doses)
+
+        # ── Outcomes: no ids needed, so one executemany INSERT ──────────────
+        db.session.execute(
+            Outcome.__table__.insert(),
+            [dict(r['outcome'], dose_group_id=state['dose_groups'][r['dose_key']]) for r in records]
+        )
+        report.outcomes_created += len(records)
+
+        studies_changed({state['studies'][r['study_key']] for r in records})
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def _new_parents(records, known, key_name, build):
+    """Build one new object per key not seen before, preserving file order."""
+    new = {}
+    for record in records:
+        key = record[key_name]
+        if key not in known and key not in new:
+            new[key] = build(record)
+    return new
+
+
+def _key_of(new):
+    by_object = {id(obj): key for key, obj in new.items()}
+    return lambda obj: by_object[id(obj)]
+
+
+def _bulk_save(objects, ids, key):
+    objects = list(objects)
+    if objects:
+        db.session.bulk_save_objects(objects, return_defaults=True)
+        for obj in objects:
+            ids[key(obj)] = obj.id
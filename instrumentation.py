@@ -0,0 +1,163 @@
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+
+from models import db
+
+# Per-request timing, enabled with INSTRUMENTATION=1. Every request gets a
+# Server-Timing header (db / render / total), slow requests and slow queries
+# are logged with their SQL, and per-endpoint totals are kept for /metrics.
+#
+# Note that for streamed responses (the CSV exports) the numbers cover the
+# work done before the body starts streaming, not the whole download.
+
+SQL_LOG_LENGTH = 2000
+
+
+class RequestMetrics:
+    """Per-endpoint aggregates for one worker process."""
+
+    def __init__(self):
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, total_ms, timing, slow):
+        with self._lock:
+            stats = self._endpoints.setdefault(endpoint, {
+                'requests': 0, 'slow_requests': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'queries': 0, 'lazy_loads': 0, 'sql_ms': 0.0, 'render_ms': 0.0,
+            })
+            stats['requests'] += 1
+            stats['slow_requests'] += slow
+            stats['total_ms'] += total_ms
+            stats['max_ms'] = max(stats['max_ms'], total_ms)
+            stats['queries'] += timing['queries']
+            stats['lazy_loads'] += timing['lazy_loads']
+            stats['sql_ms'] += timing['sql_ms']
+            stats['render_ms'] += timing['render_ms']
+
+    def stats(self):
+        with self._lock:
+            result = {}
+            for endpoint, stats in sorted(self._endpoints.items()):
+                n = stats['requests']
+                result[endpoint] = {
+                    'requests': n,
+                    'slow_requests': stats['slow_requests'],
+                    'mean_ms': round(stats['total_ms'] / n, 3),
+                    'max_ms': round(stats['max_ms'], 3),
+                    'mean_queries': round(stats['queries'] / n, 2),
+                    'mean_lazy_loads': round(stats['lazy_loads'] / n, 2),
+                    'mean_sql_ms': round(stats['sql_ms'] / n, 3),
+                    'mean_render_ms': round(stats['render_ms'] / n, 3),
+                }
+            return result
+
+
+def init_instrumentation(app):
+    """
+    Hook SQLAlchemy engine / session events and Flask request and template
+    signals into `app` when INSTRUMENTATION is set; otherwise do nothing.
+    """
+    if not app.config['INSTRUMENTATION']:
+        return
+
+    metrics = RequestMetrics()
+    app.extensions['request_metrics'] = metrics
+    slow_request_ms = app.config['SLOW_REQUEST_MS']
+    slow_query_ms = app.config['SLOW_QUERY_MS']
+
+    with app.app_context():
+        engine = db.engine
+
+    # The start time lives on the statement's execution context, not on the
+    # connection, so a statement that raises leaves nothing behind on the
+    # pooled connection
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.query_start = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def end_query(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, 'query_start', None)
+        if started is None:
+            return
+        elapsed = (time.perf_counter() - started) * 1000
+        if elapsed > slow_query_ms:
+            app.logger.warning('Slow query (%.1f ms): %s; parameters: %r',
+                               elapsed, statement[:SQL_LOG_LENGTH], parameters)
+
+        timing = _timing()
+        if timing is not None:
+            timing['queries'] += 1
+            timing['sql_ms'] += elapsed
+            if elapsed > timing['slowest_ms']:
+                timing['slowest_ms'] = elapsed
+                timing['slowest_sql'] = statement
+
+    @event.listens_for(db.session, 'do_orm_execute')
+    def count_lazy_load(orm_execute_state):
+        timing = _timing()
+        if timing is not None and orm_execute_state.lazy_loaded_from is not None:
+            timing['lazy_loads'] += 1
+
+    def start_render(sender, template, context, **extra):
+        timing = _timing()
+        if timing is not None:
+            timing['render_stack'].append(time.perf_counter())
+
+    def end_render(sender, template, context, **extra):
+        timing = _timing()
+        if timing is not None and timing['render_stack']:
+            started = timing['render_stack'].pop()
+            # Only the outermost render counts, nested renders are part of it
+            if not timing['render_stack']:
+                timing['render_ms'] += (time.perf_counter() - started) * 1000
+
+    before_render_template.connect(start_render, app, weak=False)
+    template_rendered.connect(end_render, app, weak=False)
+
+    @app.before_request
+    def start_request():
+        g.request_timing = {
+            'started': time.perf_counter(), 'queries': 0, 'lazy_loads': 0, 'sql_ms': 0.0,
+            'render_ms': 0.0, 'render_stack': [], 'slowest_ms': 0.0, 'slowest_sql': None,
+        }
+
+    @app.after_request
+    def finish_request(response):
+        timing = _timing()
+        if timing is None:
+            return response
+
+        total_ms = (time.perf_counter() - timing['started']) * 1000
+        response.headers['Server-Timing'] = ', '.join([
+            f'db;dur={timing["sql_ms"]:.2f};desc="{timing["queries"]} queries, '
+            f'{timing["lazy_loads"]} lazy loads"',
+            f'render;dur={timing["render_ms"]:.2f}',
+            f'total;dur={total_ms:.2f}',
+        ])
+
+        slow = total_ms > slow_request_ms
+        if slow:
+            app.logger.warning(
+                'Slow request %s %s (%s): %.1f ms total, %d queries / %.1f ms SQL, '
+                '%d lazy loads, %.1f ms rendering; slowest query (%.1f ms): %s',
+                request.method, request.full_path, request.endpoint, total_ms,
+                timing['queries'], timing['sql_ms'], timing['lazy_loads'], timing['render_ms'],
+                timing['slowest_ms'], (timing['slowest_sql'] or '')[:SQL_LOG_LENGTH]
+            )
+        metrics.record(request.endpoint or '<unmatched>', total_ms, timing, slow)
+        return response
+
+
+def _timing():
+    return g.get('request_timing') if has_request_context() else None
+
+
+def request_metrics():
+    """The app's RequestMetrics, or None when instrumentation is off."""
+    return current_app.extensions.get('request_metrics')
@@ -0,0 +1,311 @@
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from exports import (EXPORT_HEADER, long_format_query, metadata_fields, parse_export_filters, stream_csv,
+                     wide_format, wide_header)
+from models import db, Job, LongFormatRow, Toxin
+
+# Background jobs for exports and analyses too large for a request.
+#
+# Each web worker submits jobs to its own process pool. Job state lives in
+# the job table, so any worker can answer status and download requests, and
+# the results are gzip-compressed files in JOB_RESULTS_DIR. Pool processes
+# are spawned, not forked, and build their own app (and connections) once.
+# The NumPy-based analysis and snapshot modules are imported by the kinds
+# that use them, so importing this module stays cheap for web workers.
+
+# Seconds between progress writes while a job runs
+PROGRESS_INTERVAL = 1.0
+
+# Studies exported per query by export jobs; progress is reported in between
+EXPORT_STUDY_CHUNK = 200
+
+
+class JobError(ValueError):
+    """A job was submitted with an unknown kind or invalid parameters."""
+
+
+# run(params, out, report) writes to `out`: text, or bytes for binary kinds
+JobKind = namedtuple('JobKind', 'params check run extension mimetype binary', defaults=(False,))
+
+
+def _check_text(params, names):
+    """Text parameters must be strings (or null); the runners pass them to queries as they are."""
+    for name in names:
+        if params.get(name) is not None and not isinstance(params[name], str):
+            raise JobError(f'{name} must be a string.')
+
+
+def _check_export(params):
+    _check_text(params, ('toxin', 'species', 'route', 'date_from', 'date_to'))
+    for name in ('dose_min', 'dose_max', 'value_min', 'value_max'):
+        if isinstance(params.get(name), bool):
+            raise JobError(f'Invalid {name}. Please use a number.')
+    if params.get('format', 'long') not in ('long', 'wide'):
+        raise JobError("format must be 'long' or 'wide'.")
+    try:
+        parse_export_filters(params)
+    except ValueError as e:
+        raise JobError(str(e))
+
+
+def _run_export(params, out, report):
+    """CSV like GET /export (format 'long' or 'wide'), written a chunk of studies at a time."""
+    filters = parse_export_filters(params)
+    wide = params.get('format') == 'wide'
+    study_ids = [
+        row[0] for row in
+        long_format_query(**filters).with_entities(LongFormatRow.study_id).order_by(None)
+        .distinct().order_by(LongFormatRow.study_id)
+    ]
+    # Wide columns cover the whole export, not just the first chunk
+    fields = metadata_fields(long_format_query(**filters)) if wide else None
+    header = wide_header(fields) if wide else EXPORT_HEADER
+
+    def rows():
+        # Each chunk's cursors are exhausted before progress is written, so
+        # SQLite never has a reader open across the progress commit
+        for start in range(0, len(study_ids), EXPORT_STUDY_CHUNK):
+            chunk = study_ids[start:start + EXPORT_STUDY_CHUNK]
+            query = long_format_query(**filters).filter(LongFormatRow.study_id.in_(chunk))
+            yield from wide_format(query, fields)[1] if wide else query
+            report((start + len(chunk)) / len(study_ids))
+
+    for text in stream_csv(rows(), header):
+        out.write(text)
+
+
+def _run_snapshot(params, out, report):
+    """Columnar snapshot (snapshot.py) of the rows GET /export would return, as an uncompressed tar."""
+    from snapshot import pack_snapshot, write_snapshot
+
+    with tempfile.TemporaryDirectory(dir=job_results_dir()) as directory:
+        write_snapshot(directory, parse_export_filters(params), report)
+        pack_snapshot(directory, out)
+
+
+def _check_dose_response(params):
+    from analysis import DOSE_BINS
+
+    _check_text(params, ('species', 'sex', 'route', 'outcome_type'))
+    bins = params.get('bins', DOSE_BINS)
+    if not isinstance(bins, int) or isinstance(bins, bool) or not 1 <= bins <= 100:
+        raise JobError('bins must be an integer between 1 and 100.')
+    toxin_ids = params.get('toxin_ids')
+    if toxin_ids is not None and not (isinstance(toxin_ids, list) and all(isinstance(i, int) and not isinstance(i, bool) for i in toxin_ids)):
+        raise JobError('toxin_ids must be a list of toxin ids.')
+
+
+def _run_dose_response(params, out, report):
+    """GET /api/toxins/<id>/dose-response for many (default: all) toxins, as one JSON document."""
+    from analysis import DOSE_BINS, dose_response
+
+    query = db.session.query(Toxin.id).order_by(Toxin.id)
+    if params.get('toxin_ids') is not None:
+        query = query.filter(Toxin.id.in_(params['toxin_ids']))
+    toxin_ids = [row[0] for row in query]
+
+    results = []
+    for i, toxin_id in enumerate(toxin_ids, 1):
+        result = dose_response(toxin_id, species=params.get('species') or None, sex=params.get('sex') or None,
+                               route=params.get('route') or None,
+                               outcome_type=params.get('outcome_type') or None,
+                               bins=params.get('bins', DOSE_BINS))
+        if result is not None:
+            results.append(result)
+        report(i / len(toxin_ids))
+    json.dump({'params': params, 'toxins': results}, out)
+
+
+JOB_KINDS = {
+    'export': JobKind(
+        {'toxin', 'species', 'route', 'date_from', 'date_to', 'dose_min', 'dose_max', 'value_min', 'value_max',
+         'format'},
+        _check_export, _run_export, 'csv', 'text/csv'),
+    'snapshot': JobKind(
+        {'toxin', 'species', 'route', 'date_from', 'date_to', 'dose_min', 'dose_max', 'value_min', 'value_max'},
+        _check_export, _run_snapshot, 'tar', 'application/x-tar', binary=True),
+    'dose-response': JobKind(
+        {'toxin_ids', 'species', 'sex', 'route', 'outcome_type', 'bins'},
+        _check_dose_response, _run_dose_response, 'json', 'application/json'),
+}
+
+
+class JobRunner:
+    """Submits jobs to a per-process pool that is started on first use."""
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, kind, params):
+        """Validate, record and queue a job; returns the new Job."""
+        if kind not in JOB_KINDS:
+            raise JobError(f"kind must be one of {', '.join(sorted(JOB_KINDS))}")
+        if not isinstance(params, dict):
+            raise JobError('params must be an object.')
+        unknown = set(params) - JOB_KINDS[kind].params
+        if unknown:
+            raise JobError(f"Unknown {kind} parameter(s): {', '.join(sorted(unknown))}")
+        JOB_KINDS[kind].check(params)
+
+        job = Job(id=uuid.uuid4().hex, kind=kind, params=json.dumps(params), status='queued')
+        db.session.add(job)
+        db.session.commit()
+        try:
+            self._pool().submit(run_job, job.id)
+        except BrokenProcessPool:
+            # A pool process died (killed, out of memory); its own job is
+            # expired later by expire_stale_job, and a fresh pool takes this one
+            with self._lock:
+                self._executor = None
+            self._pool().submit(run_job, job.id)
+        return job
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'),
+                                                     initializer=_init_worker)
+            return self._executor
+
+
+def init_jobs(app):
+    app.extensions['jobs'] = JobRunner(app.config['JOB_WORKERS'])
+
+
+def job_runner():
+    return current_app.extensions['jobs']
+
+
+def job_results_dir():
+    return current_app.config['JOB_RESULTS_DIR'] or os.path.join(current_app.instance_path, 'jobs')
+
+
+def job_result_path(job):
+    return os.path.join(job_results_dir(), job.result_file)
+
+
+def expire_stale_job(job):
+    """
+    Mark a queued or running job as failed once it has gone
+    JOB_STALE_SECONDS without a progress write: its worker was restarted
+    or killed, and nothing else will ever finish it. A queued job that was
+    only waiting behind others is not run after this (see _claim_job).
+    """
+    stale_before = datetime.utcnow() - timedelta(seconds=current_app.config['JOB_STALE_SECONDS'])
+    if job.status in ('queued', 'running') and job.updated_at < stale_before:
+        # Conditional, so a job a pool process has just claimed is left alone
+        Job.query.filter(Job.id == job.id, Job.status == job.status, Job.updated_at < stale_before).update(
+            {Job.status: 'failed', Job.finished_at: datetime.utcnow(),
+             Job.message: 'The job stopped before it finished; please submit it again.'},
+            synchronize_session=False
+        )
+        db.session.commit()
+    return job
+
+
+def prune_jobs(older_than):
+    """Delete finished jobs created before `older_than`, and their result files."""
+    jobs = Job.query.filter(Job.status.in_(('done', 'failed')), Job.created_at < older_than).all()
+    for job in jobs:
+        if job.result_file:
+            try:
+                os.remove(job_result_path(job))
+            except FileNotFoundError:
+                pass
+        db.session.delete(job)
+    db.session.commit()
+    return len(jobs)
+
+
+# ── In the pool processes ───────────────────────────────────────────────────
+
+_worker_app = None
+
+
+def _init_worker():
+    global _worker_app
+    from app import create_app
+    _worker_app = create_app()
+
+
+def _update_job(job_id, **values):
+    # Own short transaction, independent of the session the job reads with
+    values['updated_at'] = datetime.utcnow()
+    with db.engine.begin() as connection:
+        connection.execute(Job.__table__.update().where(Job.id == job_id).values(**values))
+
+
+def _claim_job(job_id):
+    """Move a job from queued to running; False if it is no longer queued (e.g. expired meanwhile)."""
+    now = datetime.utcnow()
+    with db.engine.begin() as connection:
+        result = connection.execute(
+            Job.__table__.update().where(Job.id == job_id, Job.status == 'queued')
+            .values(status='running', started_at=now, updated_at=now)
+        )
+    return result.rowcount == 1
+
+
+def run_job(job_id):
+    with _worker_app.app_context():
+        try:
+            _run_job(job_id)
+        finally:
+            db.session.remove()
+
+
+def _run_job(job_id):
+    if not _claim_job(job_id):
+        return
+    job = db.session.get(Job, job_id)
+    kind = JOB_KINDS[job.kind]
+    params = json.loads(job.params)
+
+    last_report = [time.monotonic()]
+
+    def report(fraction):
+        now = time.monotonic()
+        if now - last_report[0] >= PROGRESS_INTERVAL:
+            last_report[0] = now
+            _update_job(job_id, progress=round(fraction, 4))
+
+    directory = job_results_dir()
+    os.makedirs(directory, exist_ok=True)
+    result_file = f'{job_id}.{kind.extension}.gz'
+    path = os.path.join(directory, result_file)
+    tmp = path + '.tmp'
+    try:
+        with gzip.open(tmp, 'wb') as out:
+            if kind.binary:
+                kind.run(params, out, report)
+            else:
+                with io.TextIOWrapper(out, encoding='utf-8', newline='') as text_out:
+                    kind.run(params, text_out, report)
+        os.replace(tmp, path)
+    except Exception as e:
+        db.session.rollback()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        current_app.logger.exception('Job %s (%s) failed', job_id, job.kind)
+        _update_job(job_id, status='failed', message=f'{type(e).__name__}: {e}', finished_at=datetime.utcnow())
+        return
+
+    _update_job(job_id, status='done', progress=1.0, result_file=result_file,
+                result_bytes=os.path.getsize(path), finished_at=datetime.utcnow())
@@ -0,0 +1,83 @@
+"""unique toxin name key
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-18 07:33:23.423158
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from models import normalize_toxin_name
+
+
+# revision identifiers, used by Alembic.
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Toxins whose names differ only in case or surrounding whitespace (e.g.
+    # from the CSV importer, which matched names case-sensitively, or a
+    # wizard name with a trailing space) are merged into the oldest one:
+    # its studies and fact rows are repointed, and it takes a molecular
+    # weight from the others if it has none. Every key is then recomputed
+    # with normalize_toxin_name and names lose their surrounding whitespace.
+    toxin = sa.table('toxin', sa.column('id', sa.Integer), sa.column('name', sa.String),
+                     sa.column('name_key', sa.String), sa.column('molecular_weight', sa.Float))
+    study = sa.table('study', sa.column('id', sa.Integer), sa.column('toxin_id', sa.Integer),
+                     sa.column('version', sa.Integer))
+    fact = sa.table('long_format_row', sa.column('toxin_id', sa.Integer), sa.column('toxin_name', sa.String))
+    connection = op.get_bind()
+
+    groups = {}
+    for id_, name, name_key, molecular_weight in connection.execute(
+        sa.select(toxin.c.id, toxin.c.name, toxin.c.name_key, toxin.c.molecular_weight).order_by(toxin.c.id)
+    ):
+        groups.setdefault(normalize_toxin_name(name), []).append((id_, name, name_key, molecular_weight))
+
+    merged = False
+    for key, ((keep_id, keep_name, keep_key, keep_weight), *duplicates) in groups.items():
+        name = keep_name.strip()
+        if duplicates:
+            duplicate_ids = [id_ for id_, _, _, _ in duplicates]
+            connection.execute(study.update().where(study.c.toxin_id.in_(duplicate_ids))
+                               .values(toxin_id=keep_id, version=study.c.version + 1))
+            connection.execute(fact.update().where(fact.c.toxin_id.in_(duplicate_ids))
+                               .values(toxin_id=keep_id))
+            weight = keep_weight or next((weight for _, _, _, weight in duplicates if weight), None)
+            if weight != keep_weight:
+                connection.execute(toxin.update().where(toxin.c.id == keep_id).values(molecular_weight=weight))
+            connection.execute(toxin.delete().where(toxin.c.id.in_(duplicate_ids)))
+        if name != keep_name or key != keep_key:
+            connection.execute(toxin.update().where(toxin.c.id == keep_id).values(name=name, name_key=key))
+        if duplicates or name != keep_name:
+            merged = True
+            connection.execute(fact.update().where(fact.c.toxin_id == keep_id).values(toxin_name=name))
+
+    if merged:
+        # Recount the toxin facet; mirrors 0009
+        op.execute("DELETE FROM facet_count WHERE facet = 'toxin'")
+        op.execute("""
+            INSERT INTO facet_count (facet, value, outcomes)
+            SELECT 'toxin', toxin_name, COUNT(*) FROM long_format_row
+                WHERE toxin_name IS NOT NULL GROUP BY toxin_name
+        """)
+
+    # ### commands auto generated by Alembic - please adjust! ###
+    with op.batch_alter_table('toxin', schema=None) as batch_op:
+        batch_op.drop_index('ix_toxin_name_key')
+        batch_op.create_index(batch_op.f('ix_toxin_name_key'), ['name_key'], unique=True)
+
+    # ### end Alembic commands ###
+
+
+def downgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    with op.batch_alter_table('toxin', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_toxin_name_key'))
+        batch_op.create_index('ix_toxin_name_key', ['name_key'], unique=False)
+
+    # ### end Alembic commands ###
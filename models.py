@@ -4,10 +4,21 @@ from datetime import datetime
 db = SQLAlchemy()
 
 
+def normalize_toxin_name(name):
+    """Key toxin names are matched on: surrounding whitespace dropped, lower-cased."""
+    return name.strip().lower()
+
+
+def _toxin_name_key(context):
+    return normalize_toxin_name(context.get_current_parameters()['name'])
+
+
 class Toxin(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), unique=True, nullable=False)
+    name_key = db.Column(db.String(255), nullable=False, unique=True, index=True, default=_toxin_name_key)  # normalize_toxin_name(name), for prefix / case-insensitive lookups
     description = db.Column(db.Text, nullable=True)
+    molecular_weight = db.Column(db.Float, nullable=True)  # g/mol, enables mg/m3 → ppm conversion
 
     studies = db.relationship('Study', backref='toxin', lazy=True)
 
@@ -18,7 +29,7 @@ class Toxin(db.Model):
 class Study(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False)
-    toxin_id = db.Column(db.Integer, db.ForeignKey('toxin.id'), nullable=False)
+    toxin_id = db.Column(db.Integer, db.ForeignKey('toxin.id'), nullable=False, index=True)
     description = db.Column(db.Text, nullable=True)
     date_conducted = db.Column(db.Date, nullable=True)
     author = db.Column(db.String(255), nullable=True)
@@ -26,22 +37,30 @@ class Study(db.Model):
     contributor_email = db.Column(db.String(255), nullable=False)  # hidden from templates
     publication_reference = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)  # latest write anywhere in the tree
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # bumped on every write to the tree
+    content_hash = db.Column(db.String(64), nullable=True, index=True)  # duplicates.py; None until there are outcomes
 
     animal_models = db.relationship('AnimalModel', backref='study', lazy=True, cascade='all, delete-orphan')
 
+    __table_args__ = (
+        db.Index('ix_study_created_at_id', 'created_at', 'id'),  # keyset pagination order
+    )
+
     def __repr__(self):
         return f"<Study {self.name}>"
 
 
 class AnimalModel(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    study_id = db.Column(db.Integer, db.ForeignKey('study.id'), nullable=False)
+    study_id = db.Column(db.Integer, db.ForeignKey('study.id'), nullable=False, index=True)
     species = db.Column(db.String(255), nullable=False)
     strain = db.Column(db.String(255), nullable=True)
     sex = db.Column(db.String(10), nullable=False)  # Controlled: 'male', 'female', 'mixed'
     age = db.Column(db.String(255), nullable=True)
     weight = db.Column(db.String(255), nullable=True)
     description = db.Column(db.Text, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     dose_groups = db.relationship('DoseGroup', backref='animal_model', lazy=True, cascade='all, delete-orphan')
 
@@ -51,7 +70,7 @@ class AnimalModel(db.Model):
 
 class DoseGroup(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    animal_model_id = db.Column(db.Integer, db.ForeignKey('animal_model.id'), nullable=False)
+    animal_model_id = db.Column(db.Integer, db.ForeignKey('animal_model.id'), nullable=False, index=True)
     dose_value = db.Column(db.Float, nullable=False)
     dose_unit = db.Column(db.String(10), nullable=False)  # Controlled: 'mg/m3', 'ppm', 'ppb', 'other'
     custom_dose_unit = db.Column(db.String(255), nullable=True)  # Used when dose_unit is 'other'
@@ -62,9 +81,15 @@ class DoseGroup(db.Model):
         nullable=False,
         default='unknown'
     )
+    dose_ppm = db.Column(db.Float, nullable=True, index=True)  # canonical dose, NULL if not convertible
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     outcomes = db.relationship('Outcome', backref='dose_group', lazy=True, cascade='all, delete-orphan')
 
+    __table_args__ = (
+        db.Index('ix_dose_group_route_dose_ppm', 'route_of_exposure', 'dose_ppm'),
+    )
+
     def __repr__(self):
         unit = self.custom_dose_unit if self.dose_unit == 'other' else self.dose_unit
         return f"<DoseGroup {self.dose_value} {unit}>"
@@ -72,13 +97,16 @@ class DoseGroup(db.Model):
 
 class Outcome(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    dose_group_id = db.Column(db.Integer, db.ForeignKey('dose_group.id'), nullable=False)
+    dose_group_id = db.Column(db.Integer, db.ForeignKey('dose_group.id'), nullable=False, index=True)
     outcome_type = db.Column(db.String(20),
                              nullable=False)  # Controlled: 'cancer', 'organ_weight', 'mortality', 'other'
     custom_outcome_type = db.Column(db.String(255), nullable=True)  # Used when outcome_type is 'other'
     value = db.Column(db.Text, nullable=False)
     observation_time = db.Column(db.String(255), nullable=True)
     notes = db.Column(db.Text, nullable=True)
+    value_numeric = db.Column(db.Float, nullable=True, index=True)  # parsed from value
+    value_parse_status = db.Column(db.String(10), nullable=True)  # see units.parse_outcome_value
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def __repr__(self):
         outcome = self.custom_outcome_type if self.outcome_type == 'other' else self.outcome_type
@@ -91,10 +119,119 @@ class AdditionalMetadata(db.Model):
     entity_id = db.Column(db.Integer, nullable=False)
     field_name = db.Column(db.String(100), nullable=False)
     field_value = db.Column(db.Text, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     __table_args__ = (
         db.UniqueConstraint('entity_type', 'entity_id', 'field_name', name='unique_metadata_field'),
     )
 
     def __repr__(self):
-        return f"<Metadata {self.entity_type}:{self.entity_id} {self.field_name}={self.field_value}>"
\ No newline at end of file
+        return f"<Metadata {self.entity_type}:{self.entity_id} {self.field_name}={self.field_value}>"
+
+class LongFormatRow(db.Model):
+    """
+    Materialized long-format fact table: one row per Outcome with every
+    ancestor column denormalized and 'other' units / outcome types already
+    resolved. Maintained by facts.refresh_long_format; never written directly.
+    """
+    outcome_id = db.Column(db.Integer, db.ForeignKey('outcome.id'), primary_key=True)
+    study_id = db.Column(db.Integer, nullable=False)
+    toxin_id = db.Column(db.Integer, nullable=False)
+    animal_model_id = db.Column(db.Integer, nullable=False)
+    dose_group_id = db.Column(db.Integer, nullable=False)
+
+    study_name = db.Column(db.String(255), nullable=False)
+    toxin_name = db.Column(db.String(255), nullable=False)
+    date_conducted = db.Column(db.Date, nullable=True)
+    author = db.Column(db.String(255), nullable=True)
+    contributor_name = db.Column(db.String(255), nullable=True)
+    species = db.Column(db.String(255), nullable=False)
+    species_key = db.Column(db.String(255), nullable=False)  # lower(species), for case-insensitive filters
+    strain = db.Column(db.String(255), nullable=True)
+    sex = db.Column(db.String(10), nullable=False)
+    age = db.Column(db.String(255), nullable=True)
+    weight = db.Column(db.String(255), nullable=True)
+    dose_value = db.Column(db.Float, nullable=False)
+    dose_unit = db.Column(db.String(255), nullable=True)  # resolved custom unit when 'other'
+    dose_ppm = db.Column(db.Float, nullable=True)
+    route_of_exposure = db.Column(db.String(30), nullable=False)
+    group_size = db.Column(db.Integer, nullable=False)
+    exposure_duration = db.Column(db.String(255), nullable=True)
+    outcome_type = db.Column(db.String(255), nullable=True)  # resolved custom type when 'other'
+    value = db.Column(db.Text, nullable=False)
+    value_numeric = db.Column(db.Float, nullable=True)
+    value_parse_status = db.Column(db.String(10), nullable=True)
+    observation_time = db.Column(db.String(255), nullable=True)
+    notes = db.Column(db.Text, nullable=True)
+
+    __table_args__ = (
+        # Per-study views and exports read one contiguous range in display order
+        db.Index('ix_long_format_study_order', 'study_id', 'animal_model_id', 'dose_group_id', 'outcome_id'),
+        db.Index('ix_long_format_toxin', 'toxin_id', 'species_key'),
+        db.Index('ix_long_format_route_dose_ppm', 'route_of_exposure', 'dose_ppm'),
+        db.Index('ix_long_format_value_numeric', 'value_numeric'),
+        # Faceted outcome queries (facets.py): species → sex → route → outcome type
+        # drill-downs, outcome type first for "all cancer outcomes", and date ranges
+        db.Index('ix_long_format_facets', 'species_key', 'sex', 'route_of_exposure', 'outcome_type'),
+        db.Index('ix_long_format_outcome_type', 'outcome_type', 'route_of_exposure'),
+        db.Index('ix_long_format_date_conducted', 'date_conducted'),
+    )
+
+    def __repr__(self):
+        return f"<LongFormatRow outcome={self.outcome_id}>"
+
+
+class FacetCount(db.Model):
+    """
+    Outcomes in long_format_row per facet value (see facets.FACETS), kept
+    current by facts.refresh_long_format so the unfiltered sidebar needs no
+    GROUP BY over the fact table.
+    """
+    facet = db.Column(db.String(20), primary_key=True)
+    value = db.Column(db.String(255), primary_key=True)
+    outcomes = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<FacetCount {self.facet}={self.value}: {self.outcomes}>"
+
+
+class Job(db.Model):
+    """A background export or analysis run by jobs.JobRunner; see jobs.py."""
+    id = db.Column(db.String(32), primary_key=True)  # random hex, so ids cannot be guessed
+    kind = db.Column(db.String(30), nullable=False)
+    params = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    status = db.Column(db.String(10), nullable=False, default='queued', index=True)  # queued, running, done, failed
+    progress = db.Column(db.Float, nullable=False, default=0.0)  # 0..1
+    message = db.Column(db.Text, nullable=True)  # error for failed jobs
+    result_file = db.Column(db.String(255), nullable=True)  # name within JOB_RESULTS_DIR
+    result_bytes = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # heartbeat while running
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.kind} {self.status}>"
+
+
+class Change(db.Model):
+    """
+    Append-only change feed entry: one entity of a study was inserted or
+    updated. The id is the feed cursor (see changelog.py); AUTOINCREMENT
+    keeps SQLite from reusing ids freed by compaction.
+    """
+    __tablename__ = 'change_log'
+
+    id = db.Column(db.Integer, primary_key=True)
+    study_id = db.Column(db.Integer, nullable=False)
+    entity_type = db.Column(db.String(20), nullable=False)  # study, animal_model, dose_group, outcome, additional_metadata
+    entity_id = db.Column(db.Integer, nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_change_log_entity', 'entity_type', 'entity_id'),  # compaction finds later entries per entity
+        {'sqlite_autoincrement': True},
+    )
+
+    def __repr__(self):
+        return f"<Change {self.id} {self.entity_type} {self.entity_id}>"
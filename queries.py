@@ -0,0 +1,162 @@
+from collections import defaultdict
+from datetime import datetime
+
+from flask import abort
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import joinedload, selectinload
+
+from models import db, Study, AnimalModel, DoseGroup, Outcome, AdditionalMetadata
+
+
+def load_study_tree(study_id):
+    """
+    Load a Study with its whole Study → AnimalModel → DoseGroup → Outcome tree.
+
+    The toxin is joined in and every level below is fetched with one
+    SELECT … IN query, so the number of round trips is fixed (four) no
+    matter how many animal models, dose groups or outcomes the study has.
+    Aborts with 404 if the study does not exist.
+    """
+    study = (
+        Study.query
+        .options(
+            joinedload(Study.toxin),
+            selectinload(Study.animal_models)
+            .selectinload(AnimalModel.dose_groups)
+            .selectinload(DoseGroup.outcomes)
+        )
+        .filter(Study.id == study_id)
+        .first()
+    )
+    if study is None:
+        abort(404)
+    return study
+
+
+def study_fingerprint(study_id):
+    """
+    (version, updated_at) of a study with one primary-key lookup; both
+    change on every write to the study tree. Aborts with 404.
+    """
+    row = db.session.query(Study.version, Study.updated_at).filter(Study.id == study_id).first()
+    if row is None:
+        abort(404)
+    return row
+
+
+def load_metadata(study_ids):
+    """
+    Fetch the AdditionalMetadata of the given studies and all their
+    descendants in a single query.
+
+    Returns a dict keyed by (entity_type, entity_id) → [AdditionalMetadata].
+    Descendant ids are resolved with sub-selects inside the same statement,
+    so no id lists are shipped back and forth.
+    """
+    study_ids = list(study_ids)
+    if not study_ids:
+        return {}
+
+    rows = (
+        AdditionalMetadata.query
+        .filter(metadata_filter(study_ids))
+        .order_by(AdditionalMetadata.id)
+        .all()
+    )
+
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[(row.entity_type, row.entity_id)].append(row)
+    return dict(grouped)
+
+
+def metadata_filter(study_ids):
+    """WHERE clause matching the metadata of the studies and their descendants."""
+    animal_ids = select(AnimalModel.id).where(AnimalModel.study_id.in_(study_ids))
+    dose_ids = (
+        select(DoseGroup.id)
+        .join(AnimalModel, DoseGroup.animal_model_id == AnimalModel.id)
+        .where(AnimalModel.study_id.in_(study_ids))
+    )
+    outcome_ids = (
+        select(Outcome.id)
+        .join(DoseGroup, Outcome.dose_group_id == DoseGroup.id)
+        .join(AnimalModel, DoseGroup.animal_model_id == AnimalModel.id)
+        .where(AnimalModel.study_id.in_(study_ids))
+    )
+    return or_(
+        and_(AdditionalMetadata.entity_type == 'study',
+             AdditionalMetadata.entity_id.in_(study_ids)),
+        and_(AdditionalMetadata.entity_type == 'animal_model',
+             AdditionalMetadata.entity_id.in_(animal_ids)),
+        and_(AdditionalMetadata.entity_type == 'dose_group',
+             AdditionalMetadata.entity_id.in_(dose_ids)),
+        and_(AdditionalMetadata.entity_type == 'outcome',
+             AdditionalMetadata.entity_id.in_(outcome_ids)),
+    )
+
+
+def recent_studies(limit, cursor=None):
+    """
+    One page of studies, newest first, using keyset pagination on
+    (created_at, id) so deep pages cost the same as the first one.
+
+    `cursor` is the token returned for the previous page (or None for the
+    first page). Returns (studies, next_cursor); next_cursor is None on the
+    last page. Toxins are joined in so templates can show them for free.
+    """
+    query = Study.query.options(joinedload(Study.toxin))
+
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        created_at, study_id = position
+        query = query.filter(or_(
+            Study.created_at < created_at,
+            and_(Study.created_at == created_at, Study.id < study_id)
+        ))
+
+    studies = (
+        query
+        .order_by(Study.created_at.desc(), Study.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+
+    next_cursor = None
+    if len(studies) > limit:
+        studies = studies[:limit]
+        next_cursor = encode_cursor(studies[-1])
+    return studies, next_cursor
+
+
+def encode_cursor(study):
+    return f"{study.created_at.isoformat()}_{study.id}"
+
+
+def decode_cursor(token):
+    """Parse a page cursor; returns None for malformed tokens."""
+    try:
+        created_at, study_id = token.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(study_id)
+    except ValueError:
+        return None
+
+
+def study_id_for(entity_type, entity_id):
+    """Resolve the owning study id of any entity with one joined lookup."""
+    if entity_type == 'study':
+        return entity_id
+
+    query = db.session.query(AnimalModel.study_id)
+    if entity_type == 'animal_model':
+        query = query.filter(AnimalModel.id == entity_id)
+    elif entity_type == 'dose_group':
+        query = (query.join(DoseGroup, DoseGroup.animal_model_id == AnimalModel.id)
+                 .filter(DoseGroup.id == entity_id))
+    elif entity_type == 'outcome':
+        query = (query.join(DoseGroup, DoseGroup.animal_model_id == AnimalModel.id)
+                 .join(Outcome, Outcome.dose_group_id == DoseGroup.id)
+                 .filter(Outcome.id == entity_id))
+    else:
+        return None
+    return query.scalar()
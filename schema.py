@@ -0,0 +1,90 @@
+import os
+
+from alembic import command
+from flask_migrate import Migrate
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+
+from models import db
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Revision matching the schema older versions built with db.create_all()
+INITIAL_REVISION = '0001'
+
+migrate = Migrate(directory=MIGRATIONS_DIR, render_as_batch=True)
+
+# Arbitrary key for pg_advisory_xact_lock
+MIGRATION_LOCK = 0x746f786d
+
+# Lookups the ORM issues when it walks relationships, plus the study list
+RELATIONSHIP_QUERIES = [
+    ('study.toxin_id', 'SELECT id FROM study WHERE toxin_id = :id'),
+    ('animal_model.study_id', 'SELECT id FROM animal_model WHERE study_id = :id'),
+    ('dose_group.animal_model_id', 'SELECT id FROM dose_group WHERE animal_model_id = :id'),
+    ('outcome.dose_group_id', 'SELECT id FROM outcome WHERE dose_group_id = :id'),
+    ('additional_metadata (entity_type, entity_id)',
+     "SELECT id FROM additional_metadata WHERE entity_type = 'outcome' AND entity_id = :id"),
+    ('long_format_row.study_id',
+     'SELECT outcome_id FROM long_format_row WHERE study_id = :id '
+     'ORDER BY animal_model_id, dose_group_id, outcome_id'),
+    ('study ORDER BY created_at',
+     'SELECT id FROM study ORDER BY created_at DESC, id DESC LIMIT 25'),
+]
+
+
+def upgrade_database():
+    """
+    Apply pending migrations. A database created by the old create_all()
+    start-up (tables present, no alembic_version) is stamped with the
+    initial revision first so only the later migrations run.
+
+    Every worker runs this at start-up, so the check and the upgrade share
+    one connection that first takes the database's write lock (an advisory
+    lock on Postgres, BEGIN IMMEDIATE on SQLite). Workers starting together
+    wait for the first one, then find nothing left to apply.
+    """
+    with db.engine.connect() as connection:
+        with connection.begin():
+            _lock_schema(connection)
+            tables = inspect(connection).get_table_names()
+            config = migrate.get_config()
+            config.attributes['connection'] = connection  # used by migrations/env.py
+            if 'study' in tables and 'alembic_version' not in tables:
+                command.stamp(config, INITIAL_REVISION)
+            command.upgrade(config, 'head')
+
+
+def _lock_schema(connection):
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': MIGRATION_LOCK})
+    elif connection.dialect.name == 'sqlite':
+        # Each attempt waits up to the busy timeout; a long migration in
+        # another worker can take more than one
+        while True:
+            try:
+                connection.exec_driver_sql('BEGIN IMMEDIATE')
+                return
+            except OperationalError as e:
+                if 'locked' not in str(e):
+                    raise
+
+
+def explain_relationship_queries():
+    """
+    Return (label, plan lines, full_scan) for each RELATIONSHIP_QUERIES
+    entry, using EXPLAIN QUERY PLAN on SQLite and EXPLAIN on Postgres.
+    Note that Postgres may still pick a sequential scan on tiny tables.
+    """
+    postgres = db.engine.dialect.name == 'postgresql'
+    results = []
+    for label, sql in RELATIONSHIP_QUERIES:
+        prefix = 'EXPLAIN ' if postgres else 'EXPLAIN QUERY PLAN '
+        rows = db.session.execute(text(prefix + sql), {'id': 1}).fetchall()
+        plan = [row[0] if postgres else row[-1] for row in rows]
+        if postgres:
+            full_scan = any('Seq Scan' in line for line in plan)
+        else:
+            full_scan = any(line.startswith('SCAN ') and 'USING' not in line for line in plan)
+        results.append((label, plan, full_scan))
+    return results
@@ -0,0 +1,174 @@
+import re
+
+from sqlalchemy import text
+from sqlalchemy.orm import joinedload
+
+from models import db, Toxin, Study, AnimalModel, DoseGroup, Outcome
+from queries import load_metadata
+
+# One search document per study, covering the text of its whole tree.
+#   SQLite:   FTS5 virtual table, rowid = study id, ranked with bm25()
+#   Postgres: weighted tsvector per study with a GIN index, ranked with ts_rank()
+# The study_search table itself is created by migration 0002.
+
+# Column weights: name / toxin ≫ author / reference > description > outcomes & metadata
+SQLITE_RANK = "bm25(study_search, 10.0, 10.0, 5.0, 5.0, 2.0, 1.0)"
+
+POSTGRES_DOCUMENT = """
+    setweight(to_tsvector('english', :name || ' ' || :toxin), 'A') ||
+    setweight(to_tsvector('english', :author || ' ' || :publication_reference), 'B') ||
+    setweight(to_tsvector('english', :description), 'C') ||
+    setweight(to_tsvector('english', :body), 'D')
+"""
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _dialect():
+    return db.engine.dialect.name
+
+
+def index_study(study_id):
+    """
+    (Re)build the search document of one study inside the current
+    transaction. Call it from every write path before committing.
+    """
+    index_studies([study_id])
+
+
+def index_studies(study_ids):
+    study_ids = list(study_ids)
+    if not study_ids:
+        return
+
+    documents = _collect_documents(study_ids)
+    params = [dict(doc, study_id=study_id) for study_id, doc in documents.items()]
+
+    if _dialect() == 'postgresql':
+        db.session.execute(
+            text(f"""INSERT INTO study_search (study_id, document)
+                     VALUES (:study_id, {POSTGRES_DOCUMENT})
+                     ON CONFLICT (study_id) DO UPDATE SET document = EXCLUDED.document"""),
+            params
+        )
+    else:
+        db.session.execute(
+            text("DELETE FROM study_search WHERE rowid = :study_id"),
+            [{'study_id': study_id} for study_id in study_ids]
+        )
+        db.session.execute(
+            text("""INSERT INTO study_search
+                        (rowid, name, toxin, author, publication_reference, description, body)
+                    VALUES (:study_id, :name, :toxin, :author, :publication_reference,
+                            :description, :body)"""),
+            params
+        )
+
+
+def rebuild_search_index(batch_size=500, progress=None):
+    """Re-index every study, committing once per batch."""
+    last_id = 0
+    indexed = 0
+    while True:
+        ids = [row.id for row in
+               db.session.query(Study.id).filter(Study.id > last_id)
+               .order_by(Study.id).limit(batch_size)]
+        if not ids:
+            return indexed
+        index_studies(ids)
+        db.session.commit()
+        indexed += len(ids)
+        last_id = ids[-1]
+        if progress:
+            progress(indexed)
+
+
+def search_studies(query, limit, offset=0):
+    """
+    Ranked full-text search over studies.
+
+    Every word of `query` must match, each as a prefix (so "benz" finds
+    "benzene"). Returns (studies, has_more) with
+    studies in rank order and their toxins already loaded.
+    """
+    tokens = TOKEN_RE.findall(query or '')
+    if not tokens:
+        return [], False
+
+    if _dialect() == 'postgresql':
+        statement = text("""
+            SELECT study_id
+            FROM study_search, to_tsquery('english', :match) AS q
+            WHERE document @@ q
+            ORDER BY ts_rank(document, q) DESC, study_id DESC
+            LIMIT :limit OFFSET :offset""")
+        match = ' & '.join(f'{token}:*' for token in tokens)
+    else:
+        statement = text(f"""
+            SELECT rowid
+            FROM study_search
+            WHERE study_search MATCH :match
+            ORDER BY {SQLITE_RANK}, rowid DESC
+            LIMIT :limit OFFSET :offset""")
+        match = ' '.join(f'"{token}"*' for token in tokens)
+
+    ids = [row[0] for row in db.session.execute(
+        statement, {'match': match, 'limit': limit + 1, 'offset': offset})]
+    has_more = len(ids) > limit
+    ids = ids[:limit]
+    if not ids:
+        return [], has_more
+
+    by_id = {
+        study.id: study
+        for study in Study.query.options(joinedload(Study.toxin)).filter(Study.id.in_(ids))
+    }
+    return [by_id[i] for i in ids if i in by_id], has_more
+
+
+def _collect_documents(study_ids):
+    """Gather the searchable text of each study tree with three queries."""
+    documents = {}
+    body = {study_id: [] for study_id in study_ids}
+
+    rows = (
+        db.session.query(Study.id, Study.name, Study.author, Study.publication_reference,
+                         Study.description, Toxin.name)
+        .join(Toxin, Study.toxin_id == Toxin.id)
+        .filter(Study.id.in_(study_ids))
+    )
+    for study_id, name, author, reference, description, toxin in rows:
+        documents[study_id] = {
+            'name': name or '',
+            'toxin': toxin or '',
+            'author': author or '',
+            'publication_reference': reference or '',
+            'description': description or '',
+        }
+
+    # One walk over the tree gives outcome text and the owner of every entity
+    owners = {('study', study_id): study_id for study_id in study_ids}
+    tree = (
+        db.session.query(AnimalModel.study_id, AnimalModel.id, DoseGroup.id, Outcome.id,
+                         Outcome.value, Outcome.notes)
+        .outerjoin(DoseGroup, DoseGroup.animal_model_id == AnimalModel.id)
+        .outerjoin(Outcome, Outcome.dose_group_id == DoseGroup.id)
+        .filter(AnimalModel.study_id.in_(study_ids))
+    )
+    for study_id, animal_id, dose_id, outcome_id, value, notes in tree:
+        owners[('animal_model', animal_id)] = study_id
+        if dose_id is not None:
+            owners[('dose_group', dose_id)] = study_id
+        if outcome_id is not None:
+            owners[('outcome', outcome_id)] = study_id
+            body[study_id].extend(part for part in (value, notes) if part)
+
+    for (entity_type, entity_id), items in load_metadata(study_ids).items():
+        study_id = owners.get((entity_type, entity_id))
+        if study_id in body:
+            body[study_id].extend(item.field_value for item in items if item.field_value)
+
+    for study_id, doc in documents.items():
+        doc['body'] = '\n'.join(body[study_id])
+    return documents
+
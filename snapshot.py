@@ -0,0 +1,196 @@
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+from models import db, Change, LongFormatRow
+from exports import long_format_query
+from snapshot_reader import MANIFEST, SNAPSHOT_FORMAT, SNAPSHOT_VERSION
+
+# Columnar snapshot of the fact table for NumPy / pandas users (read with
+# snapshot_reader.py). Rows are read a chunk of studies at a time and each
+# column is appended to a raw file; the .npy headers are written once the
+# row count is known. Category codes are then renumbered in dictionary
+# order and narrowed to the smallest integer type that holds them. Free
+# text is stored as UTF-8 bytes plus offsets, so neither the writer nor
+# the manifest holds its distinct values. The files are uncompressed so
+# they can be memory-mapped; downloads are gzip-compressed by the job
+# runner instead.
+
+# (column name, fact table column, kind)
+SNAPSHOT_COLUMNS = [
+    ('outcome_id', LongFormatRow.outcome_id, 'id'),
+    ('study_id', LongFormatRow.study_id, 'id'),
+    ('toxin_id', LongFormatRow.toxin_id, 'id'),
+    ('animal_model_id', LongFormatRow.animal_model_id, 'id'),
+    ('dose_group_id', LongFormatRow.dose_group_id, 'id'),
+    ('toxin_name', LongFormatRow.toxin_name, 'category'),
+    ('date_conducted', LongFormatRow.date_conducted, 'date'),
+    ('species', LongFormatRow.species, 'category'),
+    ('strain', LongFormatRow.strain, 'text'),
+    ('sex', LongFormatRow.sex, 'category'),
+    ('dose_value', LongFormatRow.dose_value, 'number'),
+    ('dose_unit', LongFormatRow.dose_unit, 'category'),
+    ('dose_ppm', LongFormatRow.dose_ppm, 'number'),
+    ('route_of_exposure', LongFormatRow.route_of_exposure, 'category'),
+    ('group_size', LongFormatRow.group_size, 'integer'),
+    ('exposure_duration', LongFormatRow.exposure_duration, 'text'),
+    ('outcome_type', LongFormatRow.outcome_type, 'category'),
+    ('value', LongFormatRow.value, 'text'),
+    ('value_numeric', LongFormatRow.value_numeric, 'number'),
+    ('value_parse_status', LongFormatRow.value_parse_status, 'category'),
+    ('observation_time', LongFormatRow.observation_time, 'text'),
+]
+
+KIND_DTYPES = {
+    'id': np.int32,
+    'integer': np.int32,
+    'number': np.float64,
+    'date': 'datetime64[D]',
+    'category': np.int32,  # while writing; narrowed at the end
+}
+
+# Studies read per query; progress is reported in between
+SNAPSHOT_STUDY_CHUNK = 200
+
+
+def write_snapshot(directory, filters=None, report=None):
+    """
+    Write the fact rows matching `filters` (long_format_query keyword
+    arguments) as a snapshot directory; returns the manifest.
+    `report(fraction)` is called after each chunk when given.
+    """
+    filters = filters or {}
+    os.makedirs(directory, exist_ok=True)
+    # Entries after this cursor in /api/changes are newer than the snapshot
+    change_cursor = db.session.query(db.func.max(Change.id)).scalar() or 0
+    study_ids = [
+        row[0] for row in
+        long_format_query(**filters).with_entities(LongFormatRow.study_id).order_by(None)
+        .distinct().order_by(LongFormatRow.study_id)
+    ]
+
+    dictionaries = {name: {} for name, _, kind in SNAPSHOT_COLUMNS if kind == 'category'}
+    raw_files, text_bytes = {}, {}
+    for name, _, kind in SNAPSHOT_COLUMNS:
+        suffixes = ('', '.data', '.missing') if kind == 'text' else ('',)
+        for suffix in suffixes:
+            raw_files[name + suffix] = open(os.path.join(directory, f'{name}{suffix}.raw'), 'wb')
+        if kind == 'text':
+            np.zeros(1, dtype=np.int64).tofile(raw_files[name])  # offsets start at 0
+            text_bytes[name] = 0
+    rows = 0
+    try:
+        for start in range(0, len(study_ids), SNAPSHOT_STUDY_CHUNK):
+            # Each chunk is fetched in full before progress is written, so
+            # SQLite never has a reader open across the progress commit
+            chunk = (
+                long_format_query(**filters)
+                .filter(LongFormatRow.study_id.in_(study_ids[start:start + SNAPSHOT_STUDY_CHUNK]))
+                .with_entities(*[column for _, column, _ in SNAPSHOT_COLUMNS])
+                .all()
+            )
+            for (name, _, kind), values in zip(SNAPSHOT_COLUMNS, zip(*chunk)):
+                if kind == 'category':
+                    index = dictionaries[name]
+                    np.fromiter((-1 if value is None else index.setdefault(value, len(index))
+                                 for value in values), dtype=np.int32, count=len(values)).tofile(raw_files[name])
+                elif kind == 'text':
+                    encoded = [(value or '').encode('utf-8') for value in values]
+                    ends = np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)))
+                    (ends + text_bytes[name]).tofile(raw_files[name])
+                    raw_files[name + '.data'].write(b''.join(encoded))
+                    np.fromiter((value is None for value in values), dtype=np.bool_,
+                                count=len(values)).tofile(raw_files[name + '.missing'])
+                    text_bytes[name] += int(ends[-1])
+                else:
+                    np.array(values, dtype=KIND_DTYPES[kind]).tofile(raw_files[name])
+            rows += len(chunk)
+            if report:
+                report(min(start + SNAPSHOT_STUDY_CHUNK, len(study_ids)) / len(study_ids))
+    finally:
+        for f in raw_files.values():
+            f.close()
+
+    columns = {}
+    for name, _, kind in SNAPSHOT_COLUMNS:
+        raw = os.path.join(directory, f'{name}.raw')
+        column = columns[name] = {'file': f'{name}.npy', 'kind': kind}
+        if kind == 'category':
+            dictionary = sorted(dictionaries[name])
+            dtype = next(dtype for dtype in (np.int8, np.int16, np.int32)
+                         if len(dictionary) <= np.iinfo(dtype).max)
+            # remap[old code + 1] is the new code; old code -1 (missing) stays -1
+            remap = np.full(len(dictionary) + 1, -1, dtype=dtype)
+            for new, value in enumerate(dictionary):
+                remap[dictionaries[name][value] + 1] = new
+            _write_npy(raw, os.path.join(directory, column['file']), np.dtype(np.int32), dtype, rows,
+                       lambda codes: remap[codes + 1])
+            column['dictionary'] = f'{name}.dictionary.npy'
+            np.save(os.path.join(directory, column['dictionary']), np.array(dictionary, dtype=str))
+            column['categories'] = len(dictionary)
+        elif kind == 'text':
+            dtype = np.dtype(np.int64)
+            _write_npy(raw, os.path.join(directory, column['file']), dtype, dtype, rows + 1)
+            for part, part_dtype, length in (('data', np.uint8, text_bytes[name]), ('missing', np.bool_, rows)):
+                column[part] = f'{name}.{part}.npy'
+                part_raw = os.path.join(directory, f'{name}.{part}.raw')
+                _write_npy(part_raw, os.path.join(directory, column[part]), np.dtype(part_dtype),
+                           np.dtype(part_dtype), length)
+                os.remove(part_raw)
+        else:
+            dtype = np.dtype(KIND_DTYPES[kind])
+            _write_npy(raw, os.path.join(directory, column['file']), dtype, dtype, rows)
+        column['dtype'] = np.dtype(dtype).str
+        os.remove(raw)
+
+    manifest = {
+        'format': SNAPSHOT_FORMAT,
+        'version': SNAPSHOT_VERSION,
+        'created_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'rows': rows,
+        'filters': {name: value.isoformat() if hasattr(value, 'isoformat') else value
+                    for name, value in filters.items() if value is not None},
+        'change_cursor': change_cursor,
+        'columns': columns,
+    }
+    with open(os.path.join(directory, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def _write_npy(raw, path, raw_dtype, dtype, length, convert=None):
+    header = {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False, 'shape': (length,)}
+    with open(raw, 'rb') as source, open(path, 'wb') as out:
+        np.lib.format.write_array_header_1_0(out, header)
+        if convert is None:
+            shutil.copyfileobj(source, out)
+            return
+        while True:
+            chunk = np.fromfile(source, dtype=raw_dtype, count=1 << 16)
+            if not len(chunk):
+                break
+            convert(chunk).astype(dtype, copy=False).tofile(out)
+
+
+def pack_snapshot(directory, out):
+    """Write a snapshot directory to the binary stream `out` as an uncompressed tar, manifest first."""
+    names = [MANIFEST] + sorted(name for name in os.listdir(directory) if name.endswith('.npy'))
+    with tarfile.open(fileobj=out, mode='w|') as archive:
+        for name in names:
+            archive.add(os.path.join(directory, name), arcname=name)
+
+
+def export_snapshot(path, filters=None, report=None):
+    """Write a snapshot to `path`: a .tar file, or otherwise a directory. Returns the manifest."""
+    if not path.endswith('.tar'):
+        return write_snapshot(path, filters, report)
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path))) as directory:
+        manifest = write_snapshot(directory, filters, report)
+        with open(path, 'wb') as out:
+            pack_snapshot(directory, out)
+    return manifest
@@ -0,0 +1,132 @@
+"""
+Reader for ToxBase columnar snapshots (see snapshot.py, `flask
+export-snapshot` and the `snapshot` background job). Needs only NumPy, so
+it can be copied next to an analysis script.
+
+A snapshot is a directory, or an uncompressed tar of one, holding
+snapshot.json and the .npy files of each column, one entry per outcome.
+Columns are memory-mapped, so opening a snapshot of millions of rows reads
+only the small manifest, and pages are loaded as they are used:
+
+    from snapshot_reader import open_snapshot
+
+    snap = open_snapshot('toxbase_snapshot.tar')
+    rats = snap.codes('species') == snap.code('species', 'Rat')
+    snap['dose_ppm'][rats].mean()
+    snap.labels('outcome_type')[:5]
+    df = snap.to_pandas()  # categorical columns, if pandas is installed
+
+Column kinds: 'id' (int32, for re-joining with the JSON API), 'number'
+(float64, NaN when missing), 'integer' (int32), 'date' (datetime64[D],
+NaT when missing), 'category' (int8/16/32 codes into a sorted dictionary
+stored in its own .npy file, -1 when missing) and 'text' for free text
+(int64 offsets into a UTF-8 byte array, plus a mask of missing values).
+"""
+import json
+import os
+import tarfile
+import numpy as np
+
+SNAPSHOT_FORMAT = 'toxbase-snapshot'
+SNAPSHOT_VERSION = 2
+MANIFEST = 'snapshot.json'
+
+
+class Snapshot:
+    """An opened snapshot; columns are loaded (or mapped) on first access."""
+
+    def __init__(self, manifest, load):
+        if manifest.get('format') != SNAPSHOT_FORMAT or manifest.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"Not a version {SNAPSHOT_VERSION} ToxBase snapshot")
+        self.manifest = manifest
+        self.rows = manifest['rows']
+        self.columns = list(manifest['columns'])
+        self._load = load
+        self._arrays = {}
+        self._dictionaries = {}
+
+    def __getitem__(self, name):
+        """The stored array of a column (codes for categories, offsets for text)."""
+        return self._file(self.manifest['columns'][name]['file'])
+
+    def __len__(self):
+        return self.rows
+
+    def _file(self, file):
+        if file not in self._arrays:
+            self._arrays[file] = self._load(file)
+        return self._arrays[file]
+
+    def kind(self, name):
+        return self.manifest['columns'][name]['kind']
+
+    def dictionary(self, name):
+        """Sorted distinct values of a category column, as a string array."""
+        return self._file(self.manifest['columns'][name]['dictionary'])
+
+    def codes(self, name):
+        return self[name]
+
+    def code(self, name, value):
+        """Code of `value` in a category column, or -1 if it never occurs."""
+        dictionary = self.dictionary(name)
+        i = int(np.searchsorted(dictionary, value))
+        return i if i < len(dictionary) and dictionary[i] == value else -1
+
+    def labels(self, name):
+        """A category or text column decoded to an object array of strings (None when missing)."""
+        if self.kind(name) == 'text':
+            column = self.manifest['columns'][name]
+            offsets, data = self[name], self._file(column['data'])
+            labels = np.empty(self.rows, dtype=object)
+            labels[:] = [bytes(data[start:end]).decode('utf-8')
+                         for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+            labels[self._file(column['missing'])] = None
+            return labels
+        labels = np.append(self.dictionary(name).astype(object), None)  # code -1 picks the trailing None
+        return labels[self[name]]
+
+    def to_pandas(self, columns=None):
+        """A DataFrame with categorical columns built from the codes, without decoding them."""
+        import pandas as pd
+
+        data = {}
+        for name in columns or self.columns:
+            if self.kind(name) == 'category':
+                data[name] = pd.Categorical.from_codes(self[name], categories=self.dictionary(name))
+            elif self.kind(name) == 'text':
+                data[name] = self.labels(name)
+            else:
+                data[name] = self[name]
+        return pd.DataFrame(data)
+
+
+def open_snapshot(path, mmap=True):
+    """Open a snapshot directory or uncompressed .tar; mmap=False reads the columns into memory."""
+    if os.path.isdir(path):
+        with open(os.path.join(path, MANIFEST), encoding='utf-8') as f:
+            manifest = json.load(f)
+        return Snapshot(manifest, lambda file: np.load(os.path.join(path, file), mmap_mode='r' if mmap else None))
+
+    try:
+        archive = tarfile.open(path, mode='r:')
+    except tarfile.ReadError:
+        raise ValueError(f'{path} is not an uncompressed tar; gunzip a downloaded .tar.gz first')
+    with archive:
+        members = {member.name: member for member in archive.getmembers()}
+        manifest = json.load(archive.extractfile(members[MANIFEST]))
+
+    def load(file):
+        # Tar members are stored contiguously, so a column is mapped at its offset
+        with open(path, 'rb') as f:
+            f.seek(members[file].offset_data)
+            version = np.lib.format.read_magic(f)
+            read_header = (np.lib.format.read_array_header_1_0 if version == (1, 0)
+                           else np.lib.format.read_array_header_2_0)
+            shape, fortran_order, dtype = read_header(f)
+            offset = f.tell()
+            if not mmap or not np.prod(shape):  # empty files cannot be mapped
+                return np.fromfile(f, dtype=dtype, count=int(np.prod(shape)))
+        return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+
+    return Snapshot(manifest, load)
@@ -0,0 +1,44 @@
+import os
+
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy.orm import configure_mappers
+
+from models import db
+
+# Worker start-up costs. Jinja compiles each template to Python the first
+# time a worker renders it, and SQLAlchemy configures its mappers on the
+# first query, so the first hits after a deploy pay for both. With
+# TEMPLATE_CACHE_DIR set, compiled templates are stored there and later
+# workers only unmarshal them; `flask compile-templates` fills the
+# directory at build time. PRELOAD_APP does the remaining first-request
+# work while the app is created, so that with `gunicorn --preload` it runs
+# once in the master and every forked worker starts warm.
+
+
+def init_template_cache(app):
+    directory = app.config['TEMPLATE_CACHE_DIR']
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+
+def preload_templates(app):
+    """
+    Load every template into the environment's template cache, compiling
+    (and writing to the bytecode cache) those not compiled yet. Call after
+    all filters and globals are registered. Returns the template names.
+    """
+    names = [name for name in app.jinja_env.list_templates() if name.endswith('.html')]
+    for name in names:
+        app.jinja_env.get_template(name)
+    return names
+
+
+def preload_app(app):
+    """Load templates, configure the ORM and create the engine ahead of the first request."""
+    preload_templates(app)
+    configure_mappers()
+    with app.app_context():
+        # Creating the engine imports the dialect; pooled connections must
+        # not outlive a fork, so any opened by the migration check are closed
+        db.engine.dispose()
@@ -0,0 +1,250 @@
+from datetime import datetime
+
+from models import db, Toxin, Study, AnimalModel, DoseGroup, Outcome, AdditionalMetadata
+from changes import study_changed
+from duplicates import DuplicateStudyError, find_duplicate, tree_content_hash
+from toxins import find_toxin
+from units import dose_to_ppm, parse_outcome_value, set_molecular_weight
+from vocabulary import SEX_CHOICES, DOSE_UNIT_CHOICES, OUTCOME_TYPE_CHOICES, WORK_EMAIL_RE
+
+SEXES = {value for value, _ in SEX_CHOICES}
+DOSE_UNITS = {value for value, _ in DOSE_UNIT_CHOICES}
+OUTCOME_TYPES = {value for value, _ in OUTCOME_TYPE_CHOICES}
+
+
+class SubmissionError(ValueError):
+    """A submitted study tree failed validation; `errors` lists (path, message)."""
+
+    def __init__(self, errors):
+        super().__init__('; '.join(f'{path}: {message}' for path, message in errors))
+        self.errors = errors
+
+
+def submit_study_tree(payload):
+    """
+    Validate and store a whole study tree in one transaction.
+
+    `payload` has the shape returned by GET /api/studies/<id> plus
+    contributor_email: study fields, `metadata` as a {name: value} dict and
+    nested animal_models → dose_groups → outcomes lists, each with their own
+    `metadata`. Everything is checked with the wizard's rules before anything
+    is written; then the ORM graph is added and flushed once for its ids, the
+    metadata goes in as one executemany INSERT, and the transaction commits
+    once. Raises SubmissionError and writes nothing if any part is invalid.
+
+    A tree whose content matches an existing study (see duplicates.py) is
+    refused with DuplicateStudyError unless the payload sets
+    allow_duplicate; the check is one lookup on the content_hash index.
+    """
+    tree = _validate(payload)
+    if not payload.get('allow_duplicate'):
+        duplicate_of = find_duplicate(tree_content_hash(tree))
+        if duplicate_of is not None:
+            raise DuplicateStudyError(duplicate_of)
+
+    try:
+        toxin = find_toxin(tree['toxin_name'])
+        if toxin is None:
+            toxin = Toxin(name=tree['toxin_name'], description='', molecular_weight=tree['molecular_weight'])
+            db.session.add(toxin)
+        elif tree['molecular_weight'] and not toxin.molecular_weight:
+            set_molecular_weight(toxin, tree['molecular_weight'])
+
+        study = Study(toxin=toxin, **tree['study'])
+        entities = [('study', study, tree['metadata'])]
+        for animal in tree['animal_models']:
+            animal_model = AnimalModel(study=study, **animal['fields'])
+            entities.append(('animal_model', animal_model, animal['metadata']))
+            for dose in animal['dose_groups']:
+                dose_group = DoseGroup(
+                    animal_model=animal_model,
+                    dose_ppm=dose_to_ppm(dose['fields']['dose_value'], dose['fields']['dose_unit'],
+                                         dose['fields']['custom_dose_unit'], toxin.molecular_weight),
+                    **dose['fields']
+                )
+                entities.append(('dose_group', dose_group, dose['metadata']))
+                for outcome in dose['outcomes']:
+                    value_numeric, value_parse_status = parse_outcome_value(outcome['fields']['value'])
+                    entities.append(('outcome', Outcome(dose_group=dose_group, value_numeric=value_numeric,
+                                                        value_parse_status=value_parse_status,
+                                                        **outcome['fields']), outcome['metadata']))
+
+        db.session.add(study)
+        db.session.flush()
+
+        metadata = [
+            {'entity_type': entity_type, 'entity_id': obj.id, 'field_name': name, 'field_value': value}
+            for entity_type, obj, fields in entities
+            for name, value in fields.items()
+        ]
+        if metadata:
+            db.session.execute(AdditionalMetadata.__table__.insert(), metadata)
+
+        study_changed(study.id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return study
+
+
+def _validate(payload):
+    """Check the whole tree, collecting every error, and return normalized fields."""
+    errors = []
+
+    def check(path, condition, message):
+        if not condition:
+            errors.append((path, message))
+        return condition
+
+    if not isinstance(payload, dict):
+        raise SubmissionError([('', 'Expected a JSON object')])
+
+    toxin = payload.get('toxin')
+    toxin_name = _text(payload.get('toxin_name') or (toxin.get('name') if isinstance(toxin, dict) else toxin))
+    check('name', _text(payload.get('name')), 'Study name is required')
+    check('toxin_name', toxin_name, 'Toxin name is required')
+    email = _text(payload.get('contributor_email'))
+    check('contributor_email', WORK_EMAIL_RE.match(email), 'Please use your university or work e-mail address.')
+
+    date_conducted = None
+    if payload.get('date_conducted'):
+        try:
+            date_conducted = datetime.strptime(str(payload['date_conducted']), '%Y-%m-%d').date()
+        except ValueError:
+            check('date_conducted', False, 'Invalid date format. Please use YYYY-MM-DD.')
+
+    molecular_weight = None
+    if payload.get('molecular_weight') not in (None, ''):
+        molecular_weight = _number(payload['molecular_weight'])
+        check('molecular_weight', molecular_weight and molecular_weight > 0,
+              'Molecular weight must be a positive number (g/mol).')
+
+    tree = {
+        'toxin_name': toxin_name,
+        'molecular_weight': molecular_weight,
+        'study': {
+            'name': _text(payload.get('name')),
+            'description': _text(payload.get('description')),
+            'date_conducted': date_conducted,
+            'author': _text(payload.get('author')),
+            'contributor_name': _text(payload.get('contributor_name')),
+            'contributor_email': email,
+            'publication_reference': _text(payload.get('publication_reference')),
+        },
+        'metadata': _metadata(payload, 'metadata', check),
+        'animal_models': [],
+    }
+
+    for a, animal in enumerate(_children(payload, 'animal_models', '', check)):
+        path = f'animal_models[{a}]'
+        check(f'{path}.species', _text(animal.get('species')), 'Species is required')
+        check(f'{path}.sex', animal.get('sex') in SEXES, f"Sex must be one of {', '.join(sorted(SEXES))}")
+        animal_tree = {
+            'fields': {field: _text(animal.get(field))
+                       for field in ('species', 'strain', 'sex', 'age', 'weight', 'description')},
+            'metadata': _metadata(animal, f'{path}.metadata', check),
+            'dose_groups': [],
+        }
+        tree['animal_models'].append(animal_tree)
+
+        for d, dose in enumerate(_children(animal, 'dose_groups', path, check)):
+            dose_path = f'{path}.dose_groups[{d}]'
+            dose_value = _number(dose.get('dose_value'))
+            check(f'{dose_path}.dose_value', dose_value is not None and dose_value >= 0,
+                  'Dose value must be non-negative')
+            group_size = dose.get('group_size')
+            check(f'{dose_path}.group_size', _is_int(group_size) and int(group_size) > 0,
+                  'Group size must be a positive integer')
+            dose_unit = dose.get('dose_unit')
+            custom_dose_unit = _text(dose.get('custom_dose_unit')) if dose_unit == 'other' else None
+            if check(f'{dose_path}.dose_unit', dose_unit in DOSE_UNITS,
+                     f"Dose unit must be one of {', '.join(sorted(DOSE_UNITS))}") and dose_unit == 'other':
+                check(f'{dose_path}.custom_dose_unit', custom_dose_unit, 'A custom dose unit is required')
+            route = _text(dose.get('route_of_exposure')) or 'unknown'
+            check(f'{dose_path}.route_of_exposure', len(route) <= 30,
+                  'Route of exposure must be at most 30 characters')
+
+            dose_tree = {
+                'fields': {
+                    'dose_value': dose_value,
+                    'dose_unit': dose_unit,
+                    'custom_dose_unit': custom_dose_unit,
+                    'group_size': int(group_size) if _is_int(group_size) else None,
+                    'exposure_duration': _text(dose.get('exposure_duration')),
+                    'route_of_exposure': route,
+                },
+                'metadata': _metadata(dose, f'{dose_path}.metadata', check),
+                'outcomes': [],
+            }
+            animal_tree['dose_groups'].append(dose_tree)
+
+            for o, outcome in enumerate(_children(dose, 'outcomes', dose_path, check)):
+                outcome_path = f'{dose_path}.outcomes[{o}]'
+                outcome_type = outcome.get('outcome_type')
+                custom_outcome_type = _text(outcome.get('custom_outcome_type')) if outcome_type == 'other' else None
+                if check(f'{outcome_path}.outcome_type', outcome_type in OUTCOME_TYPES,
+                         f"Outcome type must be one of {', '.join(sorted(OUTCOME_TYPES))}") \
+                        and outcome_type == 'other':
+                    check(f'{outcome_path}.custom_outcome_type', custom_outcome_type,
+                          'A custom outcome type is required')
+                value = _text(outcome.get('value'))
+                if check(f'{outcome_path}.value', value, 'Outcome value is required') and outcome_type == 'cancer':
+                    check(f'{outcome_path}.value', _is_int(value) and int(value) >= 0,
+                          'Tumor count must be a non-negative integer')
+
+                dose_tree['outcomes'].append({
+                    'fields': {
+                        'outcome_type': outcome_type,
+                        'custom_outcome_type': custom_outcome_type,
+                        'value': value,
+                        'observation_time': _text(outcome.get('observation_time')),
+                        'notes': _text(outcome.get('notes')),
+                    },
+                    'metadata': _metadata(outcome, f'{outcome_path}.metadata', check),
+                })
+
+    if errors:
+        raise SubmissionError(errors)
+    return tree
+
+
+def _children(node, key, path, check):
+    children = node.get(key) or []
+    if not check(f'{path}.{key}'.lstrip('.'), isinstance(children, list), 'Expected a list'):
+        return []
+    valid = []
+    for i, child in enumerate(children):
+        if check(f'{path}.{key}[{i}]'.lstrip('.'), isinstance(child, dict), 'Expected an object'):
+            valid.append(child)
+    return valid
+
+
+def _metadata(node, path, check):
+    metadata = node.get('metadata') or {}
+    if not check(path, isinstance(metadata, dict), 'Expected an object of field name → value'):
+        return {}
+    fields = {}
+    for name, value in metadata.items():
+        name = name.strip()
+        if name and check(f'{path}.{name}', len(name) <= 100, 'Field name must be at most 100 characters'):
+            fields[name] = _text(value)
+    return fields
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_int(value):
+    try:
+        return int(str(value)) == float(str(value))
+    except ValueError:
+        return False
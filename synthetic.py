@@ -0,0 +1,154 @@
+import csv
+import random
+from datetime import date, timedelta
+from io import StringIO
+
+from models import db, Toxin, Study, AnimalModel, DoseGroup, Outcome, AdditionalMetadata
+from changes import studies_changed
+from exports import EXPORT_HEADER
+from importer import import_long_format
+
+# Deterministic synthetic datasets for benchmarking. The tree is written
+# through the bulk importer, so normalization, the fact table and the search
+# index are maintained exactly as for real uploads.
+
+SYNTHETIC_EMAIL = 'synthetic@toxdb.example.org'
+
+TOXIN_NAMES = [
+    ('Benzene', 78.11), ('Formaldehyde', 30.03), ('Toluene', 92.14), ('Styrene', 104.15),
+    ('Acrylonitrile', 53.06), ('Vinyl chloride', 62.50), ('Trichloroethylene', 131.39),
+    ('1,3-Butadiene', 54.09), ('Ethylene oxide', 44.05), ('Chloroform', 119.38),
+]
+SPECIES = [('Rat', ['F344', 'Sprague-Dawley', 'Wistar']), ('Mouse', ['B6C3F1', 'CD-1', 'C57BL/6']),
+           ('Hamster', ['Syrian golden'])]
+ROUTES = ['inhalation', 'inhalation', 'oral', 'dermal']
+DOSE_UNITS = {'inhalation': ['ppm', 'ppm', 'mg/m3', 'ppb'], 'oral': ['mg/kg/day'], 'dermal': ['mg/kg']}
+AUTHORS = ['Smith J', 'Tanaka H', 'Müller K', 'Okafor A', 'Rossi L', 'Kowalski P', 'Nguyen T']
+OBSERVATIONS = ['6 months', '12 months', '18 months', '24 months', 'terminal sacrifice']
+
+# AdditionalMetadata pairs per entity, on average
+METADATA_RATES = {'study': 2.0, 'animal_model': 1.0, 'dose_group': 0.5, 'outcome': 0.3}
+METADATA_FIELDS = ['GLP compliant', 'lab', 'vehicle', 'diet', 'housing', 'batch', 'histopathology',
+                   'reviewer', 'purity', 'comment']
+
+
+def generate_synthetic(toxins=5, studies_per_toxin=20, animal_models=2, dose_groups=4, outcomes=3,
+                       seed=0, progress=None):
+    """
+    Create toxins × studies × animal models × dose groups × outcomes rows
+    plus AdditionalMetadata at METADATA_RATES. The same arguments always
+    produce the same data. Returns the number of rows created per table.
+    """
+    rng = random.Random(seed)
+
+    # Toxins first, so mg/m3 doses convert to ppm through the molecular weight
+    toxin_names = []
+    for i in range(toxins):
+        name, weight = TOXIN_NAMES[i % len(TOXIN_NAMES)]
+        if i >= len(TOXIN_NAMES):
+            name = f'{name} {i // len(TOXIN_NAMES) + 1}'
+        toxin_names.append(name)
+        if not Toxin.query.filter_by(name=name).first():
+            db.session.add(Toxin(name=name, description='Synthetic', molecular_weight=weight))
+    db.session.commit()
+
+    marks = {model: db.session.query(db.func.coalesce(db.func.max(model.id), 0)).scalar()
+             for model in (Study, AnimalModel, DoseGroup, Outcome)}
+
+    rows = _synthetic_rows(rng, toxin_names, studies_per_toxin, animal_models, dose_groups, outcomes)
+    report = import_long_format(_csv_lines(rows), SYNTHETIC_EMAIL, 'Synthetic data',
+                                progress=progress)
+    if report.errors:
+        raise ValueError(f'Synthetic rows rejected: {report.errors[:5]}')
+
+    metadata = _add_metadata(rng, marks)
+    return {
+        'toxins': toxins,
+        'studies': report.studies_created,
+        'animal_models': report.animal_models_created,
+        'dose_groups': report.dose_groups_created,
+        'outcomes': report.outcomes_created,
+        'additional_metadata': metadata,
+    }
+
+
+def _synthetic_rows(rng, toxin_names, studies_per_toxin, animal_models, dose_groups, outcomes):
+    source_id = 0
+    start = date(1980, 1, 1)
+    for toxin_name in toxin_names:
+        # Each toxin gets its own dose-response curve; studies scatter around it
+        ed50 = 10 ** rng.uniform(0.5, 3)
+        slope = rng.uniform(0.8, 2.5)
+        for s in range(studies_per_toxin):
+            source_id += 1
+            route = rng.choice(ROUTES)
+            unit = rng.choice(DOSE_UNITS[route])
+            study = [source_id, f'{toxin_name} {route} study {s + 1}', toxin_name,
+                     (start + timedelta(days=rng.randrange(15000))).isoformat(),
+                     rng.choice(AUTHORS), 'Synthetic data']
+            top = 10 ** rng.uniform(1, 3.5)
+
+            for a in range(animal_models):
+                species, strains = rng.choice(SPECIES)
+                animal = [species, rng.choice(strains), rng.choice(['male', 'female']),
+                          f'{6 + a} weeks', f'{rng.randint(18, 300)} g']
+
+                for d in range(dose_groups):
+                    # Zero-dose control, then log-spaced doses up to `top`
+                    dose = 0.0 if d == 0 else round(top / 3 ** (dose_groups - 1 - d), 3)
+                    size = rng.choice([10, 20, 50, 50, 50, 60])
+                    dose_group = [dose, unit, route, size, rng.choice(['13 weeks', '2 years'])]
+                    p = 0.02 if dose == 0 else 1 / (1 + (ed50 / dose) ** slope)
+
+                    for o in range(outcomes):
+                        affected = sum(rng.random() < p for _ in range(size))
+                        outcome_type, value = rng.choice([
+                            ('cancer', str(affected)),
+                            ('other', f'{affected}/{size}'),
+                            ('other', f'{100 * affected / size:.1f}%'),
+                        ])
+                        outcome = [outcome_type if outcome_type == 'cancer' else 'tumour incidence',
+                                   value, rng.choice(OBSERVATIONS), f'Synthetic outcome {o + 1}']
+                        yield study + animal + dose_group + outcome
+
+
+def _csv_lines(rows):
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    for row in _prepend(EXPORT_HEADER, rows):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(row)
+        yield buffer.getvalue()
+
+
+def _prepend(first, rest):
+    yield first
+    yield from rest
+
+
+def _add_metadata(rng, marks):
+    """Attach metadata to the entities created after `marks` (max ids before the import)."""
+    entities = [('study', Study), ('animal_model', AnimalModel), ('dose_group', DoseGroup),
+                ('outcome', Outcome)]
+    created = 0
+    for entity_type, model in entities:
+        ids = [row[0] for row in
+               db.session.query(model.id).filter(model.id > marks[model]).order_by(model.id)]
+        rate = METADATA_RATES[entity_type]
+        rows = []
+        for entity_id in ids:
+            count = int(rate) + (rng.random() < rate - int(rate))
+            for field in rng.sample(METADATA_FIELDS, count):
+                rows.append({'entity_type': entity_type, 'entity_id': entity_id,
+                             'field_name': field, 'field_value': f'{field} value {rng.randint(1, 99)}'})
+        if rows:
+            db.session.execute(AdditionalMetadata.__table__.insert(), rows)
+        created += len(rows)
+
+    # Metadata is part of each study's search document and version
+    study_ids = [row[0] for row in db.session.query(Study.id).filter(Study.id > marks[Study])]
+    for i in range(0, len(study_ids), 500):
+        studies_changed(study_ids[i:i + 500])
+    db.session.commit()
+    return created
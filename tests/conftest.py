@@ -0,0 +1,38 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def migrated_db(tmp_path_factory):
+    """A database file upgraded to head once; each test gets a copy."""
+    path = str(tmp_path_factory.mktemp('db') / 'template.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from app import create_app
+    from models import db
+    with create_app().app_context():
+        db.engine.dispose()  # closing the last connection checkpoints the WAL into the file
+    return path
+
+
+@pytest.fixture
+def app(migrated_db, tmp_path, monkeypatch):
+    path = str(tmp_path / 'toxbase.db')
+    shutil.copy(migrated_db, path)
+    monkeypatch.setenv('DATABASE_URL', f'sqlite:///{path}')
+    monkeypatch.setenv('AUTO_MIGRATE', '0')
+    monkeypatch.setenv('JOB_RESULTS_DIR', str(tmp_path / 'jobs'))
+    from app import create_app
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,54 @@
+from models import Toxin
+
+
+def submit(client, doses):
+    """One study of Benzene with a dose group per (dose ppm, [(outcome type, value)])."""
+    response = client.post('/api/studies', json={
+        'name': 'Benzene inhalation', 'toxin_name': 'Benzene', 'contributor_email': 'a.b@example.edu',
+        'animal_models': [{'species': 'Rat', 'sex': 'male', 'dose_groups': [
+            {'dose_value': dose, 'dose_unit': 'ppm', 'group_size': 50, 'route_of_exposure': 'inhalation',
+             'outcomes': [_outcome(outcome_type, value) for outcome_type, value in outcomes]}
+            for dose, outcomes in doses
+        ]}],
+    })
+    assert response.status_code == 201
+    return Toxin.query.filter_by(name='Benzene').one().id
+
+
+def _outcome(outcome_type, value):
+    if outcome_type in ('cancer', 'organ_weight', 'mortality'):
+        return {'outcome_type': outcome_type, 'value': value}
+    return {'outcome_type': 'other', 'custom_outcome_type': outcome_type, 'value': value}
+
+
+def dose_response(client, toxin_id):
+    response = client.get(f'/api/toxins/{toxin_id}/dose-response?bins=2')
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_measurements_are_not_incidences(client):
+    toxin_id = submit(client, [
+        (10, [('cancer', '5'), ('organ_weight', '12'), ('mortality', '10%')]),
+        (100, [('cancer', '25'), ('organ_weight', '3'), ('organ_weight', '20%')]),
+    ])
+    low, high = dose_response(client, toxin_id)['bins']
+
+    # 5 tumour-bearing and 5 dead of 50 each; the organ weight of 12 is not 12 affected animals
+    assert low['pooled_incidence'] == 0.1
+    # The 20 % organ weight change is not an incidence either
+    assert high['pooled_incidence'] == 0.5
+
+
+def test_weighted_means_are_kept_per_outcome_type(client):
+    toxin_id = submit(client, [(10, [('cancer', '5'), ('organ_weight', '12')])])
+    (low,) = dose_response(client, toxin_id)['bins']
+
+    means = {(mean['outcome_type'], mean['parse_status']): mean['mean'] for mean in low['weighted_means']}
+    assert means == {('cancer', 'exact'): 5.0, ('organ_weight', 'exact'): 12.0}
+
+
+def test_ratio_is_incidence_for_any_outcome_type(client):
+    toxin_id = submit(client, [(10, [('liver necrosis', '10/50'), ('liver necrosis', '7')])])
+    (low,) = dose_response(client, toxin_id)['bins']
+    assert low['pooled_incidence'] == 0.2
@@ -0,0 +1,20 @@
+def submit(client, toxin_name, name):
+    response = client.post('/api/studies', json={
+        'name': name, 'toxin_name': toxin_name, 'contributor_email': 'a.b@example.edu',
+        'animal_models': [{'species': 'Rat', 'sex': 'male', 'dose_groups': [
+            {'dose_value': 10, 'dose_unit': 'ppm', 'group_size': 10,
+             'outcomes': [{'outcome_type': 'mortality', 'value': '2'}]},
+        ]}],
+    })
+    assert response.status_code == 201
+
+
+def test_studies_toxin_filter_matches_exports(client):
+    submit(client, 'Benzene', 'Benzene inhalation')
+    submit(client, 'Toluene', 'Toluene inhalation')
+
+    studies = client.get('/api/studies?toxin=%20benzene%20').get_json()['studies']
+    assert [study['name'] for study in studies] == ['Benzene inhalation']
+
+    export = client.get('/export?toxin=%20benzene%20').get_data(as_text=True).splitlines()
+    assert len(export) == 2
@@ -0,0 +1,39 @@
+import pytest
+
+from app import create_app
+
+
+class DictBackend:
+    def __init__(self, app=None):
+        self.app = app
+        self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value):
+        self.entries[key] = value
+
+
+def make_backend(app):
+    return DictBackend(app)
+
+
+@pytest.mark.parametrize('backend', ['LRU', 'memcached', 'no_such_module:Backend', 'cache:LRUCache.nothing'])
+def test_bad_backend_fails_at_start_up(app, monkeypatch, backend):
+    monkeypatch.setenv('RENDER_CACHE_BACKEND', backend)
+    with pytest.raises(ValueError, match='RENDER_CACHE_BACKEND'):
+        create_app()
+
+
+def test_bad_backend_object_fails_at_start_up(app, monkeypatch):
+    monkeypatch.setattr('cache.LRUCache', lambda size: object())
+    with pytest.raises(ValueError, match='lru, filesystem, none'):
+        create_app()
+
+
+@pytest.mark.parametrize('path', ['test_cache:DictBackend', 'test_cache:make_backend'])
+def test_custom_backend_from_import_path(app, monkeypatch, path):
+    monkeypatch.setenv('RENDER_CACHE_BACKEND', path)
+    backend = create_app().extensions['render_cache'].backend
+    assert isinstance(backend, DictBackend) and backend.app is not None
@@ -0,0 +1,25 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app import create_app
+from models import db, Toxin
+
+
+@pytest.fixture
+def instrumented(app, monkeypatch):
+    monkeypatch.setenv('INSTRUMENTATION', '1')
+    app = create_app()
+    with app.app_context():
+        yield app
+
+
+def test_failed_statement_leaves_no_timing_state(instrumented):
+    db.session.add(Toxin(name='Benzene', description=''))
+    db.session.commit()
+    db.session.add(Toxin(name='Benzene', description=''))
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+    db.session.rollback()
+
+    assert 'query_start' not in db.session.connection().info
+    assert instrumented.test_client().get('/studies').status_code == 200
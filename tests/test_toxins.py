@@ -0,0 +1,28 @@
+from models import Toxin, normalize_toxin_name
+
+
+def wizard_form(toxin_name):
+    return {'name': 'Inhalation study', 'toxin_name': toxin_name, 'contributor_email': 'a.b@example.edu'}
+
+
+def test_normalize_toxin_name():
+    assert normalize_toxin_name('  Benzene ') == 'benzene'
+
+
+def test_wizard_reuses_toxin_with_trailing_space(client):
+    for _ in range(2):
+        response = client.post('/study/new', data=wizard_form('Benzene '))
+        assert response.status_code == 302
+
+    toxins = Toxin.query.all()
+    assert [(toxin.name, toxin.name_key) for toxin in toxins] == [('Benzene', 'benzene')]
+    assert len(toxins[0].studies) == 2
+
+
+def test_json_submission_reuses_wizard_toxin(client):
+    client.post('/study/new', data=wizard_form('Benzene '))
+    response = client.post('/api/studies', json={
+        'name': 'Oral study', 'toxin_name': 'BENZENE', 'contributor_email': 'a.b@example.edu',
+    })
+    assert response.status_code == 201
+    assert Toxin.query.count() == 1
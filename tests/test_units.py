@@ -0,0 +1,35 @@
+import pytest
+
+from units import PARSE_EXACT, PARSE_PARTIAL, PARSE_PERCENT, PARSE_RATIO, PARSE_UNPARSED, parse_outcome_value
+
+
+def test_percent_and_ratio_share_one_scale():
+    assert parse_outcome_value('24%') == (0.24, PARSE_PERCENT)
+    assert parse_outcome_value('12/50') == (0.24, PARSE_RATIO)
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('1,250', (1250.0, PARSE_EXACT)),
+    ('12,000.5 g', (12000.5, PARSE_PARTIAL)),
+    ('0,5', (None, PARSE_UNPARSED)),
+    ('1,2345', (None, PARSE_UNPARSED)),
+])
+def test_only_thousands_commas_are_dropped(value, expected):
+    assert parse_outcome_value(value) == expected
+
+
+def test_export_value_filter_compares_percent_and_ratio_alike(client):
+    response = client.post('/api/studies', json={
+        'name': 'Benzene inhalation', 'toxin_name': 'Benzene', 'contributor_email': 'a.b@example.edu',
+        'animal_models': [{'species': 'Rat', 'sex': 'male', 'dose_groups': [
+            {'dose_value': 10, 'dose_unit': 'ppm', 'group_size': 50, 'outcomes': [
+                {'outcome_type': 'mortality', 'value': '24%'},
+                {'outcome_type': 'mortality', 'value': '12/50'},
+                {'outcome_type': 'organ_weight', 'value': '0,5'},
+            ]},
+        ]}],
+    })
+    assert response.status_code == 201
+
+    rows = client.get('/export?value_min=0.2&value_max=0.3').get_data(as_text=True).splitlines()[1:]
+    assert sorted(row.split(',')[17] for row in rows) == ['12/50', '24%']
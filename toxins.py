@@ -0,0 +1,63 @@
+import threading
+from bisect import bisect_left
+
+from flask import current_app
+
+from models import db, Toxin, normalize_toxin_name
+
+
+class ToxinIndex:
+    """
+    Sorted in-process list of (name_key, name, id) for prefix suggestions.
+
+    Toxins are only ever added, so the highest toxin id identifies the
+    list: each lookup compares it (one primary-key probe) with the id the
+    list was built at and reloads when another request or worker has
+    created a toxin since. Prefix matches are then a bisect plus a slice.
+    """
+
+    def __init__(self):
+        self._snapshot = ([], [])  # (sorted keys, entries); swapped as a whole
+        self._built_at = None
+        self._lock = threading.Lock()
+
+    def suggest(self, prefix, limit=10):
+        self._refresh()
+        prefix = normalize_toxin_name(prefix)
+        keys, entries = self._snapshot
+        start = bisect_left(keys, prefix)
+        matches = []
+        for i in range(start, min(start + limit, len(keys))):
+            if not keys[i].startswith(prefix):
+                break
+            matches.append({'id': entries[i][2], 'name': entries[i][1]})
+        return matches
+
+    def _refresh(self):
+        latest = db.session.query(db.func.max(Toxin.id)).scalar()
+        if latest == self._built_at:
+            return
+        with self._lock:
+            # Sorted in Python: bisect needs code-point order, which a
+            # database collation does not guarantee
+            entries = sorted(db.session.query(Toxin.name_key, Toxin.name, Toxin.id))
+            self._snapshot = ([entry[0] for entry in entries], entries)
+            self._built_at = latest
+
+
+def find_toxin(name):
+    """Existing toxin with this name, ignoring case (uses the name_key index)."""
+    return (
+        Toxin.query
+        .filter(Toxin.name_key == normalize_toxin_name(name))
+        .order_by(Toxin.id)
+        .first()
+    )
+
+
+def init_toxin_index(app):
+    app.extensions['toxin_index'] = ToxinIndex()
+
+
+def toxin_index():
+    return current_app.extensions['toxin_index']
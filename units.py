@@ -0,0 +1,171 @@
+import re
+
+from models import db, Toxin, Study, AnimalModel, DoseGroup, Outcome
+from changes import studies_changed
+
+# Canonical dose unit: ppm (volume mixing ratio). Mixing ratios convert by a
+# fixed factor; mass concentrations convert through the toxin's molecular
+# weight at 25 °C and 1 atm (molar volume 24.45 L). Anything else
+# (e.g. mg/kg/day oral doses) has no ppm equivalent and stays NULL.
+CANONICAL_DOSE_UNIT = 'ppm'
+MOLAR_VOLUME_L = 24.45
+
+PPM_FACTORS = {
+    'ppm': 1.0,
+    'ppmv': 1.0,
+    'ppb': 1e-3,
+    'ppbv': 1e-3,
+    'ppt': 1e-6,
+}
+
+# Factor to mg/m3
+MASS_CONCENTRATION_FACTORS = {
+    'mg/m3': 1.0,
+    'mg/m³': 1.0,
+    'mg/m^3': 1.0,
+    'ug/m3': 1e-3,
+    'µg/m3': 1e-3,
+    'μg/m3': 1e-3,
+    'ug/m³': 1e-3,
+    'µg/m³': 1e-3,
+    'g/m3': 1e3,
+    'g/m³': 1e3,
+    'mg/l': 1e3,
+}
+
+# Outcome.value_parse_status values
+PARSE_EXACT = 'exact'          # the whole value is a number
+PARSE_PERCENT = 'percent'      # "24%"      → 0.24, on the same scale as ratios
+PARSE_RATIO = 'ratio'          # "12/50"    → 0.24
+PARSE_PARTIAL = 'partial'      # "12 tumours (lung)" → 12.0, first number in free text
+PARSE_UNPARSED = 'unparsed'    # no number found
+
+NUMBER = r'[-+]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?'
+EXACT_RE = re.compile(rf'^\s*({NUMBER})\s*$')
+PERCENT_RE = re.compile(rf'^\s*({NUMBER})\s*%\s*$')
+RATIO_RE = re.compile(rf'^\s*({NUMBER})\s*/\s*({NUMBER})\s*$')
+FIRST_NUMBER_RE = re.compile(NUMBER)
+# "1,250" or "12,000.5": commas grouping thousands, the only ones dropped
+THOUSANDS_RE = re.compile(r'(?<![\d,.])\d{1,3}(?:,\d{3})+(?![\d,])')
+# Any other comma between digits, e.g. the decimal comma in "0,5"
+DIGIT_COMMA_RE = re.compile(r'\d,\d')
+
+
+def dose_to_ppm(dose_value, dose_unit, custom_dose_unit=None, molecular_weight=None):
+    """Convert a dose to ppm, or return None if no conversion is possible."""
+    if dose_value is None:
+        return None
+
+    unit = custom_dose_unit if dose_unit == 'other' else dose_unit
+    unit = (unit or '').strip().lower().replace(' ', '')
+
+    if unit in PPM_FACTORS:
+        return dose_value * PPM_FACTORS[unit]
+    if unit in MASS_CONCENTRATION_FACTORS and molecular_weight:
+        mg_m3 = dose_value * MASS_CONCENTRATION_FACTORS[unit]
+        return mg_m3 * MOLAR_VOLUME_L / molecular_weight
+    return None
+
+
+def set_molecular_weight(toxin, molecular_weight):
+    """
+    Give an existing toxin a molecular weight and recompute dose_ppm of its
+    dose groups, in the caller's transaction. Mass concentrations
+    (mg/m3, …) only get a ppm value once the weight is known, so the
+    studies whose doses changed are passed to studies_changed.
+    """
+    toxin.molecular_weight = molecular_weight
+    rows = (
+        db.session.query(DoseGroup.id, DoseGroup.dose_value, DoseGroup.dose_unit, DoseGroup.custom_dose_unit,
+                         DoseGroup.dose_ppm, AnimalModel.study_id)
+        .join(AnimalModel, DoseGroup.animal_model_id == AnimalModel.id)
+        .join(Study, AnimalModel.study_id == Study.id)
+        .filter(Study.toxin_id == toxin.id)
+        .all()
+    )
+    updates, study_ids = [], set()
+    for dose_group_id, dose_value, dose_unit, custom_dose_unit, dose_ppm, study_id in rows:
+        new_ppm = dose_to_ppm(dose_value, dose_unit, custom_dose_unit, molecular_weight)
+        if new_ppm != dose_ppm:
+            updates.append({'id': dose_group_id, 'dose_ppm': new_ppm})
+            study_ids.add(study_id)
+    if updates:
+        db.session.bulk_update_mappings(DoseGroup, updates)
+        studies_changed(study_ids)
+
+
+def parse_outcome_value(value):
+    """
+    Parse a free-text outcome value into (number or None, parse status).
+    Percentages and ratios are both returned as fractions. Commas are only
+    read as thousands separators; a value with any other comma between
+    digits (a decimal comma, "0,5") is left unparsed rather than misread.
+    """
+    text = THOUSANDS_RE.sub(lambda match: match.group(0).replace(',', ''), value or '')
+    if DIGIT_COMMA_RE.search(text):
+        return None, PARSE_UNPARSED
+
+    match = EXACT_RE.match(text)
+    if match:
+        return float(match.group(1)), PARSE_EXACT
+
+    match = PERCENT_RE.match(text)
+    if match:
+        return float(match.group(1)) / 100.0, PARSE_PERCENT
+
+    match = RATIO_RE.match(text)
+    if match and float(match.group(2)) != 0:
+        return float(match.group(1)) / float(match.group(2)), PARSE_RATIO
+
+    match = FIRST_NUMBER_RE.search(text)
+    if match:
+        return float(match.group(0)), PARSE_PARTIAL
+
+    return None, PARSE_UNPARSED
+
+
+def backfill_normalized_values(batch_size=1000, progress=None):
+    """
+    Recompute DoseGroup.dose_ppm and Outcome.value_numeric /
+    value_parse_status for every row, one committed batch at a time.
+    Run after upgrading, or after setting a toxin's molecular weight.
+    """
+    updated = 0
+
+    doses = (
+        db.session.query(DoseGroup.id, DoseGroup.dose_value, DoseGroup.dose_unit,
+                         DoseGroup.custom_dose_unit, Toxin.molecular_weight)
+        .join(AnimalModel, DoseGroup.animal_model_id == AnimalModel.id)
+        .join(Study, AnimalModel.study_id == Study.id)
+        .join(Toxin, Study.toxin_id == Toxin.id)
+    )
+    updated += _update_in_batches(DoseGroup, doses, batch_size, progress, _dose_fields)
+
+    outcomes = db.session.query(Outcome.id, Outcome.value)
+    updated += _update_in_batches(Outcome, outcomes, batch_size, progress, _outcome_fields)
+    return updated
+
+
+def _dose_fields(row):
+    _, dose_value, dose_unit, custom_dose_unit, molecular_weight = row
+    return {'dose_ppm': dose_to_ppm(dose_value, dose_unit, custom_dose_unit, molecular_weight)}
+
+
+def _outcome_fields(row):
+    value_numeric, value_parse_status = parse_outcome_value(row[1])
+    return {'value_numeric': value_numeric, 'value_parse_status': value_parse_status}
+
+
+def _update_in_batches(model, query, batch_size, progress, compute):
+    last_id = 0
+    updated = 0
+    while True:
+        rows = query.filter(model.id > last_id).order_by(model.id).limit(batch_size).all()
+        if not rows:
+            return updated
+        db.session.bulk_update_mappings(model, [dict(compute(row), id=row[0]) for row in rows])
+        db.session.commit()
+        updated += len(rows)
+        last_id = rows[-1][0]
+        if progress:
+            progress(model.__tablename__, updated)
@@ -0,0 +1,24 @@
+import re
+
+# Constants for controlled vocabularies
+SEX_CHOICES = [('male', 'Male'), ('female', 'Female'), ('mixed', 'Mixed')]
+DOSE_UNIT_CHOICES = [('mg/m3', 'mg/m3'), ('ppm', 'ppm'), ('ppb', 'ppb'), ('other', 'Other')]
+OUTCOME_TYPE_CHOICES = [
+    ('cancer', 'Cancer Incidence'),
+    ('organ_weight', 'Organ Weight Change'),
+    ('mortality', 'Mortality'),
+    ('other', 'Other')
+]
+ROUTE_CHOICES = [
+    ('oral',        'Oral'),
+    ('inhalation',  'Inhalation'),
+    ('dermal',      'Dermal'),
+    ('intraperitoneal', 'Intraperitoneal'),
+    ('other',       'Other / Mixed')
+]
+
+# Contributor e-mail must be a university / work address (no gmail, yahoo, etc.)
+WORK_EMAIL_RE = re.compile(
+    r'^[\w\.\-]+@(?!(gmail|yahoo|outlook|hotmail|protonmail)\.)[\w\.\-]+\.[a-z]{2,}$',
+    re.I
+)